@@ -1,47 +1,209 @@
-import json
 import os
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, List, Callable, FrozenSet, Optional, Tuple
+from trace.shared_file import SharedJSONFile
 
-ADAPTER_CONFIG_PATH = os.path.join("data", "adapter_config.json")
+ADAPTER_CONFIG_PATH = os.getenv("ADAPTER_CONFIG_PATH", os.path.join("data", "adapter_config.json"))
 
-ADAPTERS: Dict[str, str] = {}
+# How often (seconds) a process re-stats the config file to pick up promotions
+# made by other workers. Applying adapters never reads the file directly.
+ADAPTER_REFRESH_INTERVAL_S = float(os.getenv("ADAPTER_REFRESH_INTERVAL_S", "0.01"))
 
-def load_adapters():
-    global ADAPTERS
-    if os.path.exists(ADAPTER_CONFIG_PATH):
-        with open(ADAPTER_CONFIG_PATH, 'r') as f:
-            ADAPTERS = json.load(f)
-    return ADAPTERS
+Transform = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+def _plan_renames(adapters: Dict[str, str], keys: FrozenSet[str]) -> Tuple[Tuple[str, str], ...]:
+    # Replays the adapters over the key set only, in the same order the
+    # row-wise implementation used, so chained renames resolve identically.
+    current = set(keys)
+    renames = []
+    for old_key, new_key in adapters.items():
+        if old_key in current and new_key not in current:
+            current.remove(old_key)
+            current.add(new_key)
+            renames.append((old_key, new_key))
+    return tuple(renames)
+
+def _compile_transform(adapters: Dict[str, str], keys: FrozenSet[str]) -> Optional[Transform]:
+    renames = _plan_renames(adapters, keys)
+
+    if not renames:
+        return None
+
+    if len(renames) == 1:
+        (old_key, new_key), = renames
+
+        def transform(tx: Dict[str, Any]) -> Dict[str, Any]:
+            adapted_tx = tx.copy()
+            adapted_tx[new_key] = adapted_tx.pop(old_key)
+            return adapted_tx
+
+        return transform
+
+    def transform(tx: Dict[str, Any]) -> Dict[str, Any]:
+        adapted_tx = tx.copy()
+        for old_key, new_key in renames:
+            adapted_tx[new_key] = adapted_tx.pop(old_key)
+        return adapted_tx
+
+    return transform
+
+class AdapterRegistry:
+    """Versioned adapter mapping shared between processes through one JSON file.
+
+    Writes go through a lock file and an atomic rename, bumping a monotonically
+    increasing version. Readers compare a cheap stat stamp at most once per
+    refresh interval and reload only when another process has published.
+    """
+
+    def __init__(self, path: str = ADAPTER_CONFIG_PATH, refresh_interval_s: float = ADAPTER_REFRESH_INTERVAL_S):
+        self.path = path
+        self.refresh_interval_s = refresh_interval_s
+        self.file = SharedJSONFile(path, refresh_interval_s, indent=2)
+        self.version = 0
+        self.adapters: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        # Compiled transforms for the current version, keyed by the input
+        # key-set fingerprint. None means that key set already conforms.
+        self._compiled_version = 0
+        self._compiled: Dict[FrozenSet[str], Optional[Transform]] = {}
+        self.load()
+
+    @staticmethod
+    def _parse(data: Optional[dict]) -> Tuple[int, Dict[str, str]]:
+        if data is None:
+            return 0, {}
+        # Files written before versioning hold the bare mapping
+        if "adapters" in data and "version" in data and isinstance(data["adapters"], dict):
+            return int(data["version"]), dict(data["adapters"])
+        return 0, dict(data)
+
+    def _install(self, version: int, adapters: Dict[str, str]):
+        self.version = version
+        self.adapters = adapters
+        self._compiled_version = version
+        self._compiled = {}
+
+    def load(self) -> Dict[str, str]:
+        with self.lock:
+            self._install(*self._parse(self.file.load()))
+            return self.adapters
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload if another process published a new version. Returns True if reloaded"""
+        if not self.file.stale(force):
+            return False
+        self.load()
+        return True
+
+    def _publish(self, update) -> Dict[str, str]:
+        with self.file.locked(), self.lock:
+            # Re-read under the lock so concurrent writers never
+            # lose each other's mappings or reuse a version.
+            disk_version, disk_adapters = self._parse(self.file.read())
+            version = max(disk_version, self.version) + 1
+            adapters = update(disk_adapters)
+            self.file.write({"version": version, "adapters": adapters})
+            self._install(version, adapters)
+            return adapters
 
-def save_adapters():
-    os.makedirs(os.path.dirname(ADAPTER_CONFIG_PATH), exist_ok=True)
-    with open(ADAPTER_CONFIG_PATH, 'w') as f:
-        json.dump(ADAPTERS, f, indent=2)
+    def set(self, mapping: Dict[str, str]) -> Dict[str, str]:
+        def update(current):
+            current.update(mapping)
+            return current
+        return self._publish(update)
+
+    def clear(self) -> Dict[str, str]:
+        # Publishes an empty mapping instead of deleting the file so the
+        # version keeps increasing and other processes see the rollback.
+        return self._publish(lambda current: {})
+
+    def get_transform(self, keys) -> Optional[Transform]:
+        fingerprint = keys if isinstance(keys, frozenset) else frozenset(keys)
+        compiled = self._compiled
+        try:
+            return compiled[fingerprint]
+        except KeyError:
+            transform = _compile_transform(self.adapters, fingerprint)
+            compiled[fingerprint] = transform
+            return transform
+
+    def get_status(self) -> dict:
+        return {
+            "version": self.version,
+            "adapters": self.adapters.copy(),
+            "compiled_version": self._compiled_version,
+            "compiled_schemas": len(self._compiled)
+        }
+
+_registry: Optional[AdapterRegistry] = None
+
+def get_registry() -> AdapterRegistry:
+    global _registry
+    if _registry is None:
+        _registry = AdapterRegistry()
+    return _registry
+
+def load_adapters():
+    return get_registry().load()
 
 def set_adapter(mapping: Dict[str, str]):
-    global ADAPTERS
-    ADAPTERS.update(mapping)
-    save_adapters()
+    get_registry().set(mapping)
 
 def clear_adapters():
-    global ADAPTERS
-    ADAPTERS = {}
-    if os.path.exists(ADAPTER_CONFIG_PATH):
-        os.remove(ADAPTER_CONFIG_PATH)
+    get_registry().clear()
+
+def get_adapter_version() -> int:
+    registry = get_registry()
+    registry.refresh()
+    return registry.version
+
+def get_transform(keys) -> Optional[Transform]:
+    """Return the compiled transform for a key set, or None if it already conforms"""
+    registry = get_registry()
+    registry.refresh()
+    return registry.get_transform(keys)
 
 def apply_adapters(tx: Dict[str, Any]) -> Dict[str, Any]:
-    if not ADAPTERS:
+    registry = get_registry()
+    registry.refresh()
+    if not registry.adapters:
         return tx
-    
-    adapted_tx = tx.copy()
-    for old_key, new_key in ADAPTERS.items():
-        if old_key in adapted_tx and new_key not in adapted_tx:
-            adapted_tx[new_key] = adapted_tx.pop(old_key)
-    
-    return adapted_tx
 
-def get_adapters() -> Dict[str, str]:
-    return ADAPTERS.copy()
+    transform = registry.get_transform(frozenset(tx))
+    if transform is None:
+        return tx
+
+    return transform(tx)
+
+def apply_adapters_batch(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Apply adapters to a list of row events, resolving each schema once"""
+    registry = get_registry()
+    registry.refresh()
+    if not registry.adapters:
+        return events
+
+    adapted = []
+    for tx in events:
+        transform = registry.get_transform(frozenset(tx))
+        adapted.append(tx if transform is None else transform(tx))
+    return adapted
 
-load_adapters()
+def apply_adapters_columnar(batch: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+    """Apply adapters to a columnar batch (column name -> values) in one rename per column"""
+    registry = get_registry()
+    registry.refresh()
+    if not registry.adapters:
+        return batch
+
+    transform = registry.get_transform(frozenset(batch))
+    if transform is None:
+        return batch
+
+    return transform(batch)
+
+def get_adapters() -> Dict[str, str]:
+    registry = get_registry()
+    registry.refresh()
+    return registry.adapters.copy()
 
+get_registry()
@@ -0,0 +1,270 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from .adapters import apply_adapters_batch
+from .tools import evaluate_event
+from integrations.clickhouse import MOCK_STORE_ID, get_client, get_events_after, insert_audit_results
+
+CHECKPOINT_PATH = os.getenv("CONSUMER_CHECKPOINT_PATH", os.path.join("data", "consumer_checkpoint.json"))
+
+# A micro-batch is flushed when it reaches BATCH_SIZE events or its oldest
+# event has waited MAX_BATCH_WAIT_S, whichever comes first
+BATCH_SIZE = 500
+MAX_BATCH_WAIT_S = 1.0
+
+POLL_INTERVAL_S = 0.2
+FETCH_LIMIT = 5000
+
+# Failed audit writes are retried with exponential backoff up to this delay
+MAX_RETRY_BACKOFF_S = 30.0
+
+def audit_events(events: List[dict], use_adapters: bool = True) -> List[dict]:
+    """Run the Auditor's evaluation over a batch and build audit_results rows"""
+    adapted = apply_adapters_batch(events) if use_adapters else events
+    now = datetime.now()
+    rows = []
+
+    for evt in adapted:
+        try:
+            result = evaluate_event(evt)
+            is_anomaly = result["flag"]
+            reason = result["reason"]
+        except Exception as e:
+            is_anomaly = True
+            reason = f"Audit error: {type(e).__name__}: {e}"
+
+        rows.append({
+            "timestamp": now,
+            "event_id": f"evt_{evt.get('LineId', 0)}_{int(evt.get('timestamp', now.timestamp()) * 1000)}",
+            "line_id": evt.get("LineId", 0),
+            "component": evt.get("Component", "unknown"),
+            "level": evt.get("Level", evt.get("level", "")),
+            "is_anomaly": is_anomaly,
+            "reason": reason,
+            "latency_ms": evt.get("latency_ms", 0),
+            "status": evt.get("status", 200)
+        })
+
+    return rows
+
+class StreamConsumer:
+    """Tails ingested events by (ts, key) cursor and audits them in micro-batches.
+
+    The key is the store's tiebreak between events with the same timestamp,
+    so the checkpoint (watermark, watermark_key) names exactly the last event
+    audited and ties are neither skipped nor audited twice. It is only
+    advanced after a batch's audit results have been written. While writes
+    fail, flushes back off exponentially and no more is fetched once a full
+    batch is buffered, so the buffer stays bounded.
+    """
+
+    def __init__(self, checkpoint_path: str = CHECKPOINT_PATH, batch_size: int = BATCH_SIZE,
+                 max_batch_wait_s: float = MAX_BATCH_WAIT_S, poll_interval_s: float = POLL_INTERVAL_S,
+                 use_adapters: bool = True):
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.max_batch_wait_s = max_batch_wait_s
+        self.poll_interval_s = poll_interval_s
+        self.use_adapters = use_adapters
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+
+        self.watermark = 0.0
+        self.watermark_key: Optional[int] = None
+        self.total_processed = 0
+        self.total_batches = 0
+        self.total_anomalies = 0
+        self.total_audit_errors = 0
+        self.write_failures = 0
+        self.consecutive_failures = 0
+        self.last_batch_latency_ms = 0.0
+        self.last_event_ts: Optional[float] = None
+        self.started_at: Optional[float] = None
+        self.session_processed = 0
+
+        # Fetch cursor and events fetched but not yet flushed
+        self._buffer: List[Dict] = []
+        self._buffer_since: Optional[float] = None
+        self._cursor = 0.0
+        self._cursor_key: Optional[int] = None
+        self._retry_at = 0.0
+
+        self.load_checkpoint()
+
+    @staticmethod
+    def _cursor_scope() -> Optional[str]:
+        # Mock events and their keys are gone after a restart, so a cursor
+        # into them is only valid in the process that saved it
+        return f"mock:{MOCK_STORE_ID}" if get_client().use_mock else None
+
+    def load_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, 'r') as f:
+                data = json.load(f)
+            if data.get("scope") == self._cursor_scope():
+                self.watermark = float(data.get("watermark", 0.0))
+                self.watermark_key = data.get("watermark_key")
+            self.total_processed = int(data.get("total_processed", 0))
+        self._cursor = self.watermark
+        self._cursor_key = self.watermark_key
+        self._buffer = []
+        self._buffer_since = None
+
+    def save_checkpoint(self):
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                "watermark": self.watermark,
+                "watermark_key": self.watermark_key,
+                "scope": self._cursor_scope(),
+                "total_processed": self.total_processed,
+                "updated_at": time.time()
+            }, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _fetch(self, limit: int = FETCH_LIMIT) -> int:
+        rows = get_events_after(self._cursor, self._cursor_key, limit)
+        if not rows:
+            return 0
+
+        self._buffer.extend({"ts": row["ts"], "key": row["key"], "event": json.loads(row["payload"])}
+                            for row in rows)
+        self._cursor, self._cursor_key = rows[-1]["ts"], rows[-1]["key"]
+        if self._buffer_since is None:
+            self._buffer_since = time.monotonic()
+        return len(rows)
+
+    def _backing_off(self) -> bool:
+        return self.consecutive_failures > 0 and time.monotonic() < self._retry_at
+
+    def _should_flush(self) -> bool:
+        if not self._buffer:
+            return False
+        if len(self._buffer) >= self.batch_size:
+            return True
+        return time.monotonic() - self._buffer_since >= self.max_batch_wait_s
+
+    def _flush(self, limit: Optional[int] = None) -> int:
+        batch = self._buffer[:limit or self.batch_size]
+        if not batch:
+            return 0
+
+        t0 = time.perf_counter()
+        rows = audit_events([item["event"] for item in batch], self.use_adapters)
+        if not insert_audit_results(rows):
+            with self.lock:
+                self.write_failures += 1
+                self.consecutive_failures += 1
+                delay = min(self.poll_interval_s * 2 ** self.consecutive_failures, MAX_RETRY_BACKOFF_S)
+                self._retry_at = time.monotonic() + delay
+            return 0
+
+        # Advance the committed watermark to the last event of this batch
+        last_ts = batch[-1]["ts"]
+
+        with self.lock:
+            self.consecutive_failures = 0
+            self._buffer = self._buffer[len(batch):]
+            self._buffer_since = time.monotonic() if self._buffer else None
+            self.watermark = last_ts
+            self.watermark_key = batch[-1]["key"]
+            self.total_processed += len(batch)
+            self.session_processed += len(batch)
+            self.total_batches += 1
+            self.total_anomalies += sum(1 for r in rows if r["is_anomaly"])
+            self.total_audit_errors += sum(1 for r in rows if r["reason"].startswith("Audit error"))
+            self.last_batch_latency_ms = (time.perf_counter() - t0) * 1000
+            self.last_event_ts = last_ts
+
+        self.save_checkpoint()
+        return len(batch)
+
+    def poll_once(self, force_flush: bool = False) -> int:
+        """Fetch new events and flush every due micro-batch. Returns events audited"""
+        # While writes fail, fetch no more than tops the buffer up to one batch
+        # and retry no sooner than the backoff allows
+        if not self.consecutive_failures:
+            self._fetch()
+        elif len(self._buffer) < self.batch_size:
+            self._fetch(self.batch_size - len(self._buffer))
+        if self._backing_off():
+            return 0
+        processed = 0
+        while self._buffer and (force_flush or self._should_flush()):
+            flushed = self._flush()
+            if not flushed:
+                break
+            processed += flushed
+        return processed
+
+    def _run_loop(self):
+        while self.running:
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"[WARN] Stream consumer poll failed: {e}")
+            time.sleep(self.poll_interval_s)
+
+        # Drain what was already fetched so a clean stop loses nothing
+        try:
+            self.poll_once(force_flush=True)
+        except Exception:
+            pass
+
+    def start(self):
+        if self.running:
+            return
+
+        self.started_at = time.monotonic()
+        self.session_processed = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._run_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=5.0)
+            self.thread = None
+
+    def get_status(self) -> dict:
+        with self.lock:
+            elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+            lag_s = time.time() - self.last_event_ts if self.last_event_ts else None
+            return {
+                "running": self.running,
+                "watermark": self.watermark,
+                "total_processed": self.total_processed,
+                "total_batches": self.total_batches,
+                "total_anomalies": self.total_anomalies,
+                "audit_errors": self.total_audit_errors,
+                "write_failures": self.write_failures,
+                "consecutive_failures": self.consecutive_failures,
+                "retry_in_s": max(0.0, self._retry_at - time.monotonic()) if self.consecutive_failures else 0.0,
+                "buffered": len(self._buffer),
+                "throughput_eps": self.session_processed / elapsed if elapsed > 0 else 0.0,
+                "lag_s": lag_s,
+                "last_batch_latency_ms": self.last_batch_latency_ms
+            }
+
+_consumer: Optional[StreamConsumer] = None
+
+def get_consumer() -> StreamConsumer:
+    global _consumer
+    if _consumer is None:
+        _consumer = StreamConsumer()
+    return _consumer
+
+def start_consumer():
+    get_consumer().start()
+
+def stop_consumer():
+    get_consumer().stop()
+
+def get_consumer_status() -> dict:
+    return get_consumer().get_status()
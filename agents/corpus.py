@@ -0,0 +1,253 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from trace.quantiles import QuantileSketch
+
+CORPUS_PATH = os.getenv("CANARY_CORPUS_PATH", os.path.join("data", "canary_corpus.jsonl"))
+CORPUS_TOOL = "fetch_log_events"
+REPLAY_WORKERS = int(os.getenv("CANARY_REPLAY_WORKERS", "4"))
+
+class StaleCorpusIndex(ValueError):
+    """The offset index was not built for the corpus file it sits next to"""
+
+def _index_path(corpus_path: str) -> str:
+    return corpus_path + ".idx"
+
+def _events_from_jsonl(paths: Iterable[str], tool_name: str) -> Iterator[dict]:
+    for path in paths:
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                evt = json.loads(line)
+                if evt.get("type") == "tool" and evt.get("tool") == tool_name:
+                    yield evt
+
+def build_corpus(corpus_path: str = CORPUS_PATH, run_ids: Optional[List[str]] = None,
+                 jsonl_paths: Optional[List[str]] = None, tool_name: str = CORPUS_TOOL,
+                 limit: Optional[int] = None, dedupe: bool = True) -> dict:
+    """Extract recorded tool outputs into a compact JSONL corpus with a byte-offset index.
+
+    Reads from the given trace JSONL files, or from the trace store when no
+    files are given. Returns the index that was written next to the corpus.
+    Both files are written aside and renamed into place, and the index
+    records the corpus size and digest it was built for, so a reader never
+    seeks a new corpus with an old index.
+    """
+    if jsonl_paths:
+        tool_events = _events_from_jsonl(jsonl_paths, tool_name)
+    else:
+        from trace.store import iter_tool_events
+        tool_events = iter_tool_events(tool_name, run_ids)
+
+    os.makedirs(os.path.dirname(corpus_path) or ".", exist_ok=True)
+    tmp_path = corpus_path + ".tmp"
+
+    offsets = []
+    digest_all = hashlib.sha1()
+    seen = set()
+    source_runs = set()
+    offset = 0
+
+    with open(tmp_path, 'wb') as f:
+        for tool_evt in tool_events:
+            output = tool_evt.get("output")
+            if not isinstance(output, list):
+                continue
+            written = len(offsets)
+            for evt in output:
+                if not isinstance(evt, dict):
+                    continue
+                line = json.dumps(evt, separators=(",", ":"), sort_keys=True).encode() + b"\n"
+                if dedupe:
+                    digest = hashlib.sha1(line).digest()
+                    if digest in seen:
+                        continue
+                    seen.add(digest)
+                f.write(line)
+                digest_all.update(line)
+                offsets.append(offset)
+                offset += len(line)
+                if limit is not None and len(offsets) >= limit:
+                    break
+            if len(offsets) > written:
+                source_runs.add(tool_evt.get("run_id"))
+            if limit is not None and len(offsets) >= limit:
+                break
+
+    index = {
+        "version": 2,
+        "tool": tool_name,
+        "count": len(offsets),
+        "corpus_size": offset,
+        "corpus_sha1": digest_all.hexdigest(),
+        "source_runs": len(source_runs),
+        "created_at": time.time(),
+        "offsets": offsets
+    }
+    index_tmp_path = _index_path(corpus_path) + ".tmp"
+    with open(index_tmp_path, 'w') as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp_path, corpus_path)
+    os.replace(index_tmp_path, _index_path(corpus_path))
+
+    return index
+
+def load_corpus_index(corpus_path: str = CORPUS_PATH) -> dict:
+    with open(_index_path(corpus_path), 'r') as f:
+        return json.load(f)
+
+def read_corpus(corpus_path: str = CORPUS_PATH, start: int = 0, end: Optional[int] = None,
+                index: Optional[dict] = None) -> List[dict]:
+    """Read events [start, end) from the corpus by seeking to their indexed offsets.
+
+    Raises StaleCorpusIndex when the index was built for a different corpus
+    file. An index loaded here is reloaded once first, in case a rebuild
+    replaced the corpus between the two reads.
+    """
+    reload = index is None
+    if index is None:
+        index = load_corpus_index(corpus_path)
+    offsets = index["offsets"]
+    stop = len(offsets) if end is None else min(end, len(offsets))
+    if start >= stop:
+        return []
+
+    events = []
+    with open(corpus_path, 'rb') as f:
+        # Version 1 indexes predate corpus_size and are taken as they are
+        size = os.fstat(f.fileno()).st_size
+        if reload and size != index.get("corpus_size", size):
+            return read_corpus(corpus_path, start, end, load_corpus_index(corpus_path))
+        if size != index.get("corpus_size", size):
+            raise StaleCorpusIndex(f"Index of {corpus_path} is for a {index['corpus_size']}-byte corpus, "
+                                   f"the file has {size} bytes; rebuild it")
+        f.seek(offsets[start])
+        for _ in range(stop - start):
+            events.append(json.loads(f.readline()))
+    return events
+
+def corpus_available(corpus_path: str = CORPUS_PATH) -> bool:
+    return os.path.exists(corpus_path) and os.path.exists(_index_path(corpus_path))
+
+def _replay_shard(corpus_path: str, start: int, end: int, use_adapters: bool) -> dict:
+    from .canary import run_pipeline_on_batch, MAX_P95_LATENCY_MS
+
+    events = read_corpus(corpus_path, start, end)
+    results = run_pipeline_on_batch(events, use_adapters)
+
+    sketch = QuantileSketch()
+    sketch.extend(r["latency_ms"] for r in results)
+    errors = [r for r in results if not r["success"]]
+
+    return {
+        "start": start,
+        "evaluated": len(results),
+        "errors": len(errors),
+        "slow": sum(1 for r in results if r["latency_ms"] > MAX_P95_LATENCY_MS),
+        "first_error": errors[0]["error"] if errors else None,
+        "sketch": sketch.to_dict()
+    }
+
+def replay_canary(run_id: str, corpus_path: str = CORPUS_PATH, N: Optional[int] = None,
+                  workers: Optional[int] = None, use_adapters: bool = True) -> Dict:
+    """Replay the first N corpus events through the canary, sharded across worker processes"""
+    from .canary import MAX_ERROR_RATE, MAX_P95_LATENCY_MS
+
+    index = load_corpus_index(corpus_path)
+    total_events = index["count"] if N is None else min(N, index["count"])
+    workers = max(1, workers or REPLAY_WORKERS)
+
+    if total_events == 0:
+        return {
+            "total": 0,
+            "errors": 0,
+            "error_rate": 0.0,
+            "latency_p95_ms": 0.0,
+            "passed": False,
+            "reason": "No events to test"
+        }
+
+    shard_size = -(-total_events // workers)
+    shards = [(start, min(start + shard_size, total_events)) for start in range(0, total_events, shard_size)]
+
+    t0 = time.time()
+    if len(shards) == 1:
+        shard_results = [_replay_shard(corpus_path, shards[0][0], shards[0][1], use_adapters)]
+    else:
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            futures = [pool.submit(_replay_shard, corpus_path, start, end, use_adapters) for start, end in shards]
+            shard_results = [f.result() for f in futures]
+
+    # Shards are merged in corpus order so the result is independent of scheduling
+    latency_sketch = QuantileSketch()
+    errors = 0
+    evaluated = 0
+    first_error = None
+    for shard in sorted(shard_results, key=lambda r: r["start"]):
+        latency_sketch.merge(QuantileSketch.from_dict(shard["sketch"]))
+        errors += shard["errors"]
+        evaluated += shard["evaluated"]
+        first_error = first_error or shard["first_error"]
+
+    error_rate = errors / evaluated if evaluated > 0 else 0.0
+    latency_p95_ms = latency_sketch.quantile(0.95)
+    passed = error_rate <= MAX_ERROR_RATE and latency_p95_ms <= MAX_P95_LATENCY_MS
+
+    reason = "All checks passed"
+    if error_rate > MAX_ERROR_RATE:
+        reason = f"Error rate {error_rate:.2%} exceeds threshold {MAX_ERROR_RATE:.2%}"
+    elif latency_p95_ms > MAX_P95_LATENCY_MS:
+        reason = f"P95 latency {latency_p95_ms:.0f}ms exceeds threshold {MAX_P95_LATENCY_MS}ms"
+
+    return {
+        "total": evaluated,
+        "requested": total_events,
+        "errors": errors,
+        "error_rate": error_rate,
+        "latency_p95_ms": latency_p95_ms,
+        "latency_p50_ms": latency_sketch.quantile(0.50),
+        "latency_p99_ms": latency_sketch.quantile(0.99),
+        "passed": passed,
+        "reason": reason,
+        "first_error": first_error,
+        "shards": len(shards),
+        "replay_time_s": time.time() - t0,
+        "source": corpus_path,
+        "run_id": run_id
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or replay the offline canary corpus")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Extract recorded tool outputs into a corpus")
+    build.add_argument("--out", default=CORPUS_PATH)
+    build.add_argument("--run", action="append", dest="run_ids", help="Only include this run (repeatable)")
+    build.add_argument("--jsonl", action="append", dest="jsonl_paths", help="Read from a trace JSONL file instead of the store")
+    build.add_argument("--tool", default=CORPUS_TOOL)
+    build.add_argument("--limit", type=int)
+
+    replay = sub.add_parser("replay", help="Replay the corpus through the canary")
+    replay.add_argument("--corpus", default=CORPUS_PATH)
+    replay.add_argument("-N", type=int)
+    replay.add_argument("--workers", type=int)
+    replay.add_argument("--no-adapters", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = build_corpus(args.out, args.run_ids, args.jsonl_paths, args.tool, args.limit)
+        print(f"[OK] Wrote {index['count']} events from {index['source_runs']} run(s) to {args.out}")
+    else:
+        result = replay_canary("corpus_replay", args.corpus, args.N, args.workers, not args.no_adapters)
+        print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
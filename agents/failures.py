@@ -1,4 +1,8 @@
+import math
 import random
+import multiprocessing
+import time
+from typing import Dict, List, Optional, Union
 
 SCHEMA_DRIFT = False
 TOOL_AMBIGUITY = False
@@ -6,19 +10,216 @@ CURRENCY_MIX = False
 
 FAILURE_SEED = 42
 
+# Order of the flags in the shared array used by process workers
+_FLAG_NAMES = ("schema_drift", "tool_ambiguity", "currency_mix")
+
+LATENCY_DISTRIBUTIONS = ("none", "fixed", "lognormal")
+
+class InjectedFault(RuntimeError):
+    """Raised by a tool call that a fault profile decided to fail"""
+
+class FaultProfile:
+    """Latency, error and drift faults applied to tool calls.
+
+    Latency is drawn from the distribution ("fixed" at latency_ms, or
+    "lognormal" with median latency_ms and shape latency_sigma), plus
+    spike_ms with probability spike_probability for a heavy tail. Each call
+    fails with error_probability, drift_ratio of returned events get
+    Level renamed to level, and slow_source_ms is added once per batch read
+    from a source.
+    """
+
+    # Numeric fields, in the order they are mirrored to process workers
+    FIELDS = ("latency_ms", "latency_sigma", "spike_probability", "spike_ms",
+              "error_probability", "drift_ratio", "slow_source_ms")
+
+    def __init__(self, name: str = "custom", latency_distribution: str = "none", latency_ms: float = 0.0,
+                 latency_sigma: float = 0.5, spike_probability: float = 0.0, spike_ms: float = 0.0,
+                 error_probability: float = 0.0, drift_ratio: float = 0.0, slow_source_ms: float = 0.0):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Invalid latency distribution: {latency_distribution}")
+        for field, value in (("spike_probability", spike_probability), ("error_probability", error_probability),
+                             ("drift_ratio", drift_ratio)):
+            if not 0.0 <= value <= 1.0:
+                raise ValueError(f"{field} must be between 0 and 1, got {value}")
+        for field, value in (("latency_ms", latency_ms), ("latency_sigma", latency_sigma),
+                             ("spike_ms", spike_ms), ("slow_source_ms", slow_source_ms)):
+            if value < 0:
+                raise ValueError(f"{field} must not be negative, got {value}")
+
+        self.name = name
+        self.latency_distribution = latency_distribution
+        self.latency_ms = float(latency_ms)
+        self.latency_sigma = float(latency_sigma)
+        self.spike_probability = float(spike_probability)
+        self.spike_ms = float(spike_ms)
+        self.error_probability = float(error_probability)
+        self.drift_ratio = float(drift_ratio)
+        self.slow_source_ms = float(slow_source_ms)
+
+    @property
+    def active(self) -> bool:
+        return (self.latency_distribution != "none" or self.spike_probability > 0
+                or self.error_probability > 0 or self.drift_ratio > 0 or self.slow_source_ms > 0)
+
+    def sample_latency_ms(self, rng: random.Random = None) -> float:
+        rng = rng or _rng
+        if self.latency_distribution == "fixed":
+            latency = self.latency_ms
+        elif self.latency_distribution == "lognormal":
+            latency = rng.lognormvariate(math.log(max(self.latency_ms, 1e-3)), self.latency_sigma)
+        else:
+            latency = 0.0
+        if self.spike_probability > 0 and rng.random() < self.spike_probability:
+            latency += self.spike_ms
+        return latency
+
+    def should_fail(self, rng: random.Random = None) -> bool:
+        return self.error_probability > 0 and (rng or _rng).random() < self.error_probability
+
+    def to_dict(self) -> dict:
+        data = {"name": self.name, "latency_distribution": self.latency_distribution}
+        data.update({field: getattr(self, field) for field in self.FIELDS})
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FaultProfile":
+        unknown = set(data) - set(cls.FIELDS) - {"name", "latency_distribution"}
+        if unknown:
+            raise ValueError(f"Unknown fault profile fields: {sorted(unknown)}")
+        return cls(**data)
+
+FAULT_PROFILES = {
+    "none": FaultProfile("none"),
+    "fixed_latency": FaultProfile("fixed_latency", "fixed", latency_ms=200),
+    "lognormal_latency": FaultProfile("lognormal_latency", "lognormal", latency_ms=50, latency_sigma=0.8),
+    "tail_spikes": FaultProfile("tail_spikes", "fixed", latency_ms=20, spike_probability=0.02, spike_ms=1500),
+    "flaky_tool": FaultProfile("flaky_tool", error_probability=0.05),
+    "partial_drift": FaultProfile("partial_drift", drift_ratio=0.2),
+    "slow_source": FaultProfile("slow_source", slow_source_ms=500)
+}
+
+_NO_FAULTS = FAULT_PROFILES["none"]
+
+# Active profiles keyed by (run_id, tool); None matches any run or tool
+_PROFILES: Dict[tuple, FaultProfile] = {}
+
+_rng = random.Random(FAILURE_SEED)
+
+# Shared-memory copy of the flags and the global fault profile. Set in the
+# parent by share_failure_state() and in worker processes by
+# attach_failure_state(); None otherwise.
+_SHARED_FLAGS = None
+_ATTACHED = False
+
+def _shared_values() -> List[float]:
+    profile = _PROFILES.get((None, None), _NO_FAULTS)
+    return ([float(SCHEMA_DRIFT), float(TOOL_AMBIGUITY), float(CURRENCY_MIX),
+             float(LATENCY_DISTRIBUTIONS.index(profile.latency_distribution))]
+            + [getattr(profile, field) for field in FaultProfile.FIELDS])
+
+def _sync_shared():
+    if _SHARED_FLAGS is not None and not _ATTACHED:
+        _SHARED_FLAGS[:] = _shared_values()
+
 def inject_drift(enabled: bool):
     global SCHEMA_DRIFT
     SCHEMA_DRIFT = enabled
+    _sync_shared()
 
 def inject_tool_ambiguity(enabled: bool):
     global TOOL_AMBIGUITY
     TOOL_AMBIGUITY = enabled
+    _sync_shared()
 
 def inject_currency_mix(enabled: bool):
     global CURRENCY_MIX
     CURRENCY_MIX = enabled
+    _sync_shared()
+
+def set_fault_profile(profile: Union[str, dict, FaultProfile, None], tool: Optional[str] = None,
+                      run_id: Optional[str] = None) -> Optional[FaultProfile]:
+    """Activate a fault profile (by name, as a dict, or an instance) for a run and/or tool.
+
+    With neither run_id nor tool the profile applies globally. None removes
+    the profile for that scope.
+    """
+    key = (run_id, tool)
+    if profile is None:
+        _PROFILES.pop(key, None)
+        _sync_shared()
+        return None
+
+    if isinstance(profile, str):
+        if profile not in FAULT_PROFILES:
+            raise ValueError(f"Unknown fault profile: {profile}")
+        profile = FAULT_PROFILES[profile]
+    elif isinstance(profile, dict):
+        profile = FaultProfile.from_dict(profile)
+
+    _PROFILES[key] = profile
+    _sync_shared()
+    return profile
+
+def clear_fault_profiles():
+    _PROFILES.clear()
+    _sync_shared()
+
+def get_fault_profile(tool: Optional[str] = None, run_id: Optional[str] = None) -> FaultProfile:
+    """Most specific active profile: run and tool, then run, then tool, then global"""
+    if _ATTACHED:
+        # Worker processes only see the global profile, through shared memory
+        values = list(_SHARED_FLAGS[len(_FLAG_NAMES):])
+        return FaultProfile("shared", LATENCY_DISTRIBUTIONS[int(values[0])],
+                            **dict(zip(FaultProfile.FIELDS, values[1:])))
+    for key in ((run_id, tool), (run_id, None), (None, tool), (None, None)):
+        if key in _PROFILES:
+            return _PROFILES[key]
+    return _NO_FAULTS
+
+def get_fault_profiles() -> List[dict]:
+    return [dict(profile.to_dict(), run_id=run_id, tool=tool) for (run_id, tool), profile in _PROFILES.items()]
+
+def apply_tool_faults(tool: str, run_id: Optional[str] = None) -> FaultProfile:
+    """Sleep for the injected latency and raise InjectedFault if this call should fail"""
+    profile = get_fault_profile(tool, run_id)
+    if not profile.active:
+        return profile
+
+    latency_ms = profile.sample_latency_ms()
+    if latency_ms > 0:
+        time.sleep(latency_ms / 1000)
+    if profile.should_fail():
+        raise InjectedFault(f"Injected fault in {tool} ({profile.name})")
+    return profile
+
+def apply_partial_drift(events: list, ratio: float, rng: random.Random = None) -> list:
+    """Rename Level -> level on roughly `ratio` of the events, in place"""
+    if ratio <= 0:
+        return events
+    rng = rng or _rng
+    for evt in events:
+        if isinstance(evt, dict) and "Level" in evt and (ratio >= 1.0 or rng.random() < ratio):
+            evt["level"] = evt.pop("Level")
+    return events
+
+def share_failure_state():
+    """Return a shared-memory array mirroring the flags and global profile, kept in sync by inject_*"""
+    global _SHARED_FLAGS
+    if _SHARED_FLAGS is None:
+        _SHARED_FLAGS = multiprocessing.Array('d', len(_FLAG_NAMES) + 1 + len(FaultProfile.FIELDS), lock=False)
+    _sync_shared()
+    return _SHARED_FLAGS
+
+def attach_failure_state(shared_flags):
+    """Read flags from the parent's shared array (called inside worker processes)"""
+    global _SHARED_FLAGS, _ATTACHED
+    _SHARED_FLAGS = shared_flags
+    _ATTACHED = True
 
 def get_failure_state() -> dict:
+    if _ATTACHED:
+        return {name: bool(_SHARED_FLAGS[i]) for i, name in enumerate(_FLAG_NAMES)}
     return {
         "schema_drift": SCHEMA_DRIFT,
         "tool_ambiguity": TOOL_AMBIGUITY,
@@ -26,4 +227,3 @@ def get_failure_state() -> dict:
     }
 
 random.seed(FAILURE_SEED)
-
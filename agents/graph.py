@@ -1,11 +1,17 @@
 from trace.sdk import trace_step, trace_error
 from trace.store import save_metric, append_event
+from trace.quantiles import QuantileSketch
+from trace.schema_index import get_schema_index
 from .tools import fetch_log_events, evaluate_event
+from .failures import apply_tool_faults, apply_partial_drift, InjectedFault
 import time
 
 def trace_tool_call(run_id, tool_name, args, fn):
     t0 = time.time()
+    profile = apply_tool_faults(tool_name, run_id)
     output = fn()
+    if profile.drift_ratio > 0 and isinstance(output, list):
+        apply_partial_drift(output, profile.drift_ratio)
     evt = {
         "ts": time.time(),
         "run_id": run_id,
@@ -25,25 +31,34 @@ def intake_agent(run_id, mode):
 @trace_step("Retriever")
 def retriever_agent(run_id, mode):
     flaky = (mode == "flaky")
-    events = trace_tool_call(
-        run_id, 
-        "fetch_log_events", 
-        [flaky], 
-        lambda: fetch_log_events(flaky=flaky)
-    )
+    try:
+        events = trace_tool_call(
+            run_id, 
+            "fetch_log_events", 
+            [flaky], 
+            lambda: fetch_log_events(flaky=flaky)
+        )
+    except InjectedFault as e:
+        trace_error(run_id, str(e), {
+            "agent": "Retriever",
+            "tool": "fetch_log_events"
+        })
+        return {"events": [], "count": 0, "error": str(e)}
     return {"events": events, "count": len(events)}
 
 @trace_step("Auditor")
 def auditor_agent(run_id, events, use_adapters=True):
-    from .adapters import apply_adapters
+    from .adapters import apply_adapters_batch
     
     if use_adapters:
-        events = [apply_adapters(evt) for evt in events]
+        events = apply_adapters_batch(events)
     
     results = []
     error_occurred = False
+    latency_sketch = QuantileSketch()
     
     for evt in events:
+        latency_sketch.add(max(evt.get("latency_ms", 0) or 0, 0))
         try:
             result = trace_tool_call(
                 run_id,
@@ -68,9 +83,17 @@ def auditor_agent(run_id, events, use_adapters=True):
                 "error": str(e)
             })
     
+    summary = {
+        "evaluated": len(results),
+        "flagged": sum(1 for r in results if r.get("flagged")),
+        "errors": sum(1 for r in results if "error" in r)
+    }
+    summary.update(latency_sketch.summary())
+    
     return {
         "results": results,
-        "error_occurred": error_occurred
+        "error_occurred": error_occurred,
+        "summary": summary
     }
 
 def run_pipeline(run_id, mode: str, use_adapters: bool = True) -> dict:
@@ -78,6 +101,18 @@ def run_pipeline(run_id, mode: str, use_adapters: bool = True) -> dict:
     
     retriever_result = retriever_agent(run_id, mode)
     
+    if retriever_result.get("error"):
+        status = "failed"
+        fail_reason = "Tool failure in Retriever agent"
+        save_metric(run_id, "status", status)
+        save_metric(run_id, "fail_reason", fail_reason)
+        
+        return {
+            "status": status,
+            "fail_reason": fail_reason,
+            "counts": {"events": 0, "flagged": 0, "errors": 1}
+        }
+    
     auditor_result = auditor_agent(run_id, retriever_result["events"], use_adapters=use_adapters)
     
     if auditor_result["error_occurred"]:
@@ -99,6 +134,14 @@ def run_pipeline(run_id, mode: str, use_adapters: bool = True) -> dict:
     status = "ok"
     save_metric(run_id, "status", status)
     
+    # Successful output becomes known-good schema for drift detection. Items
+    # that only passed because an adapter rewrote them are not learned.
+    events = retriever_result["events"]
+    if use_adapters:
+        from .adapters import get_transform
+        events = [evt for evt in events if get_transform(evt.keys()) is None]
+    get_schema_index().learn("fetch_log_events", events)
+    
     return {
         "status": status,
         "fail_reason": None,
@@ -1,87 +1,263 @@
+import multiprocessing
 import threading
 import time
-import random
-from typing import Optional
-from .tools import COMPONENTS, LEVELS, ENDPOINTS
-from .failures import get_failure_state
-from integrations.clickhouse import insert_event
+from typing import Optional, List
+from .synthetic import NovaLogGenerator
+from .failures import get_failure_state, get_fault_profile, share_failure_state, attach_failure_state
+from integrations.clickhouse import insert_events
+
+# Largest batch generated and inserted per loop iteration
+MAX_BATCH_SIZE = 1000
+
+# Cap on accumulated tokens (seconds of traffic) so a stalled insert does not
+# turn into an unbounded burst once the backend recovers
+MAX_BURST_S = 1.0
+
+# Longest single sleep, so stop() is honoured promptly at low rates
+MAX_SLEEP_S = 0.05
+
+# Upper bound on how long stop() waits for all workers before terminating them
+SHUTDOWN_TIMEOUT_S = 2.0
+
+WORKER_MODES = ("thread", "process")
+
+# Fraction of events given a 5xx status while currency_mix is injected
+CURRENCY_MIX_RATIO = 0.3
+
+# Tool name fault profiles can target to slow down or drift the producer
+SOURCE_TOOL = "stream_producer"
+
+# Per-worker counters, stored flat as [events, batches, insert_errors] * workers
+_STAT_FIELDS = ("events", "batches", "insert_errors")
+
+def _pace(get_rate, should_stop, produce, max_batch_size: int):
+    # Token bucket on the wall clock: time spent generating and inserting
+    # accrues tokens too, so the achieved rate does not drift below target.
+    tokens = 1.0
+    last = time.monotonic()
+    
+    while not should_stop():
+        rate = max(get_rate(), 1e-6)
+        now = time.monotonic()
+        tokens = min(tokens + (now - last) * rate, max(rate * MAX_BURST_S, 1.0))
+        last = now
+        
+        if tokens < 1.0:
+            time.sleep(min((1.0 - tokens) / rate, MAX_SLEEP_S))
+            continue
+        
+        count = min(int(tokens), max_batch_size)
+        tokens -= count
+        produce(count)
+
+def _produce(producer: "StreamProducer", generator, counters, base: int, count: int):
+    events = producer._generate_batch(count, generator)
+    ok = producer._emit_batch(events)
+    counters[base] += count
+    counters[base + 1] += 1
+    if not ok:
+        counters[base + 2] += 1
+
+def _process_worker(worker_id: int, workers: int, rate, stop_event, counters, failure_flags,
+                    max_batch_size: int, seed: Optional[int]):
+    # Failure flags toggled in the parent are read through shared memory
+    attach_failure_state(failure_flags)
+    producer = StreamProducer(max_batch_size=max_batch_size, seed=seed)
+    generator = producer._make_generator(worker_id)
+    base = worker_id * len(_STAT_FIELDS)
+    _pace(lambda: rate.value / workers, stop_event.is_set,
+          lambda count: _produce(producer, generator, counters, base, count), max_batch_size)
 
 class StreamProducer:
-    def __init__(self, events_per_second: float = 2.0):
-        self.events_per_second = events_per_second
+    """Synthetic log producer split across one or more paced workers.
+
+    The target rate is divided evenly among `workers`, which run as threads
+    or, with mode="process", as separate processes sharing the rate, a stop
+    event, the failure flags and their counters through shared memory.
+    Process workers insert through their own client, so in mock mode their
+    events stay in the worker's memory; use them against a real backend.
+    """
+    
+    def __init__(self, events_per_second: float = 2.0, max_batch_size: int = MAX_BATCH_SIZE,
+                 workers: int = 1, mode: str = "thread", seed: Optional[int] = None):
+        if mode not in WORKER_MODES:
+            raise ValueError(f"Invalid worker mode: {mode}")
+        self._rate = multiprocessing.RawValue('d', events_per_second)
+        self.max_batch_size = max_batch_size
+        self.workers = max(1, int(workers))
+        self.mode = mode
+        # None draws fresh entropy; set a seed to make a run reproducible
+        self.seed = seed
+        self._generator: Optional[NovaLogGenerator] = None
         self.running = False
-        self.thread: Optional[threading.Thread] = None
-        self.total_events = 0
+        self._handles: List = []
+        self._stop_event = None
+        self._counters = [0] * (self.workers * len(_STAT_FIELDS))
+        # Totals from previous start()/stop() sessions
+        self._previous = [0] * len(_STAT_FIELDS)
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self.unclean_shutdowns = 0
         self.lock = threading.Lock()
     
-    def _generate_log_event(self) -> dict:
-        failure_state = get_failure_state()
-        
-        latency_ms = random.randint(100, 500)
-        level = random.choice(LEVELS)
-        component = random.choice(COMPONENTS)
-        endpoint = random.choice(ENDPOINTS)
-        status = 200 if level != "ERROR" else random.choice([500, 503, 404])
-        
-        evt = {
-            "LineId": random.randint(1000, 9999),
-            "Date": "2017-05-16",
-            "Time": f"00:00:{random.randint(10,59):02d}.{random.randint(0,999):03d}",
-            "Pid": random.randint(2000, 30000),
-            "Level": level,
-            "Component": component,
-            "Content": f'"GET {endpoint} HTTP/1.1" status: {status} len: {random.randint(500,3000)} time: 0.{latency_ms}',
-            "latency_ms": latency_ms,
-            "status": status,
-            "timestamp": time.time()
-        }
-        
-        if failure_state["schema_drift"]:
-            evt["level"] = evt.pop("Level")
+    @property
+    def events_per_second(self) -> float:
+        return self._rate.value
+    
+    @events_per_second.setter
+    def events_per_second(self, value: float):
+        # Workers re-read the shared rate every iteration
+        self._rate.value = float(value)
+    
+    def _make_generator(self, worker_id: int = 0) -> NovaLogGenerator:
+        # One generator per worker: independent streams, no shared RNG state
+        return NovaLogGenerator(seed=self.seed, stream=worker_id)
+    
+    def configure(self, workers: Optional[int] = None, mode: Optional[str] = None):
+        """Change the worker count or mode; the producer must be stopped"""
+        if self.running:
+            raise RuntimeError("Stop the producer before changing its workers")
+        if mode is not None and mode not in WORKER_MODES:
+            raise ValueError(f"Invalid worker mode: {mode}")
         
-        if failure_state["currency_mix"] and random.random() < 0.3:
-            evt["status"] = random.choice([500, 503, 504])
+        with self.lock:
+            self._previous = [prev + cur for prev, cur in zip(self._previous, self._session_totals())]
+            if workers is not None:
+                self.workers = max(1, int(workers))
+            if mode is not None:
+                self.mode = mode
+            self._counters = [0] * (self.workers * len(_STAT_FIELDS))
+    
+    def _generate_batch(self, count: int, generator: Optional[NovaLogGenerator] = None) -> list:
+        if generator is None:
+            if self._generator is None:
+                self._generator = self._make_generator()
+            generator = self._generator
         
-        return evt
+        failure_state = get_failure_state()
+        profile = get_fault_profile(SOURCE_TOOL)
+        generator.drift_ratio = 1.0 if failure_state["schema_drift"] else profile.drift_ratio
+        generator.status_mix_ratio = CURRENCY_MIX_RATIO if failure_state["currency_mix"] else 0.0
+        if profile.slow_source_ms > 0:
+            time.sleep(profile.slow_source_ms / 1000)
+        return generator.generate(count)
     
-    def _emit_to_clickhouse(self, evt: dict):
+    def _emit_batch(self, events: list) -> bool:
         try:
-            insert_event(evt)
+            return insert_events(events)
         except Exception:
-            pass
+            return False
     
-    def _run_loop(self):
-        interval = 1.0 / self.events_per_second
-        
-        while self.running:
-            evt = self._generate_log_event()
-            self._emit_to_clickhouse(evt)
-            
-            with self.lock:
-                self.total_events += 1
-            
-            time.sleep(interval)
+    def _thread_worker(self, worker_id: int, counters, stop_event):
+        generator = self._make_generator(worker_id)
+        base = worker_id * len(_STAT_FIELDS)
+        _pace(lambda: self.events_per_second / self.workers, stop_event.is_set,
+              lambda count: _produce(self, generator, counters, base, count), self.max_batch_size)
     
     def start(self):
         if self.running:
             return
         
+        size = self.workers * len(_STAT_FIELDS)
+        with self.lock:
+            # Fold the previous session into the lifetime totals
+            self._previous = [prev + cur for prev, cur in zip(self._previous, self._session_totals())]
+            if self.mode == "process":
+                self._counters = multiprocessing.RawArray('q', size)
+                self._stop_event = multiprocessing.Event()
+            else:
+                self._counters = [0] * size
+                self._stop_event = threading.Event()
+            self.started_at = time.monotonic()
+            self.stopped_at = None
+        
         self.running = True
-        self.thread = threading.Thread(target=self._run_loop, daemon=True)
-        self.thread.start()
+        self._handles = []
+        for worker_id in range(self.workers):
+            if self.mode == "process":
+                handle = multiprocessing.Process(
+                    target=_process_worker,
+                    args=(worker_id, self.workers, self._rate, self._stop_event,
+                          self._counters, share_failure_state(), self.max_batch_size, self.seed),
+                    daemon=True
+                )
+            else:
+                handle = threading.Thread(
+                    target=self._thread_worker,
+                    args=(worker_id, self._counters, self._stop_event),
+                    daemon=True
+                )
+            handle.start()
+            self._handles.append(handle)
     
-    def stop(self):
+    def stop(self, timeout: float = SHUTDOWN_TIMEOUT_S):
+        """Signal all workers and wait at most `timeout` seconds in total"""
+        if self._stop_event is not None:
+            self._stop_event.set()
+        
+        deadline = time.monotonic() + timeout
+        for handle in self._handles:
+            handle.join(timeout=max(0.0, deadline - time.monotonic()))
+        
+        for handle in self._handles:
+            if handle.is_alive():
+                self.unclean_shutdowns += 1
+                if self.mode == "process":
+                    handle.terminate()
+                    handle.join(timeout=0.1)
+        
+        with self.lock:
+            if self.started_at is not None and self.stopped_at is None:
+                self.stopped_at = time.monotonic()
+        
         self.running = False
-        if self.thread:
-            self.thread.join(timeout=2.0)
-            self.thread = None
+        self._handles = []
+    
+    def _worker_stats(self) -> List[List[int]]:
+        counters = list(self._counters)
+        width = len(_STAT_FIELDS)
+        return [counters[i * width:(i + 1) * width] for i in range(self.workers)]
+    
+    def _session_totals(self) -> List[int]:
+        return [sum(column) for column in zip(*self._worker_stats())]
     
     def get_status(self) -> dict:
         with self.lock:
+            elapsed = 0.0
+            if self.started_at is not None:
+                elapsed = (self.stopped_at or time.monotonic()) - self.started_at
+            
+            per_worker = self._worker_stats()
+            session = [sum(column) for column in zip(*per_worker)]
+            events, batches, insert_errors = [prev + cur for prev, cur in zip(self._previous, session)]
+            target = self.events_per_second
+            achieved = session[0] / elapsed if elapsed > 0 else 0.0
+            worker_target = target / self.workers
+            
             return {
                 "running": self.running,
-                "total_events": self.total_events,
-                "events_per_second": self.events_per_second,
+                "mode": self.mode,
+                "worker_count": self.workers,
+                "total_events": events,
+                "total_batches": batches,
+                "insert_errors": insert_errors,
+                "events_per_second": target,
+                "target_events_per_second": target,
+                "achieved_events_per_second": achieved,
+                "rate_ratio": achieved / target if target > 0 else 0.0,
+                "elapsed_s": elapsed,
+                "unclean_shutdowns": self.unclean_shutdowns,
+                "workers": [
+                    {
+                        "worker": worker_id,
+                        "events": stats[0],
+                        "batches": stats[1],
+                        "insert_errors": stats[2],
+                        "target_events_per_second": worker_target,
+                        "achieved_events_per_second": stats[0] / elapsed if elapsed > 0 else 0.0
+                    }
+                    for worker_id, stats in enumerate(per_worker)
+                ],
                 "failure_modes": get_failure_state()
             }
 
@@ -93,8 +269,12 @@ def get_producer() -> StreamProducer:
         _producer = StreamProducer()
     return _producer
 
-def start_stream(events_per_second: float = 2.0):
+def start_stream(events_per_second: float = 2.0, workers: Optional[int] = None, mode: Optional[str] = None):
     producer = get_producer()
+    reconfigure = (workers is not None and workers != producer.workers) or (mode is not None and mode != producer.mode)
+    if reconfigure:
+        producer.stop()
+        producer.configure(workers, mode)
     producer.events_per_second = events_per_second
     producer.start()
 
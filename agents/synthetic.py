@@ -0,0 +1,182 @@
+import argparse
+import csv
+import json
+import os
+import time
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .tools import COMPONENTS, LEVELS, ENDPOINTS
+
+SYNTH_SEED = int(os.getenv("SYNTH_SEED", "42"))
+
+ERROR_STATUSES = np.array([500, 503, 404])
+# Statuses swapped in by status mixing (the producer's currency_mix mode)
+MIXED_STATUSES = np.array([500, 503, 504])
+ANOMALY_STATUSES = np.array([500, 503, 504])
+ANOMALY_LATENCY_MS = (800, 3000)
+
+CSV_FIELDS = ["LineId", "Date", "Time", "Pid", "Level", "Component", "Content", "latency_ms", "status", "timestamp"]
+
+_ERROR_LEVEL = LEVELS.index("ERROR")
+
+class NovaLogGenerator:
+    """Seeded, vectorized generator of LogHub/Nova-shaped events.
+
+    Every field is drawn for a whole batch at once with NumPy, and events are
+    only materialized as dicts when asked for. The same (seed, stream) pair
+    yields the same events in any process, so parallel workers pass their
+    worker id as `stream` to get independent but reproducible sequences.
+
+    drift_ratio renames Level -> level on that fraction of events,
+    status_mix_ratio swaps in a 5xx status without changing the level, and
+    anomaly_rate turns events into ERRORs with a 5xx status and a latency
+    spike. The `anomaly` column records which events were injected.
+    """
+
+    def __init__(self, seed: Optional[int] = SYNTH_SEED, stream: int = 0, drift_ratio: float = 0.0,
+                 status_mix_ratio: float = 0.0, anomaly_rate: float = 0.0,
+                 start_ts: Optional[float] = None, interval_s: float = 0.001):
+        self.seed = seed
+        self.stream = stream
+        self.rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(stream,)))
+        self.drift_ratio = drift_ratio
+        self.status_mix_ratio = status_mix_ratio
+        self.anomaly_rate = anomaly_rate
+        # With start_ts set, timestamps advance by interval_s per event and are
+        # reproducible; otherwise each batch is stamped with the current time
+        self.next_ts = start_ts
+        self.interval_s = interval_s
+        self.generated = 0
+
+    def generate_columns(self, count: int) -> Dict[str, np.ndarray]:
+        """Draw one columnar batch of `count` events"""
+        rng = self.rng
+
+        level = rng.integers(0, len(LEVELS), count)
+        latency_ms = rng.integers(100, 501, count)
+        status = np.where(level == _ERROR_LEVEL, rng.choice(ERROR_STATUSES, count), 200)
+
+        anomaly = rng.random(count) < self.anomaly_rate if self.anomaly_rate > 0 else np.zeros(count, dtype=bool)
+        if anomaly.any():
+            n = int(anomaly.sum())
+            level[anomaly] = _ERROR_LEVEL
+            status[anomaly] = rng.choice(ANOMALY_STATUSES, n)
+            latency_ms[anomaly] = rng.integers(ANOMALY_LATENCY_MS[0], ANOMALY_LATENCY_MS[1] + 1, n)
+
+        if self.status_mix_ratio > 0:
+            mixed = rng.random(count) < self.status_mix_ratio
+            status[mixed] = rng.choice(MIXED_STATUSES, int(mixed.sum()))
+
+        if self.drift_ratio >= 1.0:
+            drifted = np.ones(count, dtype=bool)
+        elif self.drift_ratio > 0:
+            drifted = rng.random(count) < self.drift_ratio
+        else:
+            drifted = np.zeros(count, dtype=bool)
+
+        if self.next_ts is None:
+            timestamp = np.full(count, time.time())
+        else:
+            timestamp = self.next_ts + np.arange(count) * self.interval_s
+            self.next_ts += count * self.interval_s
+
+        self.generated += count
+        return {
+            "line_id": rng.integers(1000, 10000, count),
+            "pid": rng.integers(2000, 30001, count),
+            "level": level,
+            "component": rng.integers(0, len(COMPONENTS), count),
+            "endpoint": rng.integers(0, len(ENDPOINTS), count),
+            "latency_ms": latency_ms,
+            "status": status,
+            "length": rng.integers(500, 3001, count),
+            "second": rng.integers(10, 60, count),
+            "millisecond": rng.integers(0, 1000, count),
+            "timestamp": timestamp,
+            "drifted": drifted,
+            "anomaly": anomaly
+        }
+
+    def to_events(self, columns: Dict[str, np.ndarray]) -> List[dict]:
+        """Materialize a columnar batch as event dicts"""
+        events = []
+        # tolist() once per column; indexing NumPy scalars per event is far slower
+        rows = zip(
+            columns["line_id"].tolist(), columns["pid"].tolist(), columns["level"].tolist(),
+            columns["component"].tolist(), columns["endpoint"].tolist(), columns["latency_ms"].tolist(),
+            columns["status"].tolist(), columns["length"].tolist(), columns["second"].tolist(),
+            columns["millisecond"].tolist(), columns["timestamp"].tolist(), columns["drifted"].tolist()
+        )
+        for line_id, pid, level, component, endpoint, latency_ms, status, length, second, ms, ts, drifted in rows:
+            events.append({
+                "LineId": line_id,
+                "Date": "2017-05-16",
+                "Time": f"00:00:{second:02d}.{ms:03d}",
+                "Pid": pid,
+                "level" if drifted else "Level": LEVELS[level],
+                "Component": COMPONENTS[component],
+                "Content": f'"GET {ENDPOINTS[endpoint]} HTTP/1.1" status: {status} len: {length} time: {latency_ms / 1000:.3f}',
+                "latency_ms": latency_ms,
+                "status": status,
+                "timestamp": ts
+            })
+        return events
+
+    def generate(self, count: int) -> List[dict]:
+        return self.to_events(self.generate_columns(count))
+
+    def iter_batches(self, total: int, batch_size: int = 10000) -> Iterator[Dict[str, np.ndarray]]:
+        remaining = total
+        while remaining > 0:
+            count = min(batch_size, remaining)
+            remaining -= count
+            yield self.generate_columns(count)
+
+    def write_jsonl(self, path: str, total: int, batch_size: int = 10000) -> int:
+        with open(path, 'w') as f:
+            for columns in self.iter_batches(total, batch_size):
+                f.write("\n".join(json.dumps(evt) for evt in self.to_events(columns)))
+                f.write("\n")
+        return total
+
+    def write_csv(self, path: str, total: int, batch_size: int = 10000) -> int:
+        """Write the LogHub structured-CSV layout. Drift renames a key, so it does not apply here"""
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_FIELDS)
+            for columns in self.iter_batches(total, batch_size):
+                writer.writerows(
+                    [evt.get("Level", evt.get("level")) if field == "Level" else evt[field] for field in CSV_FIELDS]
+                    for evt in self.to_events(columns)
+                )
+        return total
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic Nova log events")
+    parser.add_argument("-n", "--count", type=int, default=100000)
+    parser.add_argument("--out", help="Output path; omit to only measure generation throughput")
+    parser.add_argument("--format", choices=("jsonl", "csv"), default="jsonl")
+    parser.add_argument("--seed", type=int, default=SYNTH_SEED)
+    parser.add_argument("--drift", type=float, default=0.0, help="Fraction of events with Level renamed to level")
+    parser.add_argument("--anomaly-rate", type=float, default=0.0)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    generator = NovaLogGenerator(seed=args.seed, drift_ratio=args.drift, anomaly_rate=args.anomaly_rate,
+                                 start_ts=time.time())
+    t0 = time.perf_counter()
+    if args.out is None:
+        for columns in generator.iter_batches(args.count, args.batch_size):
+            generator.to_events(columns)
+    elif args.format == "csv":
+        generator.write_csv(args.out, args.count, args.batch_size)
+    else:
+        generator.write_jsonl(args.out, args.count, args.batch_size)
+    elapsed = time.perf_counter() - t0
+
+    print(f"[OK] {args.count} events in {elapsed:.2f}s ({args.count / elapsed:,.0f} events/s)")
+
+if __name__ == "__main__":
+    main()
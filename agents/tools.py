@@ -1,32 +1,20 @@
-import random
-import time
-
 COMPONENTS = ["nova.compute.manager", "nova.osapi_compute.wsgi.server", "nova.virt.libvirt.imagecache", 
               "nova.scheduler.manager", "nova.network.manager"]
 LEVELS = ["INFO", "WARNING", "ERROR"]
 ENDPOINTS = ["/v2/servers/detail", "/v2/servers", "/v2/images", "/v2/flavors", "/v2/os-hypervisors"]
 
+_generator = None
+
 def fetch_log_events(flaky=False, count=3):
-    events = []
-    for i in range(count):
-        latency_ms = random.randint(100, 500)
-        level = random.choice(LEVELS)
-        component = random.choice(COMPONENTS)
-        endpoint = random.choice(ENDPOINTS)
-        status = 200 if level != "ERROR" else random.choice([500, 503, 404])
-        
-        evt = {
-            "LineId": random.randint(1000, 9999),
-            "Date": "2017-05-16",
-            "Time": f"00:00:{random.randint(10,59):02d}.{random.randint(0,999):03d}",
-            "Pid": random.randint(2000, 30000),
-            "Level": level,
-            "Component": component,
-            "Content": f'"GET {endpoint} HTTP/1.1" status: {status} len: {random.randint(500,3000)} time: 0.{latency_ms}',
-            "latency_ms": latency_ms,
-            "status": status
-        }
-        events.append(evt)
+    global _generator
+    if _generator is None:
+        from .synthetic import NovaLogGenerator
+        _generator = NovaLogGenerator()
+    
+    events = _generator.generate(count)
+    for evt in events:
+        # Tool output carries the LogHub fields only
+        del evt["timestamp"]
     
     if flaky:
         for evt in events:
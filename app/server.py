@@ -5,16 +5,26 @@ import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from trace.store import start_run, list_runs, get_run, load_events
+from trace.store import start_run, list_runs, get_run, load_events, get_timings
 from agents.graph import run_pipeline
 from agents.stream import start_stream, stop_stream, get_stream_status
-from agents.failures import inject_drift, inject_tool_ambiguity, inject_currency_mix, get_failure_state
+from agents.consumer import start_consumer, stop_consumer, get_consumer_status
+from agents.failures import (inject_drift, inject_tool_ambiguity, inject_currency_mix, get_failure_state,
+                             set_fault_profile, get_fault_profile, get_fault_profiles, FAULT_PROFILES)
 from agents.adapters import get_adapters, clear_adapters
-from cta.analyze import cta_analyze
+from cta.analyze import get_cached_analysis
+from integrations.llm import get_llm_client
+from cta.triage import triage_failed_runs
+from cta.online import ONLINE_ENABLED, enable_online_analysis, get_online_analyzer, get_online_candidate
+from cta.jobs import submit_analysis, get_job_status, get_job_queue, QueueFull, PRIORITY_NORMAL
 from cta.actions import apply_patch, canary_run_wrapper, promote_or_rollback, save_signature
 
 app = Flask(__name__)
 
+# Diagnose runs as their events are traced instead of after the fact
+if ONLINE_ENABLED:
+    enable_online_analysis()
+
 @app.route('/')
 def index():
     runs = list_runs()
@@ -44,17 +54,32 @@ def view_run(run_id):
     return render_template('run_view.html', run=run, events=events, 
                          step_count=len(step_events), total_latency=total_latency)
 
+def _submit_cta_job(run):
+    return submit_analysis(run['id'], run.get('fail_reason', 'Unknown failure'),
+                           priority=request.args.get('priority', PRIORITY_NORMAL, type=int),
+                           refresh=request.args.get('refresh') == '1')
+
+def _job_accepted(job):
+    """202 for a job still running, pointing at where to poll it"""
+    return jsonify({"job": job, "status_url": url_for('cta_job_status', job_id=job["id"])}), 202
+
+def _render_cta_job(job):
+    if job["status"] == "done":
+        return render_template('cta_panel.html', report=job["report"], run_id=job["run_id"])
+    return render_template('cta_job.html', job=job)
+
 @app.route('/run/<run_id>/cta', methods=['POST'])
 def analyze_run(run_id):
     run = get_run(run_id)
     if not run:
         return "Run not found", 404
     
-    failure_text = run.get('fail_reason', 'Unknown failure')
-    
-    report = cta_analyze(run_id, failure_text)
+    try:
+        job = _submit_cta_job(run)
+    except QueueFull as e:
+        return str(e), 503
     
-    return render_template('cta_panel.html', report=report, run_id=run_id)
+    return _render_cta_job(job)
 
 @app.route('/run/<run_id>/cta.json')
 def get_cta_json(run_id):
@@ -63,10 +88,86 @@ def get_cta_json(run_id):
         return jsonify({"error": "Run not found"}), 404
     
     failure_text = run.get('fail_reason', 'Unknown failure')
-    report = cta_analyze(run_id, failure_text)
+    report = None if request.args.get('refresh') == '1' else get_cached_analysis(run_id, failure_text)
+    if report is not None:
+        return jsonify(report)
     
+    # Not analyzed yet: queue it and let the client poll the job
+    try:
+        job = _submit_cta_job(run)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    if job["status"] == "done":
+        return jsonify(job["report"])
+    return _job_accepted(job)
+
+@app.route('/run/<run_id>/timings')
+def get_run_timings(run_id):
+    if not get_run(run_id):
+        return jsonify({"error": "Run not found"}), 404
+    return jsonify(get_timings(run_id, request.args.get('phase')))
+
+@app.route('/run/<run_id>/cta/profile', methods=['POST'])
+def profile_run_analysis(run_id):
+    """Queue a fresh analysis with a profiler attached; its timings land on the job's report"""
+    run = get_run(run_id)
+    if not run:
+        return jsonify({"error": "Run not found"}), 404
+    try:
+        job = submit_analysis(run_id, run.get('fail_reason', 'Unknown failure'),
+                              priority=request.args.get('priority', PRIORITY_NORMAL, type=int),
+                              profile=request.args.get('mode', 'cprofile'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503
+    return _job_accepted(job)
+
+@app.route('/cta/jobs/<job_id>')
+def cta_job_status(job_id):
+    job = get_job_status(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/cta/jobs/<job_id>/panel')
+def cta_job_panel(job_id):
+    job = get_job_status(job_id)
+    if not job:
+        return "Job not found", 404
+    return _render_cta_job(job)
+
+@app.route('/cta/queue/status')
+def cta_queue_status():
+    return jsonify(get_job_queue().get_status())
+
+@app.route('/cta/triage', methods=['POST'])
+def cta_triage():
+    """Analyze failed runs in bulk, one analysis per incident cluster"""
+    body = request.get_json(silent=True) or {}
+    result = triage_failed_runs(body.get("run_ids"), body.get("limit"),
+                                use_cache=not body.get("refresh", False))
+    return jsonify(result)
+
+@app.route('/run/<run_id>/cta/online')
+def get_online_report(run_id):
+    """The current heuristic candidate for a run, maintained as its events are appended"""
+    run = get_run(run_id)
+    if not run:
+        return jsonify({"error": "Run not found"}), 404
+    report = get_online_candidate(run_id, run.get('fail_reason') or 'Unknown failure')
+    if report is None:
+        return jsonify({"error": "Run is not tracked by the online analyzer"}), 404
     return jsonify(report)
 
+@app.route('/cta/online/status')
+def cta_online_status():
+    return jsonify(get_online_analyzer().get_status())
+
+@app.route('/cta/llm/status')
+def cta_llm_status():
+    return jsonify(get_llm_client().get_status())
+
 @app.route('/run/<run_id>/apply_fix', methods=['POST'])
 def apply_fix(run_id):
     run = get_run(run_id)
@@ -75,7 +176,16 @@ def apply_fix(run_id):
     
     failure_text = run.get('fail_reason', 'Unknown failure')
     
-    report = cta_analyze(run_id, failure_text)
+    # Without a stored report, queue the analysis and let the client retry once it is done
+    report = get_cached_analysis(run_id, failure_text)
+    if report is None:
+        try:
+            job = submit_analysis(run_id, failure_text)
+        except QueueFull as e:
+            return jsonify({"error": str(e)}), 503
+        if job["status"] != "done":
+            return _job_accepted(job)
+        report = job["report"]
     
     patch_result = apply_patch(run_id, report)
     
@@ -118,9 +228,15 @@ def apply_fix(run_id):
 
 @app.route('/stream/start', methods=['POST'])
 def start_stream_endpoint():
-    events_per_second = request.json.get('events_per_second', 2.0) if request.is_json else 2.0
-    start_stream(events_per_second)
-    return jsonify({"status": "started", "events_per_second": events_per_second})
+    body = request.json if request.is_json else {}
+    events_per_second = body.get('events_per_second', 2.0)
+    workers = body.get('workers')
+    mode = body.get('mode')
+    try:
+        start_stream(events_per_second, workers=workers, mode=mode)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"status": "started", "events_per_second": events_per_second, "stream": get_stream_status()})
 
 @app.route('/stream/stop', methods=['POST'])
 def stop_stream_endpoint():
@@ -131,11 +247,46 @@ def stop_stream_endpoint():
 def stream_status():
     return jsonify(get_stream_status())
 
+@app.route('/consumer/start', methods=['POST'])
+def start_consumer_endpoint():
+    start_consumer()
+    return jsonify({"status": "started", "consumer": get_consumer_status()})
+
+@app.route('/consumer/stop', methods=['POST'])
+def stop_consumer_endpoint():
+    stop_consumer()
+    return jsonify({"status": "stopped", "consumer": get_consumer_status()})
+
+@app.route('/consumer/status')
+def consumer_status():
+    return jsonify(get_consumer_status())
+
 @app.route('/inject_drift', methods=['POST'])
 def toggle_drift():
-    enabled = request.json.get('enabled', True) if request.is_json else True
-    inject_drift(enabled)
-    return jsonify({"drift_enabled": enabled, "failure_modes": get_failure_state()})
+    data = request.json if request.is_json else {}
+    enabled = data.get('enabled', True)
+    ratio = data.get('ratio')
+    if ratio is not None:
+        try:
+            ratio = float(ratio)
+        except (TypeError, ValueError):
+            return jsonify({"error": f"ratio must be a number, got {ratio!r}"}), 400
+    if ratio is not None and ratio < 1.0:
+        # Partial drift: only a fraction of events lose their Level key. The
+        # ratio is folded into the global fault profile, keeping its other faults
+        profile = get_fault_profile().to_dict()
+        if profile["name"] == "none":
+            profile["name"] = "partial_drift"
+        profile["drift_ratio"] = ratio if enabled else 0.0
+        try:
+            set_fault_profile(profile)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        inject_drift(False)
+    else:
+        inject_drift(enabled)
+    return jsonify({"drift_enabled": enabled, "drift_ratio": ratio if ratio is not None else float(enabled),
+                    "failure_modes": get_failure_state()})
 
 @app.route('/inject_tool_ambiguity', methods=['POST'])
 def toggle_tool_ambiguity():
@@ -149,9 +300,22 @@ def toggle_currency_mix():
     inject_currency_mix(enabled)
     return jsonify({"currency_mix_enabled": enabled, "failure_modes": get_failure_state()})
 
+@app.route('/inject_profile', methods=['POST'])
+def inject_profile():
+    """Select a fault profile by name or as explicit fields, optionally scoped to a run or tool"""
+    data = request.json if request.is_json else {}
+    profile = data.get('profile', 'none')
+    if not data.get('enabled', True) or profile == 'none':
+        profile = None
+    try:
+        set_fault_profile(profile, tool=data.get('tool'), run_id=data.get('run_id'))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"fault_profiles": get_fault_profiles(), "available": sorted(FAULT_PROFILES)})
+
 @app.route('/failure_modes')
 def failure_modes():
-    return jsonify(get_failure_state())
+    return jsonify(dict(get_failure_state(), fault_profiles=get_fault_profiles()))
 
 @app.route('/adapters')
 def adapters():
@@ -1,21 +1,31 @@
 import json
+import os
 import re
 import time
-import hashlib
 from typing import Dict, List, Optional
 from agents.adapters import set_adapter, clear_adapters
 from agents.canary import canary_run as canary_run_base
-from integrations.clickhouse import insert_signature, find_similar_signature, write_cta_result
+from integrations.clickhouse import insert_signature, get_signatures, write_cta_result
 from integrations.datadog import (
     send_error_rate_metric, send_latency_metric, send_mttr_metric,
     send_incident_metric, send_canary_metric, send_before_after_comparison,
     send_custom_metric, is_enabled
 )
-from trace.store import save_metric, get_run
+from trace.store import save_metric, get_run, save_timings
+from cta.signature_index import get_signature_index, migrate_unsuffixed
+from cta.signatures import EMBEDDING_DIM, incident_embedding
+from cta.timing import SpanTimer, profile_mode_for
 
 MAX_ERROR_RATE = 0.01
 MAX_P95_LATENCY_MS = 500
 
+# Mirror signatures to ClickHouse and seed the local index from it on first use
+SIGNATURE_CLICKHOUSE_SYNC = os.getenv("SIGNATURE_CLICKHOUSE_SYNC", "true").lower() == "true"
+SIGNATURE_MATCH_THRESHOLD = 0.85
+
+_signatures_synced = False
+_legacy_migrated = False
+
 def _parse_adapter_from_report(report: dict) -> Dict[str, str]:
     tool_schema_patch = report.get("proposed_fix", {}).get("tool_schema_patch", "")
     
@@ -134,40 +144,41 @@ def promote_or_rollback(canary_result: dict, thresholds: dict = None, run_id: st
         }
 
 def _create_simple_embedding(events: List[dict]) -> List[float]:
-    field_names = set()
-    event_types = []
-    
-    for event in events:
-        event_types.append(event.get("type", ""))
-        
-        if event.get("type") == "error":
-            context = event.get("context", {})
-            if isinstance(context, dict):
-                tx = context.get("tx", {})
-                if isinstance(tx, dict):
-                    field_names.update(tx.keys())
-        
-        if event.get("type") == "tool":
-            output = event.get("output", [])
-            if isinstance(output, list) and len(output) > 0:
-                if isinstance(output[0], dict):
-                    field_names.update(output[0].keys())
-    
-    signature_string = ",".join(sorted(field_names)) + "|" + ",".join(event_types[:10])
-    
-    hash_bytes = hashlib.sha256(signature_string.encode()).digest()
-    
-    embedding = []
-    for i in range(32):
-        byte_val = hash_bytes[i % len(hash_bytes)]
-        embedding.append(float(byte_val) / 255.0)
+    return incident_embedding(events)
+
+def _reembed_signature(record: dict) -> Optional[List[float]]:
+    """Current embedding of the run a legacy signature was saved from, if it is still recorded"""
+    from trace.store import load_events
     
-    return embedding
+    if not record["id"].startswith("sig_"):
+        return None
+    events = load_events(record["id"][len("sig_"):])
+    return incident_embedding(events) if events else None
 
-def check_signature_cache(events: List[dict]) -> Optional[dict]:
-    embedding = _create_simple_embedding(events)
+def _signature_index():
+    global _signatures_synced, _legacy_migrated
+    index = get_signature_index(EMBEDDING_DIM)
+    if not _legacy_migrated:
+        _legacy_migrated = True
+        try:
+            migrate_unsuffixed(index, _reembed_signature)
+        except Exception as e:
+            print(f"Legacy signature index migration failed: {e}")
+    if SIGNATURE_CLICKHOUSE_SYNC and not _signatures_synced:
+        _signatures_synced = True
+        try:
+            index.sync_from(get_signatures())
+        except Exception as e:
+            print(f"Signature sync from ClickHouse failed: {e}")
+    return index
+
+def check_signature_cache(events: Optional[List[dict]], embedding: Optional[List[float]] = None) -> Optional[dict]:
+    """The stored fix for a similar incident; embedding, if already computed, stands in for events"""
+    if embedding is None:
+        embedding = _create_simple_embedding(events)
     
-    cached = find_similar_signature(embedding, threshold=0.85)
+    # Served from the in-process index; no ClickHouse round trip on lookup
+    cached = _signature_index().find_similar(embedding, threshold=SIGNATURE_MATCH_THRESHOLD)
     
     return cached
 
@@ -187,14 +198,17 @@ def save_signature(run_id: str, report: dict, patch: dict):
         "patch_text": patch_text
     }
     
-    insert_signature(signature)
+    _signature_index().add(signature)
+    if SIGNATURE_CLICKHOUSE_SYNC:
+        insert_signature(signature)
     
     # Send signature saved metric to Datadog
     if is_enabled():
         send_custom_metric("cta.signatures.saved", 1.0, 
                           [f"cause:{cause_label}", f"confidence:{report.get('confidence', 0.0):.2f}"], "counter")
 
-def execute_cta_workflow(run_id: str, report: dict, before_metrics: Dict[str, float] = None) -> dict:
+def execute_cta_workflow(run_id: str, report: dict, before_metrics: Dict[str, float] = None,
+                         profile: Optional[str] = None) -> dict:
     """
     Execute the complete CTA workflow with Datadog and ClickHouse integration:
     1. Apply patch
@@ -203,24 +217,34 @@ def execute_cta_workflow(run_id: str, report: dict, before_metrics: Dict[str, fl
     4. Send before/after comparison metrics (Datadog)
     5. Write results to ClickHouse
     6. Save signature for learning
+    
+    The result's `timings` (also saved per run) break the workflow down by
+    stage; profile works as for cta_analyze.
     """
     workflow_start = time.time()
+    timer = SpanTimer("workflow", run_id, profile_mode_for(run_id, profile))
     
     # Step 1: Apply patch
-    patch_result = apply_patch(run_id, report)
+    with timer.span("apply_patch"):
+        patch_result = apply_patch(run_id, report)
     if patch_result["status"] != "patched":
+        timings = timer.finish()
+        save_timings(run_id, timer.name, timings)
         return {
             "status": "failed",
             "reason": "Patch application failed",
             "patch_result": patch_result,
-            "run_id": run_id
+            "run_id": run_id,
+            "timings": timings
         }
     
     # Step 2: Run canary test
-    canary_result = canary_run_wrapper(run_id, N=20)
+    with timer.span("canary"):
+        canary_result = canary_run_wrapper(run_id, N=20)
     
     # Step 3: Promote or rollback
-    decision_result = promote_or_rollback(canary_result, run_id=run_id)
+    with timer.span("decision"):
+        decision_result = promote_or_rollback(canary_result, run_id=run_id)
     
     # Calculate before/after metrics
     before_error_rate = before_metrics.get("error_rate", 0.0) if before_metrics else 0.0
@@ -232,11 +256,13 @@ def execute_cta_workflow(run_id: str, report: dict, before_metrics: Dict[str, fl
             "error_rate": after_error_rate,
             "latency_ms": canary_result.get("latency_p95_ms", float('inf'))
         }
-        send_before_after_comparison(before_metrics, after_metrics, run_id)
+        with timer.span("datadog"):
+            send_before_after_comparison(before_metrics, after_metrics, run_id)
     
     # Step 5: Save signature if promoted
     if decision_result["action"] == "promote":
-        save_signature(run_id, report, patch_result)
+        with timer.span("save_signature"):
+            save_signature(run_id, report, patch_result)
     
     # Calculate total MTTR
     total_mttr = time.time() - workflow_start
@@ -244,9 +270,10 @@ def execute_cta_workflow(run_id: str, report: dict, before_metrics: Dict[str, fl
     # Step 6: Send MTTR metric to Datadog
     if is_enabled():
         method = report.get("method", "unknown")
-        send_mttr_metric(total_mttr, run_id, method)
-        send_custom_metric("cta.workflow.duration_s", total_mttr, 
-                          [f"action:{decision_result['action']}", f"method:{method}"], "histogram")
+        with timer.span("datadog"):
+            send_mttr_metric(total_mttr, run_id, method)
+            send_custom_metric("cta.workflow.duration_s", total_mttr, 
+                              [f"action:{decision_result['action']}", f"method:{method}"], "histogram")
     
     # Step 7: Write complete results to ClickHouse
     cta_result = {
@@ -264,11 +291,18 @@ def execute_cta_workflow(run_id: str, report: dict, before_metrics: Dict[str, fl
     }
     
     try:
-        write_cta_result(cta_result)
+        with timer.span("clickhouse"):
+            write_cta_result(cta_result)
     except Exception as e:
         print(f"Warning: Failed to write CTA result to ClickHouse: {e}")
         # Don't fail the workflow if ClickHouse write fails
     
+    timings = timer.finish()
+    save_timings(run_id, timer.name, timings)
+    if is_enabled():
+        for stage, duration in timings["stages"].items():
+            send_custom_metric("cta.workflow.stage_s", duration, [f"stage:{stage}"], "histogram")
+    
     return {
         "status": "completed",
         "action": decision_result["action"],
@@ -277,6 +311,7 @@ def execute_cta_workflow(run_id: str, report: dict, before_metrics: Dict[str, fl
         "decision_result": decision_result,
         "mttr_seconds": total_mttr,
         "run_id": run_id,
-        "clickhouse_written": True  # Indicates attempt was made
+        "clickhouse_written": True,  # Indicates attempt was made
+        "timings": timings
     }
 
@@ -1,62 +1,66 @@
+import hashlib
 import json
 import os
+import threading
 import time
-from trace.store import load_events, get_run, save_metric
-from integrations.clickhouse import fetch_logs_from_cloud
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Iterable, Optional
+from trace.store import iter_events, save_metric, save_timings, get_events_hash, get_cached_report, save_cached_report
+from integrations.trace_reader import iter_run_events
+from integrations.llm import get_llm_client, LLM_MAX_CONCURRENCY
 from integrations.datadog import send_incident_metric, send_custom_metric, is_enabled
+from trace.schema_index import get_schema_index
+from .context import ContextBuilder, build_context
+from .timing import SpanTimer, profile_mode_for
+from .detectors import RuleEngine
+from .signatures import IncidentFeatures, embed_features
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Bump when a change to the analysis should invalidate stored reports
+ANALYZER_VERSION = "3"
+# How long the LLM may run alongside the heuristic before its answer is given up on
+LLM_DEADLINE_S = float(os.getenv("CTA_LLM_DEADLINE_S", "20"))
+
+_llm_pool: Optional[ThreadPoolExecutor] = None
+_llm_pool_lock = threading.Lock()
+
+def _llm_executor() -> ThreadPoolExecutor:
+    global _llm_pool
+    with _llm_pool_lock:
+        if _llm_pool is None:
+            _llm_pool = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="cta-llm")
+        return _llm_pool
+
 def _load_prompt_template():
     prompt_path = os.path.join(os.path.dirname(__file__), "prompts", "rca_base.md")
     with open(prompt_path, 'r') as f:
         return f.read()
 
-def _heuristic_analyze(events, failure_text):
-    error_events = [e for e in events if e["type"] == "error"]
-    tool_events = [e for e in events if e["type"] == "tool"]
-    step_events = [e for e in events if e["type"] == "step"]
-    
-    primary_cause_step_id = None
-    symptoms = []
-    evidence = []
-    
-    if error_events:
-        symptoms.append("KeyError encountered in Auditor agent")
-        first_error = error_events[0]
-        evidence.append({
-            "step_id": f"error_{first_error['idx']}",
-            "excerpt": f"Error: {first_error['message']}"
-        })
-    
-    for tool_evt in tool_events:
-        if tool_evt.get("tool") == "fetch_log_events":
-            output = tool_evt.get("output", [])
-            if output and isinstance(output, list) and len(output) > 0:
-                first_evt = output[0]
-                if "level" in first_evt and "Level" not in first_evt:
-                    symptoms.append("Schema drift detected: 'level' field instead of 'Level'")
-                    primary_cause_step_id = f"tool_{tool_evt['idx']}"
-                    evidence.append({
-                        "step_id": primary_cause_step_id,
-                        "excerpt": f"Event has 'level' field: {json.dumps(first_evt)}"
-                    })
-    
-    if not primary_cause_step_id and step_events:
-        primary_cause_step_id = step_events[0].get("step_id", f"step_0")
-    
-    why_chain = [
-        "Why did the pipeline fail? Because the Auditor agent threw a KeyError.",
-        "Why did it throw a KeyError? Because it tried to access 'Level' field that doesn't exist.",
-        "Why doesn't the field exist? Because fetch_log_events returned 'level' instead of 'Level'.",
-        "Why did it return 'level'? Because the flaky mode renames the field to simulate schema drift.",
-        "Why is this the root cause? The data contract was violated at the source, not validated at retrieval."
-    ]
-    
-    proposed_fix = {
-        "tool_schema_patch": "Add schema adapter: rename 'level' -> 'Level' in fetch_log_events output OR validate schema in Retriever agent",
-        "test_case": "Assert all log events have 'Level' field before passing to Auditor"
+def heuristic_report(findings, first_step, failure_text) -> dict:
+    """Heuristic report from detector findings; first_step is the run's first step event, if any"""
+    symptoms = [f["symptom"] for f in findings]
+    evidence = [e for f in findings for e in f["evidence"]]
+    primary = findings[0] if findings else None
+    
+    if primary:
+        primary_cause_step_id = primary["step_id"]
+        why_chain = primary["why"]
+        confidence = primary["score"]
+    else:
+        primary_cause_step_id = first_step.get("step_id", "step_0") if first_step else None
+        why_chain = [
+            f"Why did the run fail? {failure_text}",
+            "Why is the cause unknown? No detector matched the recorded events."
+        ]
+        confidence = 0.3
+    
+    # Prefer a fix from the strongest finding that proposes one
+    fixing = next((f for f in findings if f["fix"]), None)
+    proposed_fix = fixing["fix"] if fixing else {
+        "tool_schema_patch": "No schema patch identified",
+        "test_case": "Add a regression test reproducing the failure before patching"
     }
     
     return {
@@ -64,101 +68,181 @@ def _heuristic_analyze(events, failure_text):
         "symptoms": symptoms,
         "evidence": evidence,
         "why_chain": why_chain,
-        "confidence": 0.65,
+        "confidence": confidence,
         "proposed_fix": proposed_fix,
+        "findings": [{"detector": f["detector"], "score": f["score"], "symptom": f["symptom"]} for f in findings],
         "method": "heuristic"
     }
 
-def _llm_analyze(events, failure_text):
-    import requests
-    
-    api_key = os.getenv("LLM_API_KEY")
-    model_name = os.getenv("MODEL_NAME", "gpt-4o-mini")
+def _heuristic_analyze(events, failure_text):
+    first_step = next((e for e in events if e["type"] == "step"), None)
+    return heuristic_report(RuleEngine().run(events), first_step, failure_text)
+
+def _scan_events(events: Iterable[dict], detect: bool = True, context: bool = False) -> dict:
+    """One pass over a run's events feeding the detectors, the incident
+    signature and (with context) the LLM context builder, so the events
+    themselves never need to be held at once"""
+    engine = RuleEngine() if detect else None
+    features = IncidentFeatures()
+    builder = ContextBuilder(schema_index=get_schema_index()) if context else None
+    count = 0
+    first_step = None
+    for event in events:
+        count += 1
+        if first_step is None and event.get("type") == "step":
+            first_step = event
+        features.observe(event)
+        if engine is not None:
+            engine.observe(event)
+        if builder is not None:
+            builder.observe(event)
+    return {
+        "count": count,
+        "first_step": first_step,
+        "findings": engine.findings() if engine is not None else None,
+        "embedding": embed_features(features.features),
+        "context": builder
+    }
+
+def _llm_analyze(events, failure_text, deadline=None, use_cache=True, timer: SpanTimer = None,
+                 cancel: threading.Event = None, context: ContextBuilder = None):
+    client = get_llm_client()
     
-    if not api_key:
+    if not client.api_key:
         return None
     
+    timer = timer or SpanTimer("llm")
     prompt_template = _load_prompt_template()
-    top_events = events[:50]
-    events_json = json.dumps(top_events, indent=2)
+    with timer.span("llm_context"):
+        if context is not None:
+            events_json, _ = context.build()
+        else:
+            events_json, _ = build_context(events, schema_index=get_schema_index())
     
     prompt = prompt_template.replace("{{failure_text}}", failure_text)
     prompt = prompt.replace("{{top_events_json}}", events_json)
     
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": model_name,
-                "messages": [
-                    {"role": "system", "content": "You are a root-cause analysis expert. Return only valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.1
-            },
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            content = result["choices"][0]["message"]["content"]
-            
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.startswith("```"):
-                content = content[3:]
-            if content.endswith("```"):
-                content = content[:-3]
-            content = content.strip()
-            
-            report = json.loads(content)
-            report["method"] = "llm"
-            return report
+        with timer.span("llm"):
+            report = client.chat_json([
+                {"role": "system", "content": "You are a root-cause analysis expert. Return only valid JSON."},
+                {"role": "user", "content": prompt}
+            ], temperature=0.1, deadline=deadline, use_cache=use_cache, cancel=cancel)
+        report["method"] = "llm"
+        return report
     except Exception as e:
         print(f"LLM analysis failed: {e}")
         return None
-    
-    return None
 
-def cta_analyze(run_id, failure_text) -> dict:
+def _merge_reports(llm_report: dict, heuristic: dict) -> dict:
+    """The LLM report, keeping the heuristic's diagnosis as an alternative when they disagree"""
+    report = dict(llm_report)
+    if heuristic.get("primary_cause_step_id") != llm_report.get("primary_cause_step_id"):
+        report["alternatives"] = [{
+            "method": heuristic.get("method"),
+            "primary_cause_step_id": heuristic.get("primary_cause_step_id"),
+            "confidence": heuristic.get("confidence"),
+            "symptoms": heuristic.get("symptoms", [])
+        }]
+    return report
+
+def _report_cache_key(run_id, failure_text) -> str:
+    """Key for a stored report: the run's event stream, the failure text and the analyzer that would run"""
+    client = get_llm_client()
+    analyzer = f"{ANALYZER_VERSION}:{client.model if client.api_key else 'heuristic'}"
+    content = f"{analyzer}|{get_events_hash(run_id)}|{failure_text}"
+    return hashlib.sha1(content.encode()).hexdigest()
+
+def get_cached_analysis(run_id, failure_text) -> dict:
+    """The stored report for the run's current events, or None"""
+    return get_cached_report(run_id, _report_cache_key(run_id, failure_text))
+
+def save_analysis(run_id, failure_text, report: dict):
+    """Store a report produced elsewhere (e.g. shared by triage) as the run's analysis.
+
+    Reports standing in for an LLM answer that never came (llm_status) are not stored.
+    """
+    if "llm_status" in report:
+        return
+    save_cached_report(run_id, _report_cache_key(run_id, failure_text), report)
+
+def _finish_timings(timer: SpanTimer, run_id, report: dict, llm_timer: SpanTimer = None):
+    timings = timer.finish()
+    report["timings"] = timings
+    finished = [(timer.name, timings)]
+    if llm_timer is not None:
+        # The LLM ran alongside the stages above, so its own timings are kept
+        # apart instead of being counted against the analysis total
+        timings["llm"] = llm_timer.finish()
+        finished.append((llm_timer.name, timings["llm"]))
+    for name, phase_timings in finished:
+        save_timings(run_id, name, phase_timings)
+        if is_enabled():
+            for stage, duration in phase_timings["stages"].items():
+                send_custom_metric(f"cta.{name}.stage_s", duration, [f"stage:{stage}"], "histogram")
+
+def cta_analyze(run_id, failure_text, use_cache: bool = True, deadline: float = None,
+                profile: str = None, on_provisional: Callable[[dict], None] = None,
+                event_count: Optional[int] = None) -> dict:
+    """Root-cause report for a run.
+
+    With an LLM configured, the LLM and the heuristic run concurrently. The
+    heuristic report is handed to on_provisional (marked provisional) as
+    soon as it is ready, and the LLM report replaces it if it arrives
+    before deadline (a time.monotonic() value, CTA_LLM_DEADLINE_S from now
+    by default); otherwise the LLM call is cancelled and the heuristic
+    report is final. Such a report carries llm_status and is not stored,
+    so the next request tries the LLM again.
+
+    The report's `timings` break the analysis down by stage; they are also
+    saved per run. profile ("cprofile" or "sample", or CTA_PROFILE_RUNS)
+    captures a profile of this analysis and adds its location to timings.
+
+    The trace is read page by page in a single pass that feeds the
+    detectors, the incident signature and the LLM context, so the run is
+    never held in memory as a whole; the context keeps each event only in
+    truncated form. event_count, when the caller observed all of the run's
+    events as they were traced (the online analyzer), lets its candidate
+    stand in for the detectors if the count still matches.
+    """
     from .actions import check_signature_cache
+    from .online import get_online_candidate
     
-    t0 = time.time()
+    # A report for the same events is reused as is, including its analysis time
+    cache_key = _report_cache_key(run_id, failure_text)
+    if use_cache:
+        report = get_cached_report(run_id, cache_key)
+        if report is not None:
+            return report
     
-    # Try to load events from ClickHouse first, fallback to SQLite
-    use_clickhouse = os.getenv("USE_CLICKHOUSE_FOR_CTA", "false").lower() == "true"
+    t0 = time.time()
+    timer = SpanTimer("analysis", run_id, profile_mode_for(run_id, profile))
     
-    if use_clickhouse:
-        # Load from ClickHouse (trace events should be stored there)
-        table_name = os.getenv("CLICKHOUSE_TRACE_TABLE", "trace_events")
-        try:
-            events = fetch_logs_from_cloud(table_name, limit=1000, filters={"run_id": run_id})
-            if not events:
-                # Fallback to SQLite if no events found
-                events = load_events(run_id)
-        except Exception as e:
-            print(f"Failed to load events from ClickHouse: {e}")
-            events = load_events(run_id)
+    # One pass over the trace, read from ClickHouse page by page (gaps and
+    # failed pages come from SQLite) or from SQLite alone, feeds every stage
+    # below; the online analyzer's candidate already covers the detectors
+    use_llm = bool(get_llm_client().api_key)
+    online = get_online_candidate(run_id, failure_text, event_count) if event_count is not None else None
+    if os.getenv("USE_CLICKHOUSE_FOR_CTA", "false").lower() == "true":
+        events = iter_run_events(run_id)
     else:
-        # Load from SQLite (legacy behavior)
-        events = load_events(run_id)
-    
-    run_info = get_run(run_id)
+        events = iter_events(run_id)
+    with timer.span("load_events"):
+        scan = _scan_events(events, detect=online is None, context=use_llm)
     
     # Send incident detection metric to Datadog
     if is_enabled():
-        send_incident_metric("incident_detected", "analyzing", run_id)
-        send_custom_metric("cta.analysis.started", 1.0, [f"run_id:{run_id}"], "counter")
+        with timer.span("datadog"):
+            send_incident_metric("incident_detected", "analyzing", run_id)
+            send_custom_metric("cta.analysis.started", 1.0, [f"run_id:{run_id}"], "counter")
     
-    cached_fix = check_signature_cache(events)
+    with timer.span("signature_cache"):
+        cached_fix = check_signature_cache(None, embedding=scan["embedding"])
     if cached_fix:
         analysis_time = time.time() - t0
-        save_metric(run_id, "mttr_cta_s", analysis_time)
-        save_metric(run_id, "mttr_human_s", 150.0)
+        with timer.span("save"):
+            save_metric(run_id, "mttr_cta_s", analysis_time)
+            save_metric(run_id, "mttr_human_s", 150.0)
         
         try:
             adapter_mapping = json.loads(cached_fix["patch_text"])
@@ -167,11 +251,12 @@ def cta_analyze(run_id, failure_text) -> dict:
         
         # Send cached fix metrics to Datadog
         if is_enabled():
-            send_incident_metric("cached_fix_found", "success", run_id, confidence=0.95)
-            send_custom_metric("cta.analysis.cached_hit", 1.0, 
-                              [f"cause:{cached_fix.get('cause_label', 'unknown')}"], "counter")
+            with timer.span("datadog"):
+                send_incident_metric("cached_fix_found", "success", run_id, confidence=0.95)
+                send_custom_metric("cta.analysis.cached_hit", 1.0, 
+                                  [f"cause:{cached_fix.get('cause_label', 'unknown')}"], "counter")
         
-        return {
+        report = {
             "run_id": run_id,
             "primary_cause_step_id": cached_fix.get("cause_label", "unknown"),
             "symptoms": ["Cached: Similar incident detected"],
@@ -183,22 +268,56 @@ def cta_analyze(run_id, failure_text) -> dict:
             ],
             "confidence": 0.95,
             "proposed_fix": {
-                "tool_schema_patch": f"Cached adapter: {adapter_mapping}",
+                "tool_schema_patch": "Cached adapter: " + ", ".join(
+                    f"rename '{old}' -> '{new}'" for old, new in adapter_mapping.items()),
                 "test_case": "Reuse previous fix"
             },
             "method": "cached",
             "cached_from": cached_fix.get("id"),
             "analysis_time_s": analysis_time
         }
+        _finish_timings(timer, run_id, report)
+        save_cached_report(run_id, cache_key, report)
+        return report
+    
+    llm_future = llm_timer = None
+    if use_llm:
+        deadline = deadline if deadline is not None else time.monotonic() + LLM_DEADLINE_S
+        cancel = threading.Event()
+        # The LLM thread keeps its own timer; it is only reported if its answer is used
+        llm_timer = SpanTimer("llm", run_id)
+        llm_future = _llm_executor().submit(_llm_analyze, None, failure_text, deadline, use_cache, llm_timer,
+                                            cancel, scan["context"])
     
-    report = _llm_analyze(events, failure_text)
+    # Detectors already fed event by event need no second pass
+    with timer.span("heuristic"):
+        report = online or heuristic_report(scan["findings"], scan["first_step"], failure_text)
+    first_diagnosis_s = time.time() - t0
     
-    if not report:
-        report = _heuristic_analyze(events, failure_text)
+    if llm_future is not None:
+        if on_provisional is not None:
+            on_provisional(dict(report, run_id=run_id, provisional=True, pending="llm",
+                                time_to_first_diagnosis_s=first_diagnosis_s))
+        # The client stops at the deadline itself; the margin covers the hand-back
+        with timer.span("llm_wait"):
+            try:
+                llm_report = llm_future.result(timeout=max(0.0, deadline - time.monotonic()) + 1.0)
+            except FutureTimeout:
+                # cancel() only helps while the call is still queued; the event
+                # stops one already running and frees its pool slot
+                cancel.set()
+                llm_future.cancel()
+                llm_report = None
+        if llm_report:
+            report = _merge_reports(llm_report, report)
+        else:
+            report["llm_status"] = "timeout" if time.monotonic() >= deadline else "failed"
+            llm_timer = None
     
     analysis_time = time.time() - t0
-    save_metric(run_id, "mttr_cta_s", analysis_time)
-    save_metric(run_id, "mttr_human_s", 150.0)
+    with timer.span("save"):
+        save_metric(run_id, "mttr_cta_s", analysis_time)
+        save_metric(run_id, "mttr_human_s", 150.0)
     
     # Send analysis completion metrics to Datadog
     if is_enabled():
@@ -206,14 +325,20 @@ def cta_analyze(run_id, failure_text) -> dict:
         confidence = report.get("confidence", 0.0)
         cause = report.get("primary_cause_step_id", "unknown")
         
-        send_incident_metric("analysis_completed", "success", run_id, confidence=confidence)
-        send_custom_metric("cta.analysis.completed", 1.0, 
-                          [f"method:{method}", f"cause:{cause}", f"confidence:{confidence:.2f}"], "counter")
-        send_custom_metric("cta.analysis.duration_s", analysis_time, 
-                          [f"method:{method}"], "histogram")
+        with timer.span("datadog"):
+            send_incident_metric("analysis_completed", "success", run_id, confidence=confidence)
+            send_custom_metric("cta.analysis.completed", 1.0, 
+                              [f"method:{method}", f"cause:{cause}", f"confidence:{confidence:.2f}"], "counter")
+            send_custom_metric("cta.analysis.duration_s", analysis_time, 
+                              [f"method:{method}"], "histogram")
     
     report["run_id"] = run_id
     report["analysis_time_s"] = analysis_time
+    report["time_to_first_diagnosis_s"] = first_diagnosis_s
+    _finish_timings(timer, run_id, report, llm_timer)
+    # A heuristic stand-in for a missing LLM answer is not kept under the LLM's key
+    if "llm_status" not in report:
+        save_cached_report(run_id, cache_key, report)
     
     return report
 
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .signatures import normalize_message
+
+# Prompt budget for the event context, in estimated tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CTA_CONTEXT_TOKENS", "3000"))
+CHARS_PER_TOKEN = 4
+
+MAX_LIST_ITEMS = 3
+MAX_DICT_KEYS = 16
+MAX_STRING_CHARS = 160
+MAX_DEPTH = 4
+# Payloads shorter than this are cheaper to repeat than to reference
+MIN_DEDUPE_CHARS = 80
+
+# Relevance of each kind of event; higher is kept first
+SCORE_ERROR = 100
+SCORE_FAILING_STEP = 90
+SCORE_FEEDING_TOOL = 80
+SCORE_SCHEMA_CHANGED = 70
+SCORE_STEP = 30
+SCORE_OTHER = 10
+
+_DROPPED_KEYS = {"ts", "run_id"}
+_PAYLOAD_KEYS = ("args", "input", "output", "context")
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _key_shape(item) -> Optional[tuple]:
+    return tuple(sorted(item)) if isinstance(item, dict) else None
+
+def _sample_items(items: list) -> Tuple[list, int]:
+    """Up to MAX_LIST_ITEMS items, one per distinct key shape first, so a drifted record is never cut"""
+    picked, shapes = [], set()
+    for i, item in enumerate(items):
+        shape = _key_shape(item)
+        if shape is not None and shape not in shapes:
+            shapes.add(shape)
+            picked.append(i)
+            if len(picked) == MAX_LIST_ITEMS:
+                break
+    for i in range(len(items)):
+        if len(picked) >= MAX_LIST_ITEMS:
+            break
+        if i not in picked:
+            picked.append(i)
+    picked.sort()
+    return [items[i] for i in picked], len(items) - len(picked)
+
+def truncate(value, depth: int = 0):
+    """Shrink a payload: long lists keep a few items plus a count, long strings are cut"""
+    if isinstance(value, str):
+        if len(value) > MAX_STRING_CHARS:
+            return value[:MAX_STRING_CHARS] + f"...(+{len(value) - MAX_STRING_CHARS} chars)"
+        return value
+    if isinstance(value, list):
+        if depth >= MAX_DEPTH:
+            return f"[{len(value)} items]"
+        items, more = _sample_items(value)
+        truncated = [truncate(item, depth + 1) for item in items]
+        if more:
+            truncated.append(f"...{more} more items")
+        return truncated
+    if isinstance(value, dict):
+        if depth >= MAX_DEPTH:
+            return f"{{{len(value)} keys}}"
+        keys = list(value)
+        truncated = {key: truncate(value[key], depth + 1) for key in keys[:MAX_DICT_KEYS]}
+        if len(keys) > MAX_DICT_KEYS:
+            truncated["..."] = f"{len(keys) - MAX_DICT_KEYS} more keys"
+        return truncated
+    return value
+
+def _record_ids(event: dict) -> set:
+    """LineIds of the records a tool call received or returned"""
+    output = event.get("output")
+    args = event.get("args")
+    records = output if isinstance(output, list) else []
+    if isinstance(args, list):
+        records = records + [a for a in args if isinstance(a, dict)]
+    return {r.get("LineId") for r in records if isinstance(r, dict) and r.get("LineId") is not None}
+
+def _has_schema_change(output) -> bool:
+    if not isinstance(output, list):
+        return False
+    shapes = {_key_shape(item) for item in output[:64] if isinstance(item, dict)}
+    return len(shapes) > 1
+
+def _score(event: dict, schema_index) -> int:
+    """Score of an event on its own; tool calls feeding a failing record are promoted later"""
+    event_type = event.get("type")
+    if event_type == "error":
+        return SCORE_ERROR
+    if event_type == "step":
+        output = event.get("output")
+        if isinstance(output, dict) and output.get("error_occurred"):
+            return SCORE_FAILING_STEP
+        return SCORE_STEP
+    if event_type == "tool":
+        output = event.get("output")
+        if _has_schema_change(output):
+            return SCORE_SCHEMA_CHANGED
+        tool = event.get("tool")
+        if schema_index is not None and isinstance(output, list) and schema_index.knows(tool):
+            sample = [item for item in output[:MAX_LIST_ITEMS] if isinstance(item, dict)]
+            if any(schema_index.check(tool, item) for item in sample):
+                return SCORE_SCHEMA_CHANGED
+    return SCORE_OTHER
+
+def _dedupe(value, seen_payloads: Dict[str, int], idx, depth: int = 0):
+    """Replace a payload, or a payload nested in a dict, already shown by another event with a reference"""
+    encoded = json.dumps(value, separators=(",", ":"), sort_keys=True, default=str)
+    if len(encoded) < MIN_DEDUPE_CHARS:
+        return value
+    digest = hashlib.sha1(encoded.encode()).hexdigest()
+    if digest in seen_payloads:
+        return {"same_as_idx": seen_payloads[digest]}
+    seen_payloads[digest] = idx
+    if isinstance(value, dict) and depth < 2:
+        return {key: _dedupe(item, seen_payloads, idx, depth + 1) for key, item in value.items()}
+    return value
+
+def _compact(event: dict, seen_payloads: Dict[str, int]) -> dict:
+    """Dedupe the payloads of an event already truncated by ContextBuilder.observe"""
+    return {key: _dedupe(value, seen_payloads, event.get("idx")) if key in _PAYLOAD_KEYS else value
+            for key, value in event.items()}
+
+class ContextBuilder:
+    """Selects and compacts the events most relevant to a failure, within a token budget.
+
+    Events are ranked: errors, the step that failed, tool calls whose data
+    includes a failing record, tool outputs whose schema changed (mixed key
+    shapes, or items schema_index reports as drifted), other steps, then
+    everything else. Errors repeating an earlier message are folded into it
+    with a count. Each event is compacted (no timestamps, long lists and
+    strings truncated, payloads shown in a kept event replaced by a
+    reference) and the highest-ranked ones that fit are emitted in
+    chronological order, one compact JSON object per line.
+
+    Events are fed one at a time with observe and only their truncated form
+    is kept, so a run can be streamed in without holding its full payloads.
+    """
+
+    def __init__(self, budget_tokens: int = CONTEXT_TOKEN_BUDGET, schema_index=None):
+        self.budget_tokens = budget_tokens
+        self.schema_index = schema_index
+        self.events = 0
+        self.failing_ids = set()
+        # (score, record ids, truncated event) per candidate, in event order
+        self.candidates: List[Tuple[int, set, dict]] = []
+        self.repeats: Dict[tuple, dict] = {}
+
+    def observe(self, event: dict):
+        self.events += 1
+        if event.get("type") == "error":
+            context = event.get("context") if isinstance(event.get("context"), dict) else {}
+            if context.get("event_id") is not None:
+                self.failing_ids.add(context["event_id"])
+            key = (normalize_message(event.get("message", "")), context.get("agent"))
+            if key in self.repeats:
+                self.repeats[key]["repeats"] = self.repeats[key].get("repeats", 0) + 1
+                return
+        truncated = {key: truncate(value) for key, value in event.items() if key not in _DROPPED_KEYS}
+        if event.get("type") == "error":
+            self.repeats[key] = truncated
+        record_ids = _record_ids(event) if event.get("type") == "tool" else set()
+        self.candidates.append((_score(event, self.schema_index), record_ids, truncated))
+
+    def _rank(self, score: int, record_ids: set) -> int:
+        # Failing records are only known once their errors have been seen
+        if score < SCORE_FEEDING_TOOL and record_ids & self.failing_ids:
+            return SCORE_FEEDING_TOOL
+        return score
+
+    def build(self) -> Tuple[str, dict]:
+        """The context text and stats about what was kept"""
+        ranked = sorted(((self._rank(score, ids), position, event)
+                         for position, (score, ids, event) in enumerate(self.candidates)),
+                        key=lambda c: (-c[0], c[1]))
+
+        # Compact in rank order so a payload is only replaced by a reference to
+        # an event that was actually kept
+        budget_chars = self.budget_tokens * CHARS_PER_TOKEN
+        used = 2
+        seen_payloads: Dict[str, int] = {}
+        lines: Dict[int, str] = {}
+        for _, position, event in ranked:
+            seen = dict(seen_payloads)
+            line = json.dumps(_compact(event, seen), separators=(",", ":"), default=str)
+            if used + len(line) + 2 <= budget_chars:
+                lines[position] = line
+                seen_payloads = seen
+                used += len(line) + 2
+
+        kept = sorted(lines)
+        output_lines = [lines[position] for position in kept]
+        omitted = self.events - len(kept)
+        if omitted:
+            output_lines.append(json.dumps({"omitted_events": omitted}))
+        text = "[\n" + ",\n".join(output_lines) + "\n]"
+        return text, {
+            "events": self.events,
+            "kept": len(kept),
+            "folded_errors": sum(e.get("repeats", 0) for e in self.repeats.values()),
+            "tokens": estimate_tokens(text)
+        }
+
+def build_context(events: Iterable[dict], budget_tokens: int = CONTEXT_TOKEN_BUDGET,
+                  schema_index=None) -> Tuple[str, dict]:
+    """Context for a failure from its events (see ContextBuilder); returns the text and stats"""
+    builder = ContextBuilder(budget_tokens, schema_index)
+    for event in events:
+        builder.observe(event)
+    return builder.build()
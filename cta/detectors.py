@@ -0,0 +1,530 @@
+import heapq
+import json
+import math
+import re
+from abc import ABC, abstractmethod
+from collections import Counter, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+from trace.quantiles import QuantileSketch
+
+# Errors sharing a signature within this many seconds count as one burst
+ERROR_BURST_WINDOW_S = 1.0
+ERROR_BURST_MIN = 5
+
+# A latency sample is a spike when it is SPIKE_FACTOR x the median and at
+# least LATENCY_SPIKE_MIN_MS; sources need LATENCY_MIN_SAMPLES to be judged
+SPIKE_FACTOR = 5.0
+LATENCY_SPIKE_MIN_MS = 250
+LATENCY_MIN_SAMPLES = 5
+
+# Each window of a tool's output is compared with the 5xx share of all the
+# windows before it; a shift needs STATUS_SHIFT_MIN absolute and
+# STATUS_SHIFT_Z standard errors, so long runs of noise do not trigger it
+STATUS_WINDOW = 100
+STATUS_SHIFT_MIN = 0.2
+STATUS_SHIFT_Z = 5.0
+
+_ERROR_TYPE = re.compile(r"^(\w+(?:Error|Exception|Fault)):\s*(.*)$")
+_QUOTED_KEY = re.compile(r"^'([^']+)'$")
+_DIGITS = re.compile(r"\d+")
+
+def normalize_key(key: str) -> str:
+    """Case- and separator-insensitive form used to pair drifted field names"""
+    return re.sub(r"[^a-z0-9]", "", key.lower())
+
+def parse_error(message: str) -> Tuple[str, Optional[str]]:
+    """Return (error type, missing key) for a traced error message"""
+    message = (message or "").strip()
+    match = _ERROR_TYPE.match(message)
+    error_type, detail = (match.group(1), match.group(2).strip()) if match else ("Error", message)
+    key_match = _QUOTED_KEY.match(detail)
+    if key_match and error_type in ("Error", "KeyError"):
+        # str(KeyError('x')) is just "'x'", which is what the Auditor traces
+        return "KeyError", key_match.group(1)
+    return error_type, None
+
+def _output_items(evt: dict) -> List[dict]:
+    output = evt.get("output")
+    if isinstance(output, list):
+        return [item for item in output if isinstance(item, dict)]
+    if isinstance(output, dict):
+        return [output]
+    return []
+
+def _excerpt(item: dict, limit: int = 300) -> str:
+    text = json.dumps(item)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+def _finding(detector: str, score: float, symptom: str, step_id: Optional[str], evidence: List[dict],
+             why: List[str] = None, fix: dict = None, **details) -> dict:
+    return {
+        "detector": detector,
+        "score": round(min(max(score, 0.0), 1.0), 2),
+        "symptom": symptom,
+        "step_id": step_id,
+        "evidence": evidence,
+        "why": why or [],
+        "fix": fix,
+        "details": details
+    }
+
+class Detector(ABC):
+    """A rule fed one event at a time by the RuleEngine.
+
+    `event_types` and `tools` declare which events the rule wants (None
+    means any); the engine only dispatches matching events. A rule whose
+    `wants` depends on state that changes over time sets `dynamic_routing`
+    so the engine asks it for every event instead of memoizing. `findings()`
+    returns scored finding dicts for the events observed so far and may be
+    called again after more events arrive.
+    """
+
+    name = "detector"
+    event_types: Optional[Tuple[str, ...]] = None
+    tools: Optional[Tuple[str, ...]] = None
+    dynamic_routing = False
+
+    def wants(self, event_type: str, tool: Optional[str]) -> bool:
+        if self.event_types is not None and event_type not in self.event_types:
+            return False
+        return self.tools is None or tool in self.tools
+
+    @abstractmethod
+    def observe(self, evt: dict):
+        ...
+
+    @abstractmethod
+    def findings(self) -> List[dict]:
+        ...
+
+class KeyDriftDetector(Detector):
+    """Renamed fields in tool output, paired with KeyErrors raised downstream"""
+
+    name = "key_drift"
+    event_types = ("tool", "error")
+
+    def __init__(self):
+        # Per-key counts are kept up to date as items arrive; first_seen is
+        # only checked for key tuples ("shapes") not seen before
+        self.shapes: Dict[str, set] = {}
+        self.key_counts: Dict[str, Counter] = {}
+        self.items: Counter = Counter()
+        self.first_seen: Dict[Tuple[str, str], Tuple[int, dict]] = {}
+        self.missing: Counter = Counter()
+        self.missing_agent: Dict[str, str] = {}
+
+    def observe(self, evt: dict):
+        if evt.get("type") == "error":
+            error_type, key = parse_error(evt.get("message", ""))
+            if key:
+                self.missing[key] += 1
+                self.missing_agent.setdefault(key, (evt.get("context") or {}).get("agent", "downstream"))
+            return
+
+        tool = evt.get("tool")
+        shapes = self.shapes.get(tool)
+        if shapes is None:
+            shapes = self.shapes[tool] = set()
+            self.key_counts[tool] = Counter()
+        counts = self.key_counts[tool]
+        items = _output_items(evt)
+        for item in items:
+            shape = tuple(item)
+            if shape not in shapes:
+                shapes.add(shape)
+                for key in shape:
+                    self.first_seen.setdefault((tool, key), (evt.get("idx", 0), item))
+            counts.update(shape)
+        self.items[tool] += len(items)
+
+    def _renames(self, tool: str) -> Dict[str, str]:
+        counts = self.key_counts[tool]
+        groups: Dict[str, List[str]] = {}
+        for key in counts:
+            groups.setdefault(normalize_key(key), []).append(key)
+
+        renames = {}
+        for key in self.missing:
+            for candidate in groups.get(normalize_key(key), []):
+                if candidate != key and counts[candidate] > counts.get(key, 0):
+                    renames[candidate] = key
+        for variants in groups.values():
+            # Mixed spellings within one run: the majority spelling is expected
+            if len(variants) > 1:
+                expected = max(variants, key=lambda k: (k in self.missing, counts[k]))
+                for variant in variants:
+                    if variant != expected:
+                        renames.setdefault(variant, expected)
+        return renames
+
+    def findings(self) -> List[dict]:
+        results = []
+        for tool in self.key_counts:
+            renames = self._renames(tool)
+            if not renames:
+                continue
+
+            first_idx, first_item = min((self.first_seen[(tool, old)] for old in renames), key=lambda seen: seen[0])
+            step_id = f"tool_{first_idx}"
+            old, new = next(iter(renames.items()))
+            drifted = sum(self.key_counts[tool][k] for k in renames)
+            confirmed = any(new_key in self.missing for new_key in renames.values())
+            agent = self.missing_agent.get(new, "downstream")
+
+            pairs = ", ".join(f"'{a}' -> '{b}'" for a, b in renames.items())
+            results.append(_finding(
+                self.name,
+                0.9 if confirmed else 0.6,
+                f"Schema drift detected: '{old}' field instead of '{new}'",
+                step_id,
+                [{"step_id": step_id, "excerpt": f"Event has '{old}' field: {_excerpt(first_item)}"}],
+                why=[
+                    f"Why did the pipeline fail? Because the {agent} agent could not read the '{new}' field.",
+                    f"Why could it not read it? Because {drifted} of {self.items[tool]} {tool} events had no '{new}' field.",
+                    f"Why was the field missing? Because {tool} returned '{old}' instead of '{new}'.",
+                    f"Why did {tool} return '{old}'? Because its output schema drifted from the shape consumers expect.",
+                    "Why is this the root cause? The data contract was violated at the source, not validated at retrieval."
+                ],
+                fix={
+                    "tool_schema_patch": f"Add schema adapter: rename {pairs} in {tool} output OR validate schema in Retriever agent",
+                    "test_case": f"Assert all {tool} events have {', '.join(repr(k) for k in renames.values())} before passing to Auditor"
+                },
+                tool=tool,
+                renames=renames,
+                drifted_events=drifted
+            ))
+        return results
+
+class ErrorBurstDetector(Detector):
+    """Groups traced errors by signature and measures their densest burst"""
+
+    name = "error_burst"
+    event_types = ("error",)
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.first: Dict[str, dict] = {}
+        self.windows: Dict[str, deque] = {}
+        self.bursts: Counter = Counter()
+        self.total = 0
+
+    def observe(self, evt: dict):
+        message = evt.get("message", "")
+        signature = _DIGITS.sub("N", message)
+        self.total += 1
+        self.counts[signature] += 1
+        self.first.setdefault(signature, evt)
+
+        window = self.windows.setdefault(signature, deque())
+        ts = evt.get("ts", 0.0) or 0.0
+        window.append(ts)
+        while window and ts - window[0] > ERROR_BURST_WINDOW_S:
+            window.popleft()
+        self.bursts[signature] = max(self.bursts[signature], len(window))
+
+    def findings(self) -> List[dict]:
+        results = []
+        for signature, count in self.counts.most_common(3):
+            evt = self.first[signature]
+            error_type, key = parse_error(evt.get("message", ""))
+            agent = (evt.get("context") or {}).get("agent", "pipeline")
+            burst = self.bursts[signature]
+            step_id = f"error_{evt.get('idx', 0)}"
+
+            symptom = f"{error_type} encountered in {agent} agent"
+            if count > 1:
+                symptom += f" ({count} occurrences, up to {burst} within {ERROR_BURST_WINDOW_S:g}s)"
+            results.append(_finding(
+                self.name,
+                0.45 + 0.2 * (count / self.total) + (0.1 if burst >= ERROR_BURST_MIN else 0.0),
+                symptom,
+                step_id,
+                [{"step_id": step_id, "excerpt": f"Error: {evt.get('message', '')}"}],
+                why=[
+                    f"Why did the pipeline fail? Because the {agent} agent raised {error_type}.",
+                    f"Why did it raise? {evt.get('message', '')}"
+                    + (f" The '{key}' field was missing from its input." if key else ""),
+                    f"Why does it matter? The same error occurred {count} times, so it is systematic, not transient."
+                ],
+                error_type=error_type,
+                count=count,
+                burst=burst,
+                missing_key=key
+            ))
+        return results
+
+class LatencySpikeDetector(Detector):
+    """Latency spikes against each source's median, for steps, tool calls and tool output events"""
+
+    name = "latency_spike"
+    event_types = ("step", "tool")
+
+    def __init__(self):
+        self.sketches: Dict[str, QuantileSketch] = {}
+        self.top: Dict[str, list] = {}
+
+    def _add(self, source: str, latency, idx: int):
+        if not isinstance(latency, (int, float)) or latency < 0:
+            return
+        sketch = self.sketches.get(source)
+        if sketch is None:
+            sketch = self.sketches[source] = QuantileSketch()
+            self.top[source] = []
+        sketch.add(latency)
+        heap = self.top[source]
+        if len(heap) < 5:
+            heapq.heappush(heap, (latency, idx))
+        elif latency > heap[0][0]:
+            heapq.heapreplace(heap, (latency, idx))
+
+    def observe(self, evt: dict):
+        idx = evt.get("idx", 0)
+        if evt.get("type") == "step":
+            self._add(f"step {evt.get('agent')}", evt.get("latency_ms"), idx)
+            return
+        tool = evt.get("tool")
+        self._add(f"tool {tool}", evt.get("latency_ms"), idx)
+        for item in _output_items(evt):
+            self._add(f"{tool} output", item.get("latency_ms"), idx)
+
+    def findings(self) -> List[dict]:
+        results = []
+        for source, sketch in self.sketches.items():
+            if sketch.count < LATENCY_MIN_SAMPLES:
+                continue
+            median = sketch.quantile(0.5)
+            threshold = max(median * SPIKE_FACTOR, LATENCY_SPIKE_MIN_MS)
+            spikes = sorted((s for s in self.top[source] if s[0] >= threshold), reverse=True)
+            if not spikes:
+                continue
+
+            worst, idx = spikes[0]
+            kind = "step" if source.startswith("step ") else "tool"
+            step_id = f"{kind}_{idx}"
+            ratio = worst / median if median > 0 else SPIKE_FACTOR
+            results.append(_finding(
+                self.name,
+                0.3 + min(0.4, 0.02 * ratio),
+                f"Latency spike in {source}: {worst:.0f}ms vs median {median:.0f}ms",
+                step_id,
+                [{"step_id": step_id, "excerpt": f"{source} latency {worst:.0f}ms, p95 {sketch.quantile(0.95):.0f}ms"}],
+                why=[
+                    f"Why was the run slow? Because {source} took {worst:.0f}ms.",
+                    f"Why is that anomalous? Its median is {median:.0f}ms, so this is {ratio:.1f}x slower.",
+                    "Why does it matter? Tail latency beyond the canary's p95 budget fails promotion."
+                ],
+                fix={
+                    "tool_schema_patch": "No schema patch identified",
+                    "test_case": f"Assert {source} p95 latency stays under {threshold:.0f}ms"
+                },
+                source=source,
+                median_ms=median,
+                max_ms=worst,
+                spikes=len(spikes)
+            ))
+        return results
+
+class StatusShiftDetector(Detector):
+    """Shifts in the error-status share of tool output, and 5xx statuses on non-ERROR events"""
+
+    name = "status_shift"
+    event_types = ("tool",)
+
+    def __init__(self):
+        self.state: Dict[str, dict] = {}
+
+    def observe(self, evt: dict):
+        tool = evt.get("tool")
+        for item in _output_items(evt):
+            status = item.get("status")
+            if not isinstance(status, int):
+                continue
+            st = self.state.get(tool)
+            if st is None:
+                st = self.state[tool] = {"items": 0, "window": 0, "window_errors": 0, "prior": 0, "prior_errors": 0,
+                                         "baseline": None, "max_rate": 0.0, "max_z": 0.0, "max_idx": None,
+                                         "mismatch": 0, "mismatch_idx": None}
+            st["items"] += 1
+            st["window"] += 1
+            if status >= 500:
+                st["window_errors"] += 1
+                level = item.get("Level", item.get("level"))
+                if level is not None and level != "ERROR":
+                    st["mismatch"] += 1
+                    if st["mismatch_idx"] is None:
+                        st["mismatch_idx"] = evt.get("idx", 0)
+            if st["window"] == STATUS_WINDOW:
+                self._close_window(st, evt.get("idx", 0))
+
+    def _close_window(self, st: dict, idx: int):
+        rate = st["window_errors"] / STATUS_WINDOW
+        if st["prior"]:
+            baseline = st["prior_errors"] / st["prior"]
+            stderr = math.sqrt(max(baseline * (1 - baseline), 1 / STATUS_WINDOW) / STATUS_WINDOW)
+            z = (rate - baseline) / stderr
+            if rate - baseline >= STATUS_SHIFT_MIN and z >= STATUS_SHIFT_Z and z > st["max_z"]:
+                st.update(baseline=baseline, baseline_n=st["prior"], max_rate=rate, max_z=z, max_idx=idx)
+        st["prior"] += STATUS_WINDOW
+        st["prior_errors"] += st["window_errors"]
+        st["window"] = st["window_errors"] = 0
+
+    def findings(self) -> List[dict]:
+        results = []
+        for tool, st in self.state.items():
+            if st["max_idx"] is not None:
+                step_id = f"tool_{st['max_idx']}"
+                results.append(_finding(
+                    self.name,
+                    0.4 + min(0.3, st["max_rate"] - st["baseline"]),
+                    f"5xx share in {tool} output rose from {st['baseline']:.0%} to {st['max_rate']:.0%}",
+                    step_id,
+                    [{"step_id": step_id, "excerpt": f"{st['max_rate']:.0%} of a {STATUS_WINDOW}-event window returned 5xx"}],
+                    why=[
+                        f"Why did errors increase? Because {tool} started returning more 5xx statuses.",
+                        f"Why is that a shift? The {st['baseline_n']} events before it had a {st['baseline']:.0%} 5xx share."
+                    ],
+                    tool=tool,
+                    baseline_rate=st["baseline"],
+                    max_rate=st["max_rate"]
+                ))
+            if st["mismatch"] and st["mismatch"] / st["items"] >= 0.05:
+                step_id = f"tool_{st['mismatch_idx']}"
+                results.append(_finding(
+                    self.name,
+                    0.5,
+                    f"{st['mismatch']} of {st['items']} {tool} events report 5xx without an ERROR level",
+                    step_id,
+                    [{"step_id": step_id, "excerpt": f"{tool} status codes disagree with log levels"}],
+                    why=[
+                        f"Why are statuses inconsistent? Because {tool} mixes 5xx codes into non-ERROR events.",
+                        "Why does it matter? Status-based error rates no longer match level-based anomaly counts."
+                    ],
+                    tool=tool,
+                    mismatched=st["mismatch"]
+                ))
+        return results
+
+class SchemaDriftDetector(Detector):
+    """Tool output compared against the schema index learned from successful runs"""
+
+    name = "schema_drift"
+    event_types = ("tool",)
+    # Which tools are known changes as the index learns
+    dynamic_routing = True
+
+    def __init__(self, index=None):
+        from trace.schema_index import get_schema_index
+        self.index = index or get_schema_index()
+        self.drift: Dict[Tuple[str, str], dict] = {}
+        self.counts: Counter = Counter()
+        self.items: Counter = Counter()
+
+    def wants(self, event_type: str, tool: Optional[str]) -> bool:
+        return event_type == "tool" and self.index.knows(tool)
+
+    def observe(self, evt: dict):
+        tool = evt.get("tool")
+        for item in _output_items(evt):
+            self.items[tool] += 1
+            diff = self.index.check(tool, item)
+            if diff is None:
+                continue
+            # Schemas that differ only in fields the index treats as optional
+            # or nullable drift the same way and are reported together
+            key = (tool, diff["change_key"])
+            self.counts[key] += 1
+            if key not in self.drift:
+                self.drift[key] = dict(diff, idx=evt.get("idx", 0), example=item)
+
+    def findings(self) -> List[dict]:
+        results = []
+        for key, count in self.counts.most_common():
+            diff = self.drift[key]
+            tool = diff["tool"]
+            step_id = f"tool_{diff['idx']}"
+            renames = {r["from"]: r["to"] for r in diff["renamed"]}
+
+            changes = [f"'{r['from']}' renamed from '{r['to']}' ({r['score']:.2f})" for r in diff["renamed"]]
+            changes += [f"'{k}' removed" for k in diff["removed"]]
+            changes += [f"'{k}' added" for k in diff["added"]]
+            changes += [f"'{t['field']}' is {t['got']}, expected {'/'.join(t['expected'])}" for t in diff["type_changed"]]
+
+            # Added fields alone rarely break consumers; missing or renamed ones do
+            if renames:
+                score = 0.6 + 0.25 * max(r["score"] for r in diff["renamed"])
+            elif diff["removed"] or diff["type_changed"]:
+                score = 0.6
+            else:
+                score = 0.3
+            fix = None
+            if renames:
+                pairs = ", ".join(f"'{a}' -> '{b}'" for a, b in renames.items())
+                fix = {
+                    "tool_schema_patch": f"Add schema adapter: rename {pairs} in {tool} output",
+                    "test_case": f"Assert {tool} output matches a known-good schema fingerprint"
+                }
+
+            results.append(_finding(
+                self.name,
+                score,
+                f"{tool} output schema {diff['fingerprint']} is unknown: {'; '.join(changes)}",
+                step_id,
+                [{"step_id": step_id, "excerpt": f"{count} of {self.items[tool]} events: {_excerpt(diff['example'])}"}],
+                why=[
+                    f"Why is the output suspect? {count} {tool} events match no schema seen in successful runs.",
+                    f"What changed? {'; '.join(changes)}.",
+                    "Why is this the root cause? Consumers were built against the learned schema, not this one."
+                ],
+                fix=fix,
+                tool=tool,
+                fingerprint=diff["fingerprint"],
+                renamed=diff["renamed"],
+                added=diff["added"],
+                removed=diff["removed"],
+                type_changed=diff["type_changed"],
+                events=count
+            ))
+        return results
+
+DEFAULT_DETECTORS = [KeyDriftDetector, ErrorBurstDetector, LatencySpikeDetector, StatusShiftDetector,
+                     SchemaDriftDetector]
+
+class RuleEngine:
+    """Dispatches each event once to the detectors interested in it.
+
+    Routing is memoized per (event type, tool), so a pass costs one dict
+    lookup per event plus the work of the detectors that want it. Detectors
+    with dynamic_routing are left out of the memo and asked every time, so
+    a long-lived engine follows them as their state changes.
+    """
+
+    def __init__(self, detectors: Iterable[type] = None):
+        self.detectors: List[Detector] = [cls() for cls in (detectors or DEFAULT_DETECTORS)]
+        self._static = [d for d in self.detectors if not d.dynamic_routing]
+        self._dynamic = [d for d in self.detectors if d.dynamic_routing]
+        self._routes: Dict[Tuple[str, Optional[str]], List[Detector]] = {}
+
+    def _route(self, event_type: str, tool: Optional[str]) -> List[Detector]:
+        key = (event_type, tool)
+        routed = self._routes.get(key)
+        if routed is None:
+            routed = self._routes[key] = [d for d in self._static if d.wants(event_type, tool)]
+        if self._dynamic:
+            return routed + [d for d in self._dynamic if d.wants(event_type, tool)]
+        return routed
+
+    def observe(self, evt: dict):
+        for detector in self._route(evt.get("type"), evt.get("tool")):
+            detector.observe(evt)
+
+    def findings(self) -> List[dict]:
+        """Findings for the events observed so far, highest score first"""
+        findings = [f for detector in self.detectors for f in detector.findings()]
+        findings.sort(key=lambda f: f["score"], reverse=True)
+        return findings
+
+    def run(self, events: Iterable[dict]) -> List[dict]:
+        """Single pass over events; returns all findings, highest score first"""
+        for evt in events:
+            self.observe(evt)
+        return self.findings()
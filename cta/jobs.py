@@ -0,0 +1,255 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from trace.store import create_job, update_job, get_job, list_jobs, claim_job, requeue_job, get_active_job
+from .analyze import cta_analyze, get_cached_analysis
+from .timing import profile_mode_for
+
+JOB_WORKERS = int(os.getenv("CTA_JOB_WORKERS", "2"))
+# Jobs waiting for a worker before submit starts refusing new runs
+JOB_QUEUE_LIMIT = int(os.getenv("CTA_JOB_QUEUE_LIMIT", "100"))
+# A job running for longer than this is assumed to belong to a dead process
+JOB_STALE_S = float(os.getenv("CTA_JOB_STALE_S", "300"))
+
+# Lower runs first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10
+
+ACTIVE_STATUSES = ("queued", "running")
+
+def _stale_before() -> str:
+    return datetime.utcfromtimestamp(time.time() - JOB_STALE_S).isoformat()
+
+class QueueFull(RuntimeError):
+    """Raised by submit when JOB_QUEUE_LIMIT jobs are already waiting"""
+
+class AnalysisJobQueue:
+    """Runs CTA analysis off the request path on a bounded pool of worker threads.
+
+    Jobs are persisted in the trace DB and served in priority order; a
+    worker claims a job in the DB before running it, so queues in several
+    processes can share the table. A run has at most one active job:
+    submitting it again returns that job, raising its priority if asked to.
+    A run whose report is already stored gets a finished, unsaved job at once
+    unless refresh is set. With recover, start also picks up queued jobs
+    and jobs stuck running for JOB_STALE_S; submit takes over a job another
+    process left queued or running that long instead of handing it back.
+    While a job runs, its report is the provisional one the analyzer
+    published, if any.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_limit: int = JOB_QUEUE_LIMIT,
+                 analyze: Callable[..., dict] = cta_analyze, recover: bool = True):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.analyze = analyze
+        self.recover = recover
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.running = False
+        self.threads: List[threading.Thread] = []
+
+        # Heap of (priority, seq, job_id); entries whose priority no longer
+        # matches the job's are stale and skipped
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._priority: Dict[str, int] = {}
+        self._active: Dict[str, str] = {}
+        self._refresh = set()
+        self._profile: Dict[str, str] = {}
+        self._busy = 0
+        self.total_completed = 0
+        self.total_failed = 0
+        self.total_deduplicated = 0
+        self.total_recovered = 0
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+            if self.recover:
+                self._recover_jobs()
+            self.threads = [threading.Thread(target=self._run_loop, daemon=True) for _ in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.ready.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=5.0)
+        self.threads = []
+
+    def _recover_jobs(self):
+        stale_before = _stale_before()
+        for job in list_jobs(list(ACTIVE_STATUSES)):
+            if job["status"] == "running" and not requeue_job(job["id"], stale_before):
+                continue
+            self._enqueue(job["id"], job["run_id"], job["priority"])
+
+    def _take_over(self, job: dict) -> bool:
+        """Queue another process's job here if it has been left queued or running for JOB_STALE_S"""
+        stale_before = _stale_before()
+        if job["status"] == "running":
+            if not requeue_job(job["id"], stale_before):
+                return False
+        elif job["created_at"] > stale_before:
+            return False
+        # Whichever queue claims it first runs it
+        self._enqueue(job["id"], job["run_id"], job["priority"])
+        return True
+
+    def _enqueue(self, job_id: str, run_id: str, priority: int):
+        self._priority[job_id] = priority
+        self._active[run_id] = job_id
+        heapq.heappush(self._heap, (priority, next(self._seq), job_id))
+        self.ready.notify()
+
+    def submit(self, run_id: str, failure_text: str, priority: int = PRIORITY_NORMAL, refresh: bool = False,
+               profile: Optional[str] = None) -> dict:
+        """Queue analysis of a run and return its job without waiting for it.
+
+        refresh re-analyzes even if a report for the run's events is stored;
+        otherwise a stored report is returned as a finished job that is not
+        saved (its id is None). profile ("cprofile" or "sample") runs a fresh
+        analysis with a profiler attached (ValueError for an unknown mode);
+        a job of the run that is already running is returned as it is.
+        """
+        if profile:
+            profile = profile_mode_for(run_id, profile)
+            refresh = True
+        else:
+            profile = None
+        if not refresh:
+            report = get_cached_analysis(run_id, failure_text)
+            if report is not None:
+                return {"id": None, "run_id": run_id, "failure_text": failure_text, "priority": priority,
+                        "status": "done", "report": report}
+
+        self.start()
+        with self.lock:
+            job_id = self._active.get(run_id)
+            if job_id is not None:
+                self.total_deduplicated += 1
+                if job_id in self._priority:
+                    # Still waiting here, so it can pick up the new options
+                    if profile is not None:
+                        self._refresh.add(job_id)
+                        self._profile[job_id] = profile
+                    if priority < self._priority[job_id]:
+                        update_job(job_id, priority=priority)
+                        self._enqueue(job_id, run_id, priority)
+                return get_job(job_id)
+
+            # Another process may already be analyzing this run
+            job = get_active_job(run_id)
+            if job is not None:
+                self.total_deduplicated += 1
+                if self._take_over(job):
+                    self.total_recovered += 1
+                    return get_job(job["id"])
+                return job
+
+            if len(self._priority) >= self.queue_limit:
+                raise QueueFull(f"{len(self._priority)} CTA jobs already queued")
+            job = create_job(run_id, failure_text, priority)
+            if refresh:
+                self._refresh.add(job["id"])
+            if profile is not None:
+                self._profile[job["id"]] = profile
+            self._enqueue(job["id"], run_id, priority)
+            return job
+
+    def _next_job(self) -> Optional[str]:
+        with self.lock:
+            while self.running:
+                while self._heap:
+                    priority, _, job_id = heapq.heappop(self._heap)
+                    if self._priority.get(job_id) == priority:
+                        del self._priority[job_id]
+                        self._busy += 1
+                        return job_id
+                self.ready.wait()
+            return None
+
+    def _run_loop(self):
+        while True:
+            job_id = self._next_job()
+            if job_id is None:
+                return
+            job = get_job(job_id)
+            with self.lock:
+                use_cache = job_id not in self._refresh
+                self._refresh.discard(job_id)
+                profile = self._profile.pop(job_id, None)
+            if not claim_job(job_id):
+                with self.lock:
+                    self._busy -= 1
+                    if self._active.get(job["run_id"]) == job_id:
+                        del self._active[job["run_id"]]
+                continue
+            try:
+                # The heuristic report is visible on the job while the LLM is still working
+                options = {"profile": profile} if profile else {}
+                report = self.analyze(job["run_id"], job["failure_text"], use_cache=use_cache,
+                                      on_provisional=lambda provisional: update_job(job_id, report=provisional),
+                                      **options)
+                update_job(job_id, status="done", report=report, finished_at=datetime.utcnow().isoformat())
+                outcome = "completed"
+            except Exception as e:
+                update_job(job_id, status="failed", error=str(e), finished_at=datetime.utcnow().isoformat())
+                outcome = "failed"
+            with self.lock:
+                self._busy -= 1
+                if self._active.get(job["run_id"]) == job_id:
+                    del self._active[job["run_id"]]
+                if outcome == "completed":
+                    self.total_completed += 1
+                else:
+                    self.total_failed += 1
+
+    def wait(self, job_id: str, timeout: float = 30.0, poll_interval_s: float = 0.05) -> Optional[dict]:
+        """Poll until the job finishes or timeout passes; returns the job either way"""
+        deadline = time.monotonic() + timeout
+        job = get_job(job_id)
+        while job and job["status"] in ACTIVE_STATUSES and time.monotonic() < deadline:
+            time.sleep(poll_interval_s)
+            job = get_job(job_id)
+        return job
+
+    def get_status(self) -> dict:
+        with self.lock:
+            return {
+                "running": self.running,
+                "workers": self.workers,
+                "queued": len(self._priority),
+                "busy": self._busy,
+                "queue_limit": self.queue_limit,
+                "completed": self.total_completed,
+                "failed": self.total_failed,
+                "deduplicated": self.total_deduplicated,
+                "recovered": self.total_recovered
+            }
+
+_queue: Optional[AnalysisJobQueue] = None
+
+def get_job_queue() -> AnalysisJobQueue:
+    global _queue
+    if _queue is None:
+        _queue = AnalysisJobQueue()
+    return _queue
+
+def submit_analysis(run_id: str, failure_text: str, priority: int = PRIORITY_NORMAL, refresh: bool = False,
+                    profile: Optional[str] = None) -> dict:
+    return get_job_queue().submit(run_id, failure_text, priority, refresh, profile)
+
+def get_job_status(job_id: str) -> Optional[dict]:
+    return get_job(job_id)
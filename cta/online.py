@@ -0,0 +1,177 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional
+
+from trace.store import add_event_listener, add_metric_listener, remove_listener
+from integrations.llm import get_llm_client
+from .detectors import RuleEngine
+
+ONLINE_ENABLED = os.getenv("CTA_ONLINE", "true").lower() == "true"
+# Runs whose detector state is kept; the least recently appended-to are dropped first
+ONLINE_MAX_RUNS = int(os.getenv("CTA_ONLINE_MAX_RUNS", "256"))
+# Threads finishing the analysis of failed runs, off the tracing thread
+ONLINE_WORKERS = int(os.getenv("CTA_ONLINE_WORKERS", "1"))
+
+class _RunState:
+    def __init__(self):
+        self.engine = RuleEngine()
+        self.count = 0
+        # False once an event is missed (e.g. the analyzer started mid-run)
+        self.complete = True
+        self.first_step: Optional[dict] = None
+        self.failed = False
+        self.fail_reason: Optional[str] = None
+        self.published = False
+        self.candidate: Optional[tuple] = None
+
+class OnlineAnalyzer:
+    """Keeps the heuristic detectors of every active run up to date as events are appended.
+
+    Each appended event is routed to the run's detectors once and then
+    dropped, so a candidate heuristic report is ready at any time without
+    rescanning the trace, while only detector state is held per run. When a
+    run is marked failed (status and fail_reason saved), the analysis is
+    finished straight away on a background worker: cta_analyze reads the
+    trace back page by page for the signature and the report, with the
+    candidate in place of the heuristic pass. With an LLM
+    configured that would tie up a worker per failure waiting on the
+    model, so the run is only analyzed on request, still starting from the
+    candidate.
+    """
+
+    def __init__(self, max_runs: int = ONLINE_MAX_RUNS, workers: int = ONLINE_WORKERS):
+        self.max_runs = max_runs
+        self.runs: "OrderedDict[str, _RunState]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cta-online")
+        self.pending = set()
+        self.events = 0
+        self.evicted = 0
+        self.published = 0
+        self.failed = 0
+
+    def start(self):
+        add_event_listener(self.on_event)
+        add_metric_listener(self.on_metric)
+
+    def stop(self):
+        remove_listener(self.on_event)
+        remove_listener(self.on_metric)
+
+    def on_event(self, run_id: str, event: dict):
+        with self.lock:
+            state = self.runs.get(run_id)
+            if state is None:
+                state = self.runs[run_id] = _RunState()
+                while len(self.runs) > self.max_runs:
+                    self.runs.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self.runs.move_to_end(run_id)
+            if event.get("idx") != state.count:
+                state.complete = False
+            state.count += 1
+            if state.first_step is None and event.get("type") == "step":
+                state.first_step = event
+            state.engine.observe(event)
+            state.candidate = None
+            self.events += 1
+
+    def candidate(self, run_id: str, failure_text: str, event_count: Optional[int] = None) -> Optional[dict]:
+        """Heuristic report for the run's events so far, or None if they were not all observed.
+
+        event_count, when given, must match the number of events observed.
+        """
+        from .analyze import heuristic_report
+
+        with self.lock:
+            state = self.runs.get(run_id)
+            if state is None or not state.complete or (event_count is not None and event_count != state.count):
+                return None
+            if state.candidate is None or state.candidate[0] != failure_text:
+                report = heuristic_report(state.engine.findings(), state.first_step, failure_text)
+                report["online"] = True
+                state.candidate = (failure_text, report)
+            return dict(state.candidate[1])
+
+    def on_metric(self, run_id: str, key: str, value):
+        if key not in ("status", "fail_reason"):
+            return
+        with self.lock:
+            state = self.runs.get(run_id)
+            if state is None:
+                return
+            if key == "status":
+                if value != "failed":
+                    # A run that finished without failing needs no diagnosis
+                    del self.runs[run_id]
+                    return
+                state.failed = True
+            else:
+                state.fail_reason = value
+            publish = state.failed and state.fail_reason and not state.published
+            if publish:
+                state.published = True
+                event_count = state.count if state.complete else None
+        if publish and not get_llm_client().api_key:
+            future = self.executor.submit(self._publish, run_id, state.fail_reason, event_count)
+            with self.lock:
+                self.pending.add(future)
+            future.add_done_callback(self._done)
+
+    def _publish(self, run_id: str, fail_reason: str, event_count: Optional[int]):
+        from .analyze import cta_analyze
+
+        try:
+            cta_analyze(run_id, fail_reason, event_count=event_count)
+        except Exception as e:
+            print(f"[WARN] Online analysis of {run_id} failed: {e}")
+            with self.lock:
+                self.failed += 1
+            return
+        with self.lock:
+            self.published += 1
+
+    def _done(self, future):
+        with self.lock:
+            self.pending.discard(future)
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Wait for analyses already handed to the workers; False if some are still running"""
+        with self.lock:
+            pending = list(self.pending)
+        return not wait(pending, timeout=timeout).not_done
+
+    def get_status(self) -> dict:
+        with self.lock:
+            return {
+                "runs": len(self.runs),
+                "max_runs": self.max_runs,
+                "events": self.events,
+                "evicted": self.evicted,
+                "pending": len(self.pending),
+                "published": self.published,
+                "failed": self.failed
+            }
+
+_analyzer: Optional[OnlineAnalyzer] = None
+_analyzer_lock = threading.Lock()
+
+def get_online_analyzer() -> OnlineAnalyzer:
+    global _analyzer
+    with _analyzer_lock:
+        if _analyzer is None:
+            _analyzer = OnlineAnalyzer()
+        return _analyzer
+
+def enable_online_analysis() -> OnlineAnalyzer:
+    """Hook the shared analyzer onto the trace store"""
+    analyzer = get_online_analyzer()
+    analyzer.start()
+    return analyzer
+
+def get_online_candidate(run_id: str, failure_text: str, event_count: Optional[int] = None) -> Optional[dict]:
+    """The shared analyzer's candidate report, or None when it is not tracking the run"""
+    return _analyzer.candidate(run_id, failure_text, event_count) if _analyzer is not None else None
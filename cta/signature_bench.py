@@ -0,0 +1,187 @@
+import argparse
+import hashlib
+import random
+import tempfile
+import time
+import os
+from typing import Callable, Dict, List, Tuple
+
+from agents.synthetic import NovaLogGenerator
+from .signature_index import SignatureIndex
+from .signatures import incident_embedding
+
+BENCH_SEED = 7
+THRESHOLDS = (0.7, 0.75, 0.8, 0.85, 0.9, 0.95)
+
+def _rename(field: str, new: str):
+    def mutate(items: List[dict], rng: random.Random) -> List[dict]:
+        ratio = rng.uniform(0.3, 1.0)
+        failed = []
+        for item in items:
+            if field in item and rng.random() < ratio:
+                item[new] = item.pop(field)
+                failed.append(item)
+        return failed or items[:1]
+    return mutate
+
+def _drop(field: str):
+    def mutate(items: List[dict], rng: random.Random) -> List[dict]:
+        for item in items:
+            item.pop(field, None)
+        return items
+    return mutate
+
+def _stringify(field: str):
+    def mutate(items: List[dict], rng: random.Random) -> List[dict]:
+        for item in items:
+            item[field] = str(item[field])
+        return items
+    return mutate
+
+def _empty_output(items: List[dict], rng: random.Random) -> List[dict]:
+    items.clear()
+    return []
+
+def _untouched(items: List[dict], rng: random.Random) -> List[dict]:
+    return items
+
+# family -> (mutate items, returning the records that failed; error message template)
+FAMILIES: Dict[str, Tuple[Callable, Callable[[random.Random], str]]] = {
+    "level_rename": (_rename("Level", "level"), lambda rng: "'Level'"),
+    "latency_rename": (_rename("latency_ms", "latencyMs"), lambda rng: "'latency_ms'"),
+    "component_missing": (_drop("Component"), lambda rng: "'Component'"),
+    "status_as_string": (_stringify("status"),
+                         lambda rng: "'>=' not supported between instances of 'str' and 'int'"),
+    "tool_timeout": (_empty_output, lambda rng: f"Tool fetch_log_events timed out after {rng.randint(5, 60)}s"),
+    "injected_fault": (_untouched, lambda rng: "Injected fault in evaluate_event (flaky_tool)"),
+    "llm_parse": (_untouched, lambda rng: f"Failed to parse LLM response: Expecting value: line 1 column "
+                                          f"{rng.randint(1, 80)} (char {rng.randint(0, 2000)})"),
+    "rate_limited": (_untouched, lambda rng: f"429 Too Many Requests (retry after {rng.randint(1, 30)}s)"),
+}
+
+# Families that are never stored: any match for them is a false match
+HELD_OUT_FAMILIES: Dict[str, Tuple[Callable, Callable[[random.Random], str]]] = {
+    "pid_rename": (_rename("Pid", "pid"), lambda rng: "'Pid'"),
+    "content_missing": (_drop("Content"), lambda rng: "'Content'"),
+    "store_unavailable": (_untouched, lambda rng: f"Connection refused: clickhouse:{rng.randint(8000, 9500)}"),
+    "empty_summary": (_untouched, lambda rng: "division by zero"),
+}
+
+def make_incident(family: str, rng: random.Random, generator: NovaLogGenerator) -> List[dict]:
+    """Trace events of one failed run of `family`, with run-to-run noise.
+
+    Noise covers the batch size, how many records fail, partial drift,
+    an extra field on the tool output, and optional note and retriever
+    events.
+    """
+    mutate, message = {**FAMILIES, **HELD_OUT_FAMILIES}[family]
+    items = generator.generate(rng.randint(3, 20))
+    for item in items:
+        del item["timestamp"]
+    if rng.random() < 0.3:
+        for item in items:
+            item["trace_id"] = f"{rng.getrandbits(64):016x}"
+    failed = mutate(items, rng)
+
+    events = [
+        {"type": "step", "agent": "Intake", "input": ["flaky"], "output": {"status": "ready", "mode": "flaky"}},
+        {"type": "tool", "tool": "fetch_log_events", "args": [True], "output": items}
+    ]
+    if rng.random() < 0.8:
+        events.append({"type": "step", "agent": "Retriever", "output": {"events": items}})
+    if rng.random() < 0.5:
+        events.append({"type": "note", "message": f"Auditing {len(items)} events"})
+
+    failures = (failed or [{}])[:rng.randint(1, 5)]
+    for record in failures:
+        context = {"agent": "Auditor"}
+        if record:
+            context.update({"event_id": record.get("LineId"), "event": record})
+        events.append({"type": "error", "message": message(rng), "context": context})
+    events.append({"type": "step", "agent": "Auditor", "output": {"error_occurred": True}})
+    return events
+
+def sha_embedding(events: List[dict]) -> List[float]:
+    """The previous embedding: SHA-256 of field names and event types, spread over 32 floats"""
+    field_names = set()
+    event_types = []
+    for event in events:
+        event_types.append(event.get("type", ""))
+        if event.get("type") == "error":
+            context = event.get("context", {})
+            if isinstance(context, dict):
+                tx = context.get("tx", {})
+                if isinstance(tx, dict):
+                    field_names.update(tx.keys())
+        if event.get("type") == "tool":
+            output = event.get("output", [])
+            if isinstance(output, list) and len(output) > 0 and isinstance(output[0], dict):
+                field_names.update(output[0].keys())
+    signature_string = ",".join(sorted(field_names)) + "|" + ",".join(event_types[:10])
+    hash_bytes = hashlib.sha256(signature_string.encode()).digest()
+    return [float(hash_bytes[i % len(hash_bytes)]) / 255.0 for i in range(32)]
+
+def build_incident_set(references: int = 1, queries: int = 50, seed: int = BENCH_SEED):
+    """Labelled incidents: `references` stored per known family, `queries` per known and held-out family"""
+    rng = random.Random(seed)
+    generator = NovaLogGenerator(seed=seed)
+    stored = [(family, make_incident(family, rng, generator)) for family in FAMILIES for _ in range(references)]
+    probes = [(family, make_incident(family, rng, generator))
+              for family in list(FAMILIES) + list(HELD_OUT_FAMILIES) for _ in range(queries)]
+    return stored, probes
+
+def run_benchmark(embed: Callable[[List[dict]], List[float]], stored, probes,
+                  thresholds=THRESHOLDS) -> List[dict]:
+    """Cache hit rate and false-match rate of `embed` at each threshold.
+
+    A hit is a known-family query whose best match clears the threshold and
+    has the same family. A false match is any query whose best match clears
+    the threshold but belongs to another family.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SignatureIndex(os.path.join(tmp, "signatures"))
+        index.add_many([{"id": f"sig_{i}", "cause_label": family, "embedding": embed(events), "patch_text": ""}
+                        for i, (family, events) in enumerate(stored)])
+        t0 = time.perf_counter()
+        embeddings = [embed(events) for _, events in probes]
+        embed_s = time.perf_counter() - t0
+        matches = index.search_batch(embeddings, k=1)
+
+    known = sum(1 for family, _ in probes if family in FAMILIES)
+    results = []
+    for threshold in thresholds:
+        hits = false_matches = 0
+        for (family, _), best in zip(probes, matches):
+            if not best or best[0]["similarity"] < threshold:
+                continue
+            if best[0]["cause_label"] == family:
+                hits += 1
+            else:
+                false_matches += 1
+        results.append({
+            "threshold": threshold,
+            "hit_rate": hits / known,
+            "false_match_rate": false_matches / len(probes),
+            "embed_us": embed_s / len(probes) * 1e6
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark incident embeddings on a labelled synthetic incident set")
+    parser.add_argument("--references", type=int, default=1, help="Stored incidents per known family")
+    parser.add_argument("--queries", type=int, default=50, help="Query incidents per family")
+    parser.add_argument("--seed", type=int, default=BENCH_SEED)
+    args = parser.parse_args()
+
+    stored, probes = build_incident_set(args.references, args.queries, args.seed)
+    print(f"{len(stored)} stored incidents ({len(FAMILIES)} families), {len(probes)} queries "
+          f"({len(HELD_OUT_FAMILIES)} held-out families)")
+    for name, embed in (("shingle", incident_embedding), ("sha256", sha_embedding)):
+        print(f"\n[{name}]")
+        print(f"{'threshold':>10} {'hit rate':>9} {'false match':>12} {'embed us':>9}")
+        for row in run_benchmark(embed, stored, probes):
+            print(f"{row['threshold']:>10.2f} {row['hit_rate']:>9.1%} {row['false_match_rate']:>12.1%} "
+                  f"{row['embed_us']:>9.1f}")
+
+if __name__ == "__main__":
+    main()
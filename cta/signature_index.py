@@ -0,0 +1,376 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SIGNATURE_INDEX_PATH = os.getenv("SIGNATURE_INDEX_PATH", os.path.join("data", "signature_index"))
+
+# How often (seconds) lookups re-stat the files for signatures other processes appended
+SIGNATURE_REFRESH_INTERVAL_S = float(os.getenv("SIGNATURE_REFRESH_INTERVAL_S", "1.0"))
+
+# An exact scan over 128-d rows (EMBEDDING_DIM) stays under a millisecond up
+# to ~25k signatures (~1.4ms at 50k); past that, random-hyperplane LSH
+# narrows each query to a few buckets. With 8 tables of 12 bits probed at
+# Hamming distance <= 1, a match at cosine 0.85 is a candidate ~96% of the time
+LSH_MIN_ENTRIES = int(os.getenv("SIGNATURE_LSH_MIN_ENTRIES", "25000"))
+LSH_TABLES = 8
+LSH_BITS = 12
+LSH_SEED = 7
+
+class _LSHTables:
+    """Random-hyperplane (SimHash) buckets over normalized rows, probed at Hamming distance <= 1"""
+
+    def __init__(self, dim: int, tables: int = LSH_TABLES, bits: int = LSH_BITS, seed: int = LSH_SEED):
+        rng = np.random.default_rng(seed)
+        self.tables, self.bits = tables, bits
+        self.planes = rng.standard_normal((dim, tables * bits)).astype(np.float32)
+        self.weights = (1 << np.arange(bits)).astype(np.int64)
+        self.buckets: List[Dict[int, List[int]]] = [{} for _ in range(tables)]
+        self.flips = [0] + [1 << b for b in range(bits)]
+
+    def _codes(self, vectors: np.ndarray) -> np.ndarray:
+        # (tables, n) integer codes
+        signs = (vectors @ self.planes > 0).reshape(len(vectors), self.tables, self.bits)
+        return (signs @ self.weights).T
+
+    def add(self, rows: np.ndarray, start: int):
+        codes = self._codes(rows)
+        for table, table_codes in zip(self.buckets, codes):
+            for offset, code in enumerate(table_codes.tolist()):
+                table.setdefault(code, []).append(start + offset)
+
+    def candidates(self, query: np.ndarray, alive: np.ndarray) -> np.ndarray:
+        """Live rows sharing a probed bucket with the query, in row order"""
+        codes = self._codes(query[None, :])[:, 0].tolist()
+        found = []
+        for table, code in zip(self.buckets, codes):
+            for flip in self.flips:
+                bucket = table.get(code ^ flip)
+                if bucket:
+                    found.extend(bucket)
+        # Dedupe through a row mask; cheaper than sorting the candidate list
+        mask = np.zeros(len(alive), dtype=bool)
+        mask[found] = True
+        return np.flatnonzero(mask & alive)
+
+class SignatureIndex:
+    """In-process nearest-neighbour index over incident signature embeddings.
+
+    Embeddings live L2-normalized in one contiguous float32 matrix, so a
+    lookup is a single matrix-vector product (or a product over LSH
+    candidates once the index is large). On disk the index is two append-only
+    files: raw float32 rows (`.f32`) and one JSON metadata line per row
+    (`.jsonl`). Re-adding an id appends a new row and retires the old one.
+    """
+
+    def __init__(self, path: str = SIGNATURE_INDEX_PATH, dim: Optional[int] = None,
+                 refresh_interval_s: float = SIGNATURE_REFRESH_INTERVAL_S, lsh_min_entries: int = LSH_MIN_ENTRIES):
+        self.path = path
+        self.expected_dim = dim
+        self.refresh_interval_s = refresh_interval_s
+        self.lsh_min_entries = lsh_min_entries
+        self.lock = threading.Lock()
+        self.dim = dim
+        self._reset()
+        self.load()
+
+    @property
+    def _rows_path(self) -> str:
+        return self.path + ".f32"
+
+    @property
+    def _meta_path(self) -> str:
+        return self.path + ".jsonl"
+
+    def _reset(self):
+        self._matrix = np.zeros((0, self.dim or 0), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._meta: List[Optional[dict]] = []
+        self._by_id: Dict[str, int] = {}
+        self._lsh: Optional[_LSHTables] = None
+        self._meta_offset = 0
+        self._next_check = 0.0
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def _ensure_capacity(self, extra: int):
+        needed = self._size + extra
+        if needed <= len(self._matrix):
+            return
+        capacity = max(needed, 2 * len(self._matrix), 64)
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._matrix, self._alive = matrix, alive
+
+    def _install(self, records: List[dict], rows: np.ndarray):
+        """Append already-persisted rows to the in-memory matrix"""
+        if not records:
+            return
+        if self.dim is None:
+            self.dim = rows.shape[1]
+        if self._matrix.shape[1] != self.dim:
+            self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+        self._ensure_capacity(len(records))
+
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        start = self._size
+        self._matrix[start:start + len(records)] = rows / norms
+        self._alive[start:start + len(records)] = True
+        for offset, record in enumerate(records):
+            previous = self._by_id.get(record["id"])
+            if previous is not None:
+                self._alive[previous] = False
+                self._meta[previous] = None
+            self._by_id[record["id"]] = start + offset
+            self._meta.append(record)
+        self._size += len(records)
+
+        if self._lsh is not None:
+            self._lsh.add(self._matrix[start:self._size], start)
+        elif len(self._by_id) >= self.lsh_min_entries:
+            self._lsh = _LSHTables(self.dim)
+            self._lsh.add(self._matrix[:self._size], 0)
+
+    def _read_new(self):
+        # Metadata lines are written after their rows, so every complete
+        # line read here has its row on disk
+        try:
+            with open(self._meta_path, 'rb') as f:
+                f.seek(self._meta_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return
+        records = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        self._meta_offset += end
+
+        dim = records[0]["dim"]
+        if self.dim is not None and dim != self.dim:
+            raise ValueError(f"Signature index {self.path} holds {dim}-d rows, expected {self.dim}")
+        first_row = records[0]["row"]
+        count = records[-1]["row"] - first_row + 1
+        rows = np.fromfile(self._rows_path, dtype=np.float32, count=count * dim, offset=first_row * dim * 4)
+        rows = rows.reshape(count, dim)[[r["row"] - first_row for r in records]]
+        self._install(records, rows)
+
+    def load(self):
+        with self.lock:
+            self.dim = self.expected_dim
+            self._reset()
+            self._read_new()
+            self._next_check = time.monotonic() + self.refresh_interval_s
+
+    def refresh(self, force: bool = False) -> bool:
+        """Pick up signatures appended by other processes. Returns True if any were read"""
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return False
+        self._next_check = now + self.refresh_interval_s
+        try:
+            size = os.path.getsize(self._meta_path)
+        except FileNotFoundError:
+            return False
+        if size == self._meta_offset:
+            return False
+        with self.lock:
+            before = self._size
+            self._read_new()
+            return self._size > before
+
+    def add(self, signature: dict):
+        """Persist a signature ({"id", "cause_label", "embedding", "patch_text"}) and index it"""
+        self.add_many([signature])
+
+    def add_many(self, signatures: List[dict]):
+        if not signatures:
+            return
+        rows = np.asarray([s["embedding"] for s in signatures], dtype=np.float32)
+        if rows.ndim != 2 or (self.dim is not None and rows.shape[1] != self.dim):
+            raise ValueError(f"Embeddings must be {self.dim or 'equal'}-dimensional")
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self._meta_path, 'ab') as meta_file:
+            if fcntl is not None:
+                fcntl.flock(meta_file, fcntl.LOCK_EX)
+            try:
+                with self.lock:
+                    # Catch up first so our rows land after everyone else's
+                    self._read_new()
+                    dim = rows.shape[1]
+                    first_row = os.path.getsize(self._rows_path) // (dim * 4) if os.path.exists(self._rows_path) else 0
+                    with open(self._rows_path, 'ab') as rows_file:
+                        rows_file.write(rows.tobytes())
+                        rows_file.flush()
+                        os.fsync(rows_file.fileno())
+                    records = [{
+                        "id": s["id"],
+                        "cause_label": s.get("cause_label", ""),
+                        "patch_text": s.get("patch_text", ""),
+                        "dim": dim,
+                        "row": first_row + i
+                    } for i, s in enumerate(signatures)]
+                    payload = "".join(json.dumps(r) + "\n" for r in records).encode()
+                    meta_file.write(payload)
+                    meta_file.flush()
+                    self._install(records, rows)
+                    self._meta_offset += len(payload)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(meta_file, fcntl.LOCK_UN)
+
+    def _normalize(self, embedding) -> Optional[np.ndarray]:
+        query = np.asarray(embedding, dtype=np.float32)
+        if self.dim is None or query.shape != (self.dim,):
+            return None
+        norm = np.linalg.norm(query)
+        return query / norm if norm > 0 else None
+
+    def _snapshot(self, query: Optional[np.ndarray] = None):
+        """(matrix, alive, LSH candidates) as of now, safe to use outside the lock.
+
+        add() may swap in a larger matrix or retire rows meanwhile; rows
+        below the snapshot's size are never rewritten, so the matrix view
+        stays valid and only the alive mask is copied.
+        """
+        with self.lock:
+            size = self._size
+            alive = self._alive[:size].copy()
+            candidates = None
+            if query is not None and self._lsh is not None:
+                candidates = self._lsh.candidates(query, alive)
+            return self._matrix[:size], alive, candidates
+
+    def _matches(self, rows: np.ndarray, similarities: np.ndarray, top: List[int], threshold: float) -> List[dict]:
+        matches = []
+        with self.lock:
+            for i in top:
+                similarity = float(similarities[i])
+                if similarity < threshold:
+                    break
+                meta = self._meta[int(rows[i])]
+                if meta is None:
+                    # Re-added since the snapshot; its newer row was not scanned
+                    continue
+                matches.append({"id": meta["id"], "cause_label": meta["cause_label"],
+                                "patch_text": meta["patch_text"], "similarity": similarity})
+        return matches
+
+    def search(self, embedding, k: int = 1, threshold: float = 0.0) -> List[dict]:
+        """Top-k signatures by cosine similarity, best first, with similarity >= threshold"""
+        self.refresh()
+        query = self._normalize(embedding)
+        if query is None or not self._by_id:
+            return []
+
+        matrix, alive, rows = self._snapshot(query)
+        # An empty probe falls back to the exact scan
+        if rows is None or len(rows) == 0:
+            rows = np.arange(len(matrix))
+            similarities = matrix @ query
+            similarities[~alive] = -np.inf
+            k = min(k, int(alive.sum()))
+        else:
+            similarities = matrix[rows] @ query
+        if k <= 0:
+            return []
+        if len(rows) > k:
+            top = np.argpartition(-similarities, k - 1)[:k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-similarities[top])]
+        return self._matches(rows, similarities, top.tolist(), threshold)
+
+    def search_batch(self, embeddings, k: int = 1, threshold: float = 0.0) -> List[List[dict]]:
+        """Exact top-k for many queries with one matrix product"""
+        self.refresh()
+        queries = np.asarray(embeddings, dtype=np.float32)
+        if self.dim is None or not self._by_id or queries.ndim != 2 or queries.shape[1] != self.dim:
+            return [[] for _ in range(len(queries))]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+
+        matrix, alive, _ = self._snapshot()
+        rows = np.arange(len(matrix))
+        similarities = (queries / norms) @ matrix.T
+        similarities[:, ~alive] = -np.inf
+        k = min(k, int(alive.sum()))
+        top = np.argsort(-similarities, axis=1)[:, :k]
+        return [self._matches(rows, similarities[q], row_top, threshold) for q, row_top in enumerate(top.tolist())]
+
+    def find_similar(self, embedding, threshold: float = 0.85) -> Optional[dict]:
+        """Best match at or above threshold, shaped like find_similar_signature's result"""
+        matches = self.search(embedding, k=1, threshold=threshold)
+        return matches[0] if matches else None
+
+    def sync_from(self, signatures: List[dict]) -> int:
+        """Add signatures (e.g. from ClickHouse) whose ids are not indexed yet. Returns how many"""
+        new = [s for s in signatures if s.get("id") not in self._by_id
+               and self.dim in (None, len(s.get("embedding") or []))]
+        self.add_many(new)
+        return len(new)
+
+    def get_status(self) -> dict:
+        return {
+            "signatures": len(self._by_id),
+            "rows": self._size,
+            "dim": self.dim,
+            "lsh": self._lsh is not None
+        }
+
+_indexes: Dict[int, SignatureIndex] = {}
+
+def get_signature_index(dim: int) -> SignatureIndex:
+    """Shared index for `dim`-wide embeddings. Each width gets its own files,
+    so changing the embedding starts a fresh index instead of mixing rows"""
+    if dim not in _indexes:
+        _indexes[dim] = SignatureIndex(f"{SIGNATURE_INDEX_PATH}.{dim}d", dim=dim)
+    return _indexes[dim]
+
+def migrate_unsuffixed(index: SignatureIndex, reembed: Callable[[dict], Optional[List[float]]],
+                       legacy_path: str = SIGNATURE_INDEX_PATH) -> int:
+    """Move signatures out of the unsuffixed files written before indexes were split by width.
+
+    Their rows came from an older embedding, so each record's embedding is
+    recomputed with reembed (None drops the record) and added to index; the
+    legacy files are then removed. Returns how many signatures moved.
+    """
+    meta_path = legacy_path + ".jsonl"
+    if not os.path.exists(meta_path):
+        return 0
+    records: Dict[str, dict] = {}
+    with open(meta_path, 'r') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                # A re-added id supersedes its earlier rows
+                records[record["id"]] = record
+
+    signatures = []
+    for record in records.values():
+        embedding = reembed(record)
+        if embedding is not None:
+            signatures.append({"id": record["id"], "cause_label": record.get("cause_label", ""),
+                               "embedding": embedding, "patch_text": record.get("patch_text", "")})
+    moved = index.sync_from(signatures)
+
+    for path in (meta_path, legacy_path + ".f32"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return moved
@@ -0,0 +1,120 @@
+import hashlib
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+# Width of incident embeddings. Feature collisions put a floor of roughly
+# (features per incident / EMBEDDING_DIM) under the similarity of unrelated
+# incidents, so this stays well above a typical incident's ~40 features
+EMBEDDING_DIM = 128
+
+# How many items of each tool output contribute field names
+FIELD_SAMPLE = 8
+
+# Shingle weights: what went wrong counts for more than how the run was shaped.
+# Fields of the failing record are mostly the same across failure classes, so
+# they carry little weight each
+STRUCTURE_WEIGHT = 0.5
+TOOL_WEIGHT = 1.0
+FIELD_WEIGHT = 1.0
+ERROR_FIELD_WEIGHT = 0.5
+ERROR_WORD_WEIGHT = 1.0
+ERROR_MESSAGE_WEIGHT = 3.0
+
+# Ids, hashes and numbers vary between otherwise identical incidents
+_VOLATILE = re.compile(r"0x[0-9a-fA-F]+|(?<![0-9A-Za-z])(?=[a-fA-F]*\d)[0-9a-fA-F]{8,}(?![0-9A-Za-z])|\d+(?:\.\d+)?")
+_WORD = re.compile(r"[A-Za-z_#]+")
+
+def normalize_message(message: str) -> str:
+    return _VOLATILE.sub("#", str(message)).strip()
+
+def _add(features: Dict[str, float], feature: str, weight: float):
+    if weight > features.get(feature, 0.0):
+        features[feature] = weight
+
+def _add_fields(features: Dict[str, float], prefix: str, items, weight: float):
+    for item in items[:FIELD_SAMPLE]:
+        if isinstance(item, dict):
+            for key in item:
+                _add(features, f"{prefix}:{key}", weight)
+
+class IncidentFeatures:
+    """Weighted shingles describing an incident, built one event at a time.
+
+    Shingles cover event types and type bigrams, agents and tools, the field
+    names each tool returned, and error messages (whole, with ids and numbers
+    masked, and word by word) along with the fields of the record that
+    failed. Each shingle is counted once, so a run with fifty identical
+    errors looks like a run with three.
+    """
+
+    def __init__(self):
+        self.features: Dict[str, float] = {}
+        self.previous_type = "^"
+
+    def observe(self, event: dict):
+        features = self.features
+        event_type = event.get("type", "")
+        _add(features, f"type:{event_type}", STRUCTURE_WEIGHT)
+        _add(features, f"seq:{self.previous_type}>{event_type}", STRUCTURE_WEIGHT)
+        self.previous_type = event_type
+
+        if event_type == "step":
+            _add(features, f"agent:{event.get('agent', '')}", STRUCTURE_WEIGHT)
+
+        elif event_type == "tool":
+            tool = event.get("tool", "")
+            _add(features, f"tool:{tool}", TOOL_WEIGHT)
+            output = event.get("output")
+            if isinstance(output, list):
+                _add_fields(features, f"field:{tool}", output, FIELD_WEIGHT)
+                if not output:
+                    _add(features, f"empty:{tool}", TOOL_WEIGHT)
+
+        elif event_type == "error":
+            message = normalize_message(event.get("message", ""))
+            _add(features, f"error:{message}", ERROR_MESSAGE_WEIGHT)
+            for word in _WORD.findall(message):
+                _add(features, f"word:{word}", ERROR_WORD_WEIGHT)
+
+            context = event.get("context", {})
+            if isinstance(context, dict):
+                if context.get("agent"):
+                    _add(features, f"error_agent:{context['agent']}", STRUCTURE_WEIGHT)
+                for record_key in ("event", "tx"):
+                    record = context.get(record_key)
+                    if isinstance(record, dict):
+                        _add_fields(features, "error_field", [record], ERROR_FIELD_WEIGHT)
+
+def incident_features(events: Iterable[dict]) -> Dict[str, float]:
+    """Weighted shingles describing an incident, in one pass over its events (see IncidentFeatures)"""
+    accumulator = IncidentFeatures()
+    for event in events:
+        accumulator.observe(event)
+    return accumulator.features
+
+@lru_cache(maxsize=65536)
+def _bucket(feature: str, dim: int) -> int:
+    digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % dim
+
+def embed_features(features: Dict[str, float], dim: int = EMBEDDING_DIM) -> List[float]:
+    """Fold weighted shingles into a unit vector with a stable hash.
+
+    This is the hashing trick: cosine similarity between two embeddings
+    tracks the weighted overlap of the two shingle sets, so incidents that
+    differ by a field or an extra event stay close instead of landing on
+    unrelated vectors.
+    """
+    vector = np.zeros(dim)
+    for feature, weight in features.items():
+        vector[_bucket(feature, dim)] += weight
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector.tolist()
+
+def incident_embedding(events: List[dict], dim: int = EMBEDDING_DIM) -> List[float]:
+    return embed_features(incident_features(events), dim)
@@ -0,0 +1,150 @@
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+PROFILE_DIR = os.getenv("CTA_PROFILE_DIR", os.path.join("data", "profiles"))
+# Run ids whose analysis is always profiled ("*" for every run), e.g. CTA_PROFILE_RUNS=run_ab12,run_cd34
+PROFILE_RUNS = {r for r in os.getenv("CTA_PROFILE_RUNS", "").split(",") if r}
+PROFILE_MODES = ("cprofile", "sample")
+SAMPLE_INTERVAL_S = 0.005
+PROFILE_TOP = 15
+
+def profile_mode_for(run_id: str, requested: Optional[str] = None) -> Optional[str]:
+    """The profiler to attach to a run's analysis: the requested one, or cProfile if CTA_PROFILE_RUNS lists it"""
+    if requested:
+        if requested not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {requested}")
+        return requested
+    if "*" in PROFILE_RUNS or run_id in PROFILE_RUNS:
+        return "cprofile"
+    return None
+
+class StackSampler:
+    """Samples one thread's stack every interval_s and counts the collapsed stacks.
+
+    Cheap enough to leave on for a whole analysis, and unlike cProfile it
+    shows where time goes while the thread is blocked (LLM calls, DB
+    waits).
+    """
+
+    def __init__(self, thread_id: int, interval_s: float = SAMPLE_INTERVAL_S):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format flamegraph tools read"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit: int = PROFILE_TOP) -> list:
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return [{"function": name, "samples": count, "share": count / self.samples}
+                for name, count in leaves.most_common(limit)]
+
+class SpanTimer:
+    """Wall-clock durations of the named stages of one operation.
+
+    Spans with the same name add up, so a stage entered several times (e.g.
+    Datadog sends) reports its total. With profile set to "cprofile" or
+    "sample", the calling thread is profiled from construction to finish()
+    and the capture is written under PROFILE_DIR.
+    """
+
+    def __init__(self, name: str, run_id: Optional[str] = None, profile: Optional[str] = None):
+        self.name = name
+        self.run_id = run_id
+        self.profile = profile
+        self.stages: Dict[str, float] = {}
+        self.t0 = time.perf_counter()
+        self.total_s: Optional[float] = None
+        self.profile_info: Optional[dict] = None
+        self._profiler = None
+        if profile == "cprofile":
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError:
+                # Another profiler already owns this thread
+                self._profiler = None
+        elif profile == "sample":
+            self._profiler = StackSampler(threading.get_ident())
+            self._profiler.start()
+
+    @contextmanager
+    def span(self, stage: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0.0) + time.perf_counter() - t0
+
+    def finish(self) -> dict:
+        """Stop the clock (and any profiler) and return the timings"""
+        if self.total_s is None:
+            self.total_s = time.perf_counter() - self.t0
+            if self._profiler is not None:
+                self.profile_info = self._save_profile()
+        return self.as_dict()
+
+    def _save_profile(self) -> dict:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f"{self.run_id or 'anon'}.{self.name}.{int(time.time())}")
+        if isinstance(self._profiler, StackSampler):
+            self._profiler.stop()
+            path = base + ".collapsed.txt"
+            with open(path, "w") as f:
+                f.write(self._profiler.collapsed())
+            return {"mode": "sample", "path": path, "samples": self._profiler.samples, "top": self._profiler.top()}
+
+        self._profiler.disable()
+        path = base + ".prof"
+        self._profiler.dump_stats(path)
+        stats = pstats.Stats(self._profiler)
+        top = []
+        for (filename, _, function), (_, calls, _, cumulative, _) in sorted(
+                stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]:
+            top.append({"function": f"{os.path.basename(filename)}:{function}", "calls": calls,
+                        "cumulative_s": cumulative})
+        return {"mode": "cprofile", "path": path, "top": top}
+
+    def as_dict(self) -> dict:
+        total = self.total_s if self.total_s is not None else time.perf_counter() - self.t0
+        timings = {
+            "total_s": total,
+            "stages": dict(self.stages),
+            "other_s": max(0.0, total - sum(self.stages.values()))
+        }
+        if self.profile_info:
+            timings["profile"] = self.profile_info
+        return timings
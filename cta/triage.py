@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from trace.store import list_runs, get_run, load_events_many, save_metric
+from .analyze import cta_analyze, get_cached_analysis, save_analysis
+from .signatures import incident_embedding
+
+# Runs in the same cluster share one analysis; same bar as the signature cache
+TRIAGE_MATCH_THRESHOLD = float(os.getenv("CTA_TRIAGE_THRESHOLD", "0.85"))
+TRIAGE_WORKERS = int(os.getenv("CTA_TRIAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Below this many runs per worker, process start-up costs more than it saves
+TRIAGE_SHARD_MIN = 1000
+
+DEFAULT_FAILURE_TEXT = "Unknown failure"
+
+def _signature_shard(run_ids: List[str]) -> List[Tuple[str, List[float]]]:
+    events = load_events_many(run_ids)
+    return [(run_id, incident_embedding(events[run_id])) for run_id in run_ids]
+
+def compute_signatures(run_ids: List[str], workers: int = TRIAGE_WORKERS) -> Dict[str, List[float]]:
+    """Incident embedding of each run, sharded across processes for large batches"""
+    workers = max(1, min(workers, len(run_ids) // TRIAGE_SHARD_MIN))
+    if workers == 1:
+        return dict(_signature_shard(run_ids))
+    shard_size = -(-len(run_ids) // workers)
+    shards = [run_ids[start:start + shard_size] for start in range(0, len(run_ids), shard_size)]
+    with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+        return {run_id: embedding for shard in pool.map(_signature_shard, shards) for run_id, embedding in shard}
+
+def cluster_runs(runs: List[dict], signatures: Dict[str, List[float]],
+                 threshold: float = TRIAGE_MATCH_THRESHOLD) -> List[dict]:
+    """Greedy leader clustering: each run joins the most similar cluster leader with the
+    same failure text if that similarity reaches threshold, otherwise it leads a new cluster.
+
+    Runs are visited oldest first, so the leader, which is the run that gets analyzed,
+    is the earliest occurrence of the incident.
+    """
+    clusters: List[dict] = []
+    leaders: Dict[str, Tuple[List[int], np.ndarray]] = {}
+    for run in sorted(runs, key=lambda r: r["started_at"]):
+        failure_text = run.get("fail_reason") or DEFAULT_FAILURE_TEXT
+        vector = np.asarray(signatures[run["id"]], dtype=np.float32)
+        cluster_ids, matrix = leaders.get(failure_text, ([], np.empty((0, len(vector)), dtype=np.float32)))
+
+        best, similarity = None, 0.0
+        if cluster_ids:
+            scores = matrix @ vector
+            # Runs without events have a zero signature; they only match each other
+            if not vector.any():
+                scores = np.where(~matrix.any(axis=1), 1.0, scores)
+            i = int(np.argmax(scores))
+            if scores[i] >= threshold:
+                best, similarity = cluster_ids[i], float(scores[i])
+
+        if best is None:
+            best = len(clusters)
+            clusters.append({
+                "cluster_id": best,
+                "failure_text": failure_text,
+                "representative": run["id"],
+                "members": [],
+                "similarity": {}
+            })
+            leaders[failure_text] = (cluster_ids + [best], np.vstack([matrix, vector]))
+            similarity = 1.0
+        clusters[best]["members"].append(run["id"])
+        clusters[best]["similarity"][run["id"]] = similarity
+    return clusters
+
+# Step ids the detectors derive from an event's idx, e.g. "tool_5"
+_IDX_STEP_ID = re.compile(r"^(step|tool|error)_(\d+)$")
+
+def _step_index(events: List[dict]) -> dict:
+    """Locate each event of a run as (type, agent or tool, occurrence), so the
+    same step can be found in another run whose events are numbered differently"""
+    seen = Counter()
+    index = {"by_idx": {}, "by_step_id": {}, "at": {}}
+    for evt in events:
+        name = evt.get("agent") or evt.get("tool") or (evt.get("context") or {}).get("agent")
+        kind = (evt.get("type"), name)
+        location = kind + (seen[kind],)
+        seen[kind] += 1
+        index["by_idx"][evt.get("idx")] = location
+        index["at"][location] = evt
+        if evt.get("step_id"):
+            index["by_step_id"][evt["step_id"]] = location
+    return index
+
+def _map_step_id(step_id: str, source: dict, target: dict) -> Optional[str]:
+    """The id of target's step matching step_id in source; None if target has no such step.
+    Ids that name no step of source (e.g. "cached") are returned unchanged."""
+    match = _IDX_STEP_ID.match(step_id)
+    if match:
+        location = source["by_idx"].get(int(match.group(2)))
+        evt = target["at"].get(location) if location else None
+        return f"{match.group(1)}_{evt.get('idx')}" if evt else None
+    if step_id in source["by_step_id"]:
+        evt = target["at"].get(source["by_step_id"][step_id])
+        return evt.get("step_id") if evt else None
+    return step_id
+
+def _share_report(report: dict, run_id: str, cluster: dict, elapsed_s: float,
+                  source: dict, target: dict) -> dict:
+    """The representative's report for member run_id, its step ids mapped through the
+    step indexes of the two runs; ids with no matching step are dropped and listed under triage"""
+    unmapped = []
+
+    def remap(step_id):
+        if not step_id:
+            return step_id
+        mapped = _map_step_id(step_id, source, target)
+        if mapped is None:
+            unmapped.append(step_id)
+        return mapped
+
+    shared = dict(report)
+    # The stage timings belong to the representative's analysis
+    shared.pop("timings", None)
+    shared["run_id"] = run_id
+    shared["analysis_time_s"] = elapsed_s
+    shared["primary_cause_step_id"] = remap(report.get("primary_cause_step_id"))
+    if "evidence" in report:
+        evidence = []
+        for item in report["evidence"]:
+            step_id = remap(item.get("step_id"))
+            if step_id is not None or not item.get("step_id"):
+                evidence.append(dict(item, step_id=step_id) if step_id else item)
+        shared["evidence"] = evidence
+    if "alternatives" in report:
+        shared["alternatives"] = [dict(alt, primary_cause_step_id=remap(alt.get("primary_cause_step_id")))
+                                  for alt in report["alternatives"]]
+    shared["triage"] = {
+        "cluster_id": cluster["cluster_id"],
+        "representative_run_id": cluster["representative"],
+        "representative_primary_cause_step_id": report.get("primary_cause_step_id"),
+        "cluster_size": len(cluster["members"]),
+        "similarity": cluster["similarity"][run_id]
+    }
+    if unmapped:
+        shared["triage"]["unmapped_step_ids"] = unmapped
+    return shared
+
+def triage_failed_runs(run_ids: Optional[List[str]] = None, limit: Optional[int] = None,
+                       threshold: float = TRIAGE_MATCH_THRESHOLD, workers: int = TRIAGE_WORKERS,
+                       use_cache: bool = True, analyze: Callable[..., dict] = cta_analyze) -> dict:
+    """Analyze a batch of failed runs with one CTA analysis per distinct incident.
+
+    Runs (by default every run with status 'failed') are clustered by
+    incident signature; only each cluster's representative goes through
+    analyze (cta_analyze), and its report is stored for every other member with a
+    `triage` section naming the representative. Step ids in the shared report
+    point at the member's matching step (same type, agent or tool, and
+    occurrence); those without one are dropped and listed under `triage`. Members record as MTTR the
+    time from the start of triage until their report was stored. With
+    use_cache, a member that already has a report for its events keeps it.
+    """
+    t0 = time.time()
+    if run_ids is None:
+        runs = list_runs(status="failed", limit=limit)
+    else:
+        runs = [run for run in (get_run(run_id) for run_id in run_ids[:limit]) if run]
+    if not runs:
+        return {"runs": 0, "clusters": [], "analyses": 0, "shared": 0, "kept": 0, "total_time_s": 0.0}
+
+    signatures = compute_signatures([run["id"] for run in runs], workers)
+    signature_time = time.time() - t0
+    clusters = cluster_runs(runs, signatures, threshold)
+
+    def analyze_cluster(cluster: dict) -> dict:
+        return analyze(cluster["representative"], cluster["failure_text"], use_cache=use_cache)
+
+    t1 = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(clusters)))) as pool:
+        reports = list(pool.map(analyze_cluster, clusters))
+    analysis_time = time.time() - t1
+
+    shared = kept = 0
+    summaries = []
+    for cluster, report in zip(clusters, reports):
+        pending = []
+        for run_id in cluster["members"]:
+            if run_id == cluster["representative"]:
+                continue
+            if use_cache and get_cached_analysis(run_id, cluster["failure_text"]) is not None:
+                kept += 1
+                continue
+            pending.append(run_id)
+
+        # Step ids in the report are the representative's; map them onto each member
+        events = load_events_many([cluster["representative"]] + pending) if pending else {}
+        source = _step_index(events.get(cluster["representative"], []))
+        for run_id in pending:
+            elapsed = time.time() - t0
+            shared_report = _share_report(report, run_id, cluster, elapsed, source, _step_index(events[run_id]))
+            save_analysis(run_id, cluster["failure_text"], shared_report)
+            save_metric(run_id, "mttr_cta_s", elapsed)
+            save_metric(run_id, "mttr_human_s", 150.0)
+            shared += 1
+        summaries.append({
+            "cluster_id": cluster["cluster_id"],
+            "failure_text": cluster["failure_text"],
+            "representative": cluster["representative"],
+            "size": len(cluster["members"]),
+            "members": cluster["members"],
+            "method": report.get("method"),
+            "primary_cause_step_id": report.get("primary_cause_step_id"),
+            "confidence": report.get("confidence")
+        })
+
+    return {
+        "runs": len(runs),
+        "clusters": summaries,
+        "analyses": len(clusters),
+        "shared": shared,
+        "kept": kept,
+        "signature_time_s": signature_time,
+        "analysis_time_s": analysis_time,
+        "total_time_s": time.time() - t0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Triage failed runs: cluster by incident signature, analyze one run per cluster")
+    parser.add_argument("--run", action="append", dest="run_ids", help="Triage this run (repeatable); default all failed runs")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--threshold", type=float, default=TRIAGE_MATCH_THRESHOLD)
+    parser.add_argument("--workers", type=int, default=TRIAGE_WORKERS)
+    parser.add_argument("--refresh", action="store_true", help="Re-analyze runs that already have a report")
+    parser.add_argument("--json", action="store_true", help="Print the full result as JSON")
+    args = parser.parse_args()
+
+    result = triage_failed_runs(args.run_ids, args.limit, args.threshold, args.workers, not args.refresh)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"[OK] {result['runs']} failed run(s) -> {result['analyses']} cluster(s) analyzed, "
+          f"{result['shared']} report(s) shared, {result['kept']} kept, {result['total_time_s']:.2f}s")
+    for cluster in result["clusters"]:
+        print(f"  #{cluster['cluster_id']} x{cluster['size']} {cluster['failure_text']!r} -> "
+              f"{cluster['primary_cause_step_id']} ({cluster['method']}, {cluster['confidence']}) "
+              f"rep={cluster['representative']}")
+
+if __name__ == "__main__":
+    main()
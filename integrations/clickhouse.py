@@ -1,9 +1,13 @@
+import itertools
 import json
 import os
+import re
+import uuid
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import requests
 from requests.auth import HTTPBasicAuth
+from trace.quantiles import QuantileSketch
 
 CLICKHOUSE_AVAILABLE = False
 try:
@@ -13,6 +17,19 @@ except ImportError:
     pass
 
 MOCK_EVENTS_STORE = []
+# Insert order of mock events, the tiebreak for get_events_after
+_MOCK_SEQ = itertools.count(1)
+# The mock store and its keys only live as long as this process
+MOCK_STORE_ID = uuid.uuid4().hex
+MOCK_EVENTS_LIMIT = 1000
+MOCK_AUDIT_RESULTS = []
+MOCK_AUDIT_LIMIT = 10000
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*$")
+
+def _quote(value: str) -> str:
+    """ClickHouse string literal, for queries sent where bound parameters are unavailable"""
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
 
 class ClickHouseClient:
     def __init__(self):
@@ -105,6 +122,16 @@ class ClickHouseClient:
                 print(f"ClickHouse Cloud query error: {e}")
             return None
     
+    def _stream_cloud_query(self, query: str) -> Iterator[Dict[str, Any]]:
+        """Execute a query via the HTTP API, decoding JSONEachRow rows as they arrive; raises on failure"""
+        with requests.post(f"{self.cloud_host}?format=JSONEachRow", auth=self.cloud_auth,
+                           headers={"Content-Type": "application/json"}, json={"sql": query},
+                           stream=True, timeout=60) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+    
     def _init_tables(self):
         if self.use_mock or self.use_cloud:
             return
@@ -138,10 +165,11 @@ class ClickHouseClient:
             MOCK_EVENTS_STORE.append({
                 "ts": datetime.fromtimestamp(event.get("timestamp", event.get("ts", datetime.now().timestamp()))),
                 "id": event.get("id", ""),
-                "payload": json.dumps(event)
+                "payload": json.dumps(event),
+                "seq": next(_MOCK_SEQ)
             })
-            if len(MOCK_EVENTS_STORE) > 1000:
-                MOCK_EVENTS_STORE = MOCK_EVENTS_STORE[-1000:]
+            if len(MOCK_EVENTS_STORE) > MOCK_EVENTS_LIMIT:
+                del MOCK_EVENTS_STORE[:-MOCK_EVENTS_LIMIT]
         else:
             try:
                 ts = datetime.fromtimestamp(event.get("timestamp", event.get("ts", datetime.now().timestamp())))
@@ -152,9 +180,51 @@ class ClickHouseClient:
             except Exception:
                 pass
     
+    def insert_events(self, events: List[Dict[str, Any]]) -> bool:
+        """Insert a batch of events with a single call to the backend; False if it was not stored"""
+        if not events:
+            return True
+        
+        now = datetime.now().timestamp()
+        rows = [
+            (
+                datetime.fromtimestamp(event.get("timestamp", event.get("ts", now))),
+                event.get("id", ""),
+                json.dumps(event)
+            )
+            for event in events
+        ]
+        
+        if self.use_mock:
+            MOCK_EVENTS_STORE.extend({"ts": ts, "id": event_id, "payload": payload, "seq": next(_MOCK_SEQ)}
+                                     for ts, event_id, payload in rows)
+            if len(MOCK_EVENTS_STORE) > MOCK_EVENTS_LIMIT:
+                del MOCK_EVENTS_STORE[:-MOCK_EVENTS_LIMIT]
+            return True
+        
+        if self.client:
+            try:
+                self.client.execute("INSERT INTO events (ts, id, payload) VALUES", rows)
+                return True
+            except Exception as e:
+                print(f"[WARN] Could not insert events with native client: {e}")
+                return False
+        
+        if self.use_cloud and self.cloud_host:
+            body = "\n".join(
+                json.dumps({"ts": ts.strftime("%Y-%m-%d %H:%M:%S"), "id": event_id, "payload": payload})
+                for ts, event_id, payload in rows
+            )
+            return self._execute_cloud_query("INSERT INTO events FORMAT JSONEachRow\n" + body) is not None
+        
+        return False
+    
     def insert_audit_result(self, audit_result: Dict[str, Any]):
         """Insert audit result into ClickHouse"""
-        if self.use_cloud and self.cloud_host and not self.client:
+        if self.use_mock:
+            self.insert_audit_results([audit_result])
+        
+        elif self.use_cloud and self.cloud_host and not self.client:
             # Use HTTP Query API to insert into audit_results table
             try:
                 # Prepare audit result data
@@ -206,8 +276,63 @@ class ClickHouseClient:
             except Exception as e:
                 print(f"[WARN] Could not save audit result to native client: {e}")
     
+    def insert_audit_results(self, audit_results: List[Dict[str, Any]]) -> bool:
+        """Insert a batch of audit results with a single call to the backend"""
+        if not audit_results:
+            return True
+        
+        columns = ("timestamp", "event_id", "line_id", "component", "level", "is_anomaly", "reason", "latency_ms", "status")
+        
+        def _row(r):
+            return (
+                r.get("timestamp", datetime.now()),
+                r.get("event_id", ""),
+                int(r.get("line_id", 0) or 0),
+                r.get("component", ""),
+                r.get("level", ""),
+                1 if r.get("is_anomaly", False) else 0,
+                r.get("reason", ""),
+                int(r.get("latency_ms", 0) or 0),
+                int(r.get("status", 200) or 0)
+            )
+        
+        if self.use_mock:
+            MOCK_AUDIT_RESULTS.extend(dict(zip(columns, _row(r))) for r in audit_results)
+            if len(MOCK_AUDIT_RESULTS) > MOCK_AUDIT_LIMIT:
+                del MOCK_AUDIT_RESULTS[:-MOCK_AUDIT_LIMIT]
+            return True
+        
+        if self.client:
+            try:
+                self.client.execute(
+                    f"INSERT INTO audit_results ({', '.join(columns)}) VALUES",
+                    [_row(r) for r in audit_results]
+                )
+                return True
+            except Exception as e:
+                print(f"[WARN] Could not save audit results to native client: {e}")
+                return False
+        
+        if self.use_cloud and self.cloud_host:
+            lines = []
+            for r in audit_results:
+                row = dict(zip(columns, _row(r)))
+                if isinstance(row["timestamp"], datetime):
+                    row["timestamp"] = row["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
+                lines.append(json.dumps(row, default=str))
+            result = self._execute_cloud_query("INSERT INTO audit_results FORMAT JSONEachRow\n" + "\n".join(lines))
+            return result is not None
+        
+        return False
+    
     def get_audit_results(self, limit: int = 100, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """Fetch audit results from ClickHouse"""
+        if self.use_mock:
+            results = MOCK_AUDIT_RESULTS
+            if filters:
+                results = [r for r in results if all(r.get(k) == v for k, v in filters.items())]
+            return list(reversed(results[-limit:]))
+        
         if self.use_cloud and self.cloud_host and not self.client:
             query = "SELECT * FROM audit_results"
             
@@ -303,6 +428,50 @@ class ClickHouseClient:
         except Exception:
             return []
     
+    def get_events_after(self, after_ts: float, after_key: Optional[int] = None,
+                         limit: int = 1000) -> List[Dict[str, Any]]:
+        """Fetch events ordered by (ts, key) strictly after the (after_ts, after_key) cursor.
+
+        Rows are {"ts": epoch seconds, "key": int, "payload": json}; key
+        breaks ties between events with the same ts, so a caller resumes from
+        the last row it got without refetching. after_key None includes every
+        event at after_ts. The mock keys rows by insert order. ClickHouse has
+        no insert order, so there the key is a payload hash and only seconds
+        that have ended are returned, leaving none still filling up behind the
+        cursor.
+        """
+        if self.use_mock:
+            rows = [
+                {"ts": e["ts"].timestamp(), "key": e.get("seq", 0), "payload": e["payload"]}
+                for e in MOCK_EVENTS_STORE
+                if e["ts"].timestamp() >= after_ts
+            ]
+            if after_key is not None:
+                rows = [r for r in rows if (r["ts"], r["key"]) > (after_ts, after_key)]
+            rows.sort(key=lambda r: (r["ts"], r["key"]))
+            return rows[:limit]
+        
+        since = int(after_ts)
+        after = "" if after_key is None else f" AND (toUnixTimestamp(ts), cityHash64(payload)) > ({since}, {int(after_key)})"
+        query = (
+            "SELECT toUnixTimestamp(ts) AS ts, cityHash64(payload) AS key, payload FROM events "
+            f"WHERE ts >= toDateTime({since}) AND ts < now(){after} ORDER BY ts, key LIMIT {int(limit)}"
+        )
+        
+        if self.client:
+            try:
+                return [{"ts": float(row[0]), "key": int(row[1]), "payload": row[2]} for row in self.client.execute(query)]
+            except Exception as e:
+                print(f"[WARN] Could not fetch events after {after_ts}: {e}")
+                return []
+        
+        if self.use_cloud and self.cloud_host:
+            result = self._execute_cloud_query(query)
+            # 64-bit integers arrive quoted in JSONEachRow
+            return [{"ts": float(r["ts"]), "key": int(r["key"]), "payload": r["payload"]} for r in result] if result else []
+        
+        return []
+    
     def fetch_logs_from_cloud(self, table_name: str, limit: int = 100, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """Fetch logs from ClickHouse Cloud with optional filters"""
         if not self.use_cloud:
@@ -343,6 +512,30 @@ class ClickHouseClient:
             result = self._execute_cloud_query(query)
             return result if result else []
     
+    def iter_trace_page(self, run_id: str, after_idx: int, limit: int,
+                        table_name: str = "trace_events") -> Iterator[Tuple[int, str]]:
+        """(idx, payload) of a run's trace events with idx > after_idx, in idx order.
+
+        Only the two columns are read, and rows are yielded as they are
+        decoded rather than collected. Raises if the query fails.
+        """
+        if self.use_mock:
+            return
+        if not _IDENTIFIER.match(table_name):
+            raise ValueError(f"Invalid table name: {table_name}")
+        
+        if self.client:
+            query = (f"SELECT idx, payload FROM {table_name} "
+                     "WHERE run_id = %(run_id)s AND idx > %(after_idx)s ORDER BY idx LIMIT %(limit)s")
+            params = {"run_id": run_id, "after_idx": int(after_idx), "limit": int(limit)}
+            for idx, payload in self.client.execute_iter(query, params, settings={"max_block_size": int(limit)}):
+                yield int(idx), payload
+        elif self.cloud_host:
+            query = (f"SELECT idx, payload FROM {table_name} "
+                     f"WHERE run_id = {_quote(run_id)} AND idx > {int(after_idx)} ORDER BY idx LIMIT {int(limit)}")
+            for row in self._stream_cloud_query(query):
+                yield int(row["idx"]), row["payload"]
+    
     def insert_signature(self, signature: Dict[str, Any]):
         if self.use_mock:
             return
@@ -360,6 +553,21 @@ class ClickHouseClient:
         except Exception:
             pass
     
+    def get_signatures(self, limit: int = 100000) -> List[Dict[str, Any]]:
+        """All stored signatures, used to seed the local signature index"""
+        if self.use_mock:
+            return []
+        
+        query = f"SELECT id, cause_label, embedding, patch_text FROM signatures LIMIT {int(limit)}"
+        try:
+            if self.use_cloud and self.cloud_host and not self.client:
+                return self._execute_cloud_query(query) or []
+            rows = self.client.execute(query)
+            return [{"id": r[0], "cause_label": r[1], "embedding": list(r[2]), "patch_text": r[3]} for r in rows]
+        except Exception as e:
+            print(f"Error fetching signatures: {e}")
+            return []
+    
     def find_similar_signature(self, embedding: List[float], threshold: float = 0.85) -> Dict[str, Any]:
         if self.use_mock:
             return None
@@ -684,18 +892,35 @@ class ClickHouseClient:
 _client = None
 
 def get_client() -> ClickHouseClient:
+    """Return the shared client. CLICKHOUSE_BACKEND=local selects the embedded store"""
     global _client
     if _client is None:
-        _client = ClickHouseClient()
+        if os.getenv("CLICKHOUSE_BACKEND", "").lower() == "local":
+            from .local_store import LocalEventStore
+            _client = LocalEventStore()
+        else:
+            _client = ClickHouseClient()
     return _client
 
 def insert_event(event: Dict[str, Any]):
     get_client().insert_event(event)
 
+def insert_events(events: List[Dict[str, Any]]) -> bool:
+    """Insert a batch of events with a single call to the backend; False if it was not stored"""
+    return get_client().insert_events(events)
+
 def insert_audit_result(audit_result: Dict[str, Any]):
     """Insert audit result into ClickHouse"""
     get_client().insert_audit_result(audit_result)
 
+def insert_audit_results(audit_results: List[Dict[str, Any]]) -> bool:
+    """Insert a batch of audit results with a single call to the backend"""
+    return get_client().insert_audit_results(audit_results)
+
+def get_events_after(after_ts: float, after_key: Optional[int] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+    """Fetch events ordered by (ts, key) strictly after the (after_ts, after_key) cursor"""
+    return get_client().get_events_after(after_ts, after_key, limit)
+
 def get_audit_results(limit: int = 100, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
     """Fetch audit results from ClickHouse"""
     return get_client().get_audit_results(limit, filters)
@@ -706,12 +931,18 @@ def get_recent_events(limit: int = 20, table_name: str = None) -> List[Dict[str,
 def fetch_logs_from_cloud(table_name: str, limit: int = 100, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
     return get_client().fetch_logs_from_cloud(table_name, limit, filters)
 
+def iter_trace_page(run_id: str, after_idx: int, limit: int, table_name: str = "trace_events") -> Iterator[Tuple[int, str]]:
+    return get_client().iter_trace_page(run_id, after_idx, limit, table_name)
+
 def insert_signature(signature: Dict[str, Any]):
     get_client().insert_signature(signature)
 
 def find_similar_signature(embedding: List[float], threshold: float = 0.85) -> Dict[str, Any]:
     return get_client().find_similar_signature(embedding, threshold)
 
+def get_signatures(limit: int = 100000) -> List[Dict[str, Any]]:
+    return get_client().get_signatures(limit)
+
 def write_cta_result(result: Dict[str, Any]) -> bool:
     """Write CTA analysis and action results to ClickHouse"""
     return get_client().write_cta_result(result)
@@ -732,3 +963,42 @@ def get_comparison_stats(time_window: int = 3600) -> dict:
     """Compare logs and audit_results"""
     return get_client().get_comparison_stats(time_window)
 
+def summarize_audit_results(results: List[Dict[str, Any]]) -> dict:
+    """Aggregate fetched audit results in one pass with bounded memory"""
+    total = 0
+    anomalies = 0
+    status_4xx = 0
+    status_5xx = 0
+    by_component: Dict[str, int] = {}
+    by_level: Dict[str, int] = {}
+    latency_sketch = QuantileSketch()
+    
+    for r in results:
+        total += 1
+        if int(r.get('is_anomaly', 0) or 0) == 1:
+            anomalies += 1
+        status = int(r.get('status', 200) or 0)
+        if 400 <= status < 500:
+            status_4xx += 1
+        elif status >= 500:
+            status_5xx += 1
+        comp = r.get('component', 'unknown')
+        by_component[comp] = by_component.get(comp, 0) + 1
+        level = r.get('level', 'unknown')
+        by_level[level] = by_level.get(level, 0) + 1
+        latency_sketch.add(max(float(r.get('latency_ms', 0) or 0), 0.0))
+    
+    return {
+        "total_evaluated": total,
+        "anomalies_detected": anomalies,
+        "anomaly_rate": (anomalies / total * 100) if total > 0 else 0,
+        "latency_avg": latency_sketch.mean(),
+        "latency_p50": latency_sketch.quantile(0.50),
+        "latency_p95": latency_sketch.quantile(0.95),
+        "latency_p99": latency_sketch.quantile(0.99),
+        "status_4xx": status_4xx,
+        "status_5xx": status_5xx,
+        "error_rate": ((status_4xx + status_5xx) / total * 100) if total > 0 else 0,
+        "by_component": by_component,
+        "by_level": by_level
+    }
@@ -0,0 +1,216 @@
+import argparse
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+DEFAULT_REPORT = {
+    "primary_cause_step_id": "fake_step",
+    "symptoms": ["KeyError on Level"],
+    "evidence": [{"step_id": "fake_step", "excerpt": "'Level'"}],
+    "why_chain": ["Why 1", "Why 2", "Why 3", "Why 4", "Why 5"],
+    "confidence": 0.9,
+    "proposed_fix": {"tool_schema_patch": "map level->Level before Auditor", "test_case": "Level present"}
+}
+
+class FakeLLMServer:
+    """Local stand-in for an OpenAI-style /chat/completions endpoint.
+
+    Replies with `content` (by default a fenced JSON report followed by
+    trailing prose), either as one JSON body or as server-sent events of
+    `chunk_size` characters, after `latency_s` plus `chunk_delay_s` per
+    chunk. The first `fail_first` requests get `fail_status`, with a
+    Retry-After of `retry_after` if set. Speaks HTTP/1.1 keep-alive and
+    counts connections, so tests can check that clients reuse them.
+    """
+
+    def __init__(self, content: Optional[str] = None, latency_s: float = 0.0, chunk_size: int = 16,
+                 chunk_delay_s: float = 0.0, fail_first: int = 0, fail_status: int = 429,
+                 retry_after: Optional[str] = None, host: str = "127.0.0.1", port: int = 0):
+        self.content = content if content is not None else (
+            "```json\n" + json.dumps(DEFAULT_REPORT, indent=1) + "\n```\nLet me know if you need more detail.")
+        self.latency_s = latency_s
+        self.chunk_size = chunk_size
+        self.chunk_delay_s = chunk_delay_s
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chunks_sent = 0
+        self.bodies: List[dict] = []
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out in separate writes; without this,
+                # Nagle plus delayed ACKs stall every keep-alive response
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with server.lock:
+                    server.connections += 1
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (ConnectionResetError, BrokenPipeError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server.lock:
+                    server.requests += 1
+                    request_number = server.requests
+                    server.bodies.append(body)
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    if not self.path.endswith("/chat/completions"):
+                        self._send_json(404, {"error": {"message": "not found"}})
+                        return
+                    time.sleep(server.latency_s)
+                    if request_number <= server.fail_first:
+                        headers = {"Retry-After": server.retry_after} if server.retry_after else None
+                        self._send_json(server.fail_status, {"error": {"message": "injected failure"}}, headers)
+                        return
+                    if body.get("stream"):
+                        self._stream(body)
+                    else:
+                        self._send_json(200, {
+                            "id": f"fake-{request_number}",
+                            "model": body.get("model"),
+                            "choices": [{"index": 0, "message": {"role": "assistant", "content": server.content},
+                                         "finish_reason": "stop"}]
+                        })
+                finally:
+                    with server.lock:
+                        server.in_flight -= 1
+
+            def _stream(self, body: dict):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                content = server.content
+                try:
+                    for i in range(0, len(content), server.chunk_size):
+                        time.sleep(server.chunk_delay_s)
+                        event = {"choices": [{"index": 0, "delta": {"content": content[i:i + server.chunk_size]}}]}
+                        self._send_chunk(f"data: {json.dumps(event)}\n\n".encode())
+                        with server.lock:
+                            server.chunks_sent += 1
+                    self._send_chunk(b"data: [DONE]\n\n")
+                    self._send_chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading once it had what it needed
+                    self.close_connection = True
+
+        return Handler
+
+    def get_status(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "max_in_flight": self.max_in_flight,
+                "chunks_sent": self.chunks_sent
+            }
+
+def main():
+    """Load-test the pooled client against a local fake server, compared with a bare requests.post per call"""
+    import requests
+    from .llm import LLMClient
+
+    parser = argparse.ArgumentParser(description="Benchmark the LLM client against a local fake server")
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--fail-first", type=int, default=0, help="Answer the first N requests with 429")
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args()
+    messages = [{"role": "user", "content": "Analyze this run"}]
+
+    with FakeLLMServer(latency_s=args.latency_ms / 1000, fail_first=args.fail_first) as server:
+        def bare(_):
+            response = requests.post(f"{server.base_url}/chat/completions", json={"messages": messages}, timeout=30)
+            return response.status_code
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            statuses = list(pool.map(bare, range(args.requests)))
+        elapsed = time.perf_counter() - t0
+        status = server.get_status()
+        print(f"[bare requests.post] {args.requests} calls in {elapsed:.2f}s "
+              f"({args.requests / elapsed:,.0f}/s), {status['connections']} connections, "
+              f"{sum(s != 200 for s in statuses)} failed")
+
+    with FakeLLMServer(latency_s=args.latency_ms / 1000, fail_first=args.fail_first) as server:
+        client = LLMClient(api_key="fake", base_url=server.base_url, max_concurrency=args.concurrency,
+                           backoff_base_s=0.01)
+
+        def pooled(_):
+            return client.chat_json(messages, stream=args.stream)
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(pooled, range(args.requests)))
+        elapsed = time.perf_counter() - t0
+        status = server.get_status()
+        print(f"[LLMClient]          {args.requests} calls in {elapsed:.2f}s "
+              f"({args.requests / elapsed:,.0f}/s), {status['connections']} connections, "
+              f"{client.get_status()['retries']} retries")
+
+if __name__ == "__main__":
+    main()
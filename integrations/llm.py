@@ -0,0 +1,269 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .llm_cache import LLMResponseCache, cache_key, get_llm_cache
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.openai.com/v1")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "30"))
+# Streamed replies stop reading once the JSON object closes, but the
+# abandoned connection cannot go back to the pool
+LLM_STREAM = os.getenv("LLM_STREAM", "false").lower() == "true"
+
+# Worth another attempt: throttling, timeouts and server-side failures
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+class LLMError(RuntimeError):
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class JSONObjectScanner:
+    """Finds where the first top-level JSON object in a growing text ends.
+
+    Text is fed incrementally; braces inside strings (and escaped quotes) are
+    ignored. Anything before the first '{', such as a ```json fence, is
+    skipped.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.start = -1
+        self.end = -1
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> bool:
+        """Append chunk; True once the object is complete"""
+        self.text += chunk
+        text = self.text
+        while self.end < 0 and self._pos < len(text):
+            ch = text[self._pos]
+            if self.start < 0:
+                if ch == "{":
+                    self.start = self._pos
+                    self._depth = 1
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = self._pos + 1
+            self._pos += 1
+        return self.end >= 0
+
+    def result(self) -> str:
+        return self.text[self.start:self.end] if self.end >= 0 else self.text
+
+def extract_json(content: str) -> dict:
+    """Parse the first JSON object in a model reply, ignoring code fences and trailing prose"""
+    scanner = JSONObjectScanner()
+    scanner.feed(content)
+    return json.loads(scanner.result().strip())
+
+def _passes(validate: Optional[Callable[[str], Any]], content: str) -> bool:
+    if validate is None:
+        return True
+    try:
+        validate(content)
+    except Exception:
+        return False
+    return True
+
+class LLMClient:
+    """Chat-completions client shared by every caller in the process.
+
+    One keep-alive session holds the connection pool, a semaphore bounds how
+    many requests are in flight, and failed attempts (connection errors,
+    timeouts, RETRY_STATUSES) are retried with full-jitter exponential
+    backoff, honouring Retry-After. Every call has a deadline that covers
+    waiting for a slot, all attempts, the backoff between them and reading
+    a streamed reply; setting the optional cancel event stops the call at
+    the next of those points, freeing its slot. With a
+    cache, replies to a prompt already answered (after normalize_prompt)
+    are returned without a request.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = LLM_BASE_URL, model: Optional[str] = None,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, max_retries: int = LLM_MAX_RETRIES,
+                 timeout_s: float = LLM_TIMEOUT_S, backoff_base_s: float = 0.25, backoff_max_s: float = 4.0,
+                 cache: Optional[LLMResponseCache] = None):
+        self.api_key = api_key if api_key is not None else os.getenv("LLM_API_KEY")
+        self.base_url = base_url.rstrip("/")
+        self.model = model or os.getenv("MODEL_NAME", "gpt-4o-mini")
+        self.max_retries = max_retries
+        self.timeout_s = timeout_s
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.cache = cache
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self._rng = random.Random()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        if self.api_key:
+            self.session.headers["Authorization"] = f"Bearer {self.api_key}"
+
+        self.lock = threading.Lock()
+        self.total_requests = 0
+        self.total_retries = 0
+        self.total_failures = 0
+
+    def _backoff_s(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self._rng.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** attempt))
+
+    def _check_live(self, deadline: float, cancel: Optional[threading.Event]):
+        if cancel is not None and cancel.is_set():
+            raise LLMError("LLM request cancelled")
+        if time.monotonic() >= deadline:
+            raise LLMError("LLM request deadline exceeded")
+
+    def _read_stream(self, response, stop_on_json: bool, deadline: float,
+                     cancel: Optional[threading.Event] = None) -> str:
+        """Accumulate streamed deltas, closing the stream early once a JSON object is complete"""
+        scanner = JSONObjectScanner()
+        for line in response.iter_lines(decode_unicode=True):
+            # The read timeout only bounds each chunk, not a slow trickle of them
+            self._check_live(deadline, cancel)
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            delta = json.loads(data)["choices"][0].get("delta", {}).get("content") or ""
+            if scanner.feed(delta) and stop_on_json:
+                break
+        return scanner.text
+
+    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.1, deadline: Optional[float] = None,
+             stream: bool = False, stop_on_json: bool = False, use_cache: bool = True,
+             cancel: Optional[threading.Event] = None, validate: Optional[Callable[[str], Any]] = None) -> str:
+        """Return the reply content. deadline is a time.monotonic() value; LLMError when it passes or on cancel.
+
+        validate, if given, is called on the reply and must not raise for it to
+        be cached (or for a cached reply to be reused), so a malformed answer
+        is asked for again instead of being served until it expires.
+        """
+        key = None
+        if self.cache is not None and use_cache:
+            key = cache_key(messages, self.model, temperature)
+            cached = self.cache.get(key)
+            if cached is not None and _passes(validate, cached):
+                return cached
+        content = self._request(messages, temperature, deadline, stream, stop_on_json, cancel)
+        if validate is not None:
+            validate(content)
+        if key is not None:
+            self.cache.put(key, content, self.model)
+        return content
+
+    def _request(self, messages: List[Dict[str, str]], temperature: float, deadline: Optional[float],
+                 stream: bool, stop_on_json: bool, cancel: Optional[threading.Event] = None) -> str:
+        deadline = deadline if deadline is not None else time.monotonic() + self.timeout_s
+        payload = {"model": self.model, "messages": messages, "temperature": temperature}
+        if stream:
+            payload["stream"] = True
+
+        # Waited for in short slices so a cancelled call gives up its place
+        while not self.slots.acquire(timeout=max(0.0, min(0.05, deadline - time.monotonic()))):
+            if cancel is not None and cancel.is_set():
+                raise LLMError("LLM request cancelled")
+            if time.monotonic() >= deadline:
+                raise LLMError("Deadline passed waiting for an LLM request slot")
+        try:
+            attempt = 0
+            while True:
+                self._check_live(deadline, cancel)
+                remaining = deadline - time.monotonic()
+                with self.lock:
+                    self.total_requests += 1
+                status_code, retry_after = None, None
+                try:
+                    with self.session.post(f"{self.base_url}/chat/completions", json=payload,
+                                           timeout=min(self.timeout_s, remaining), stream=stream) as response:
+                        status_code = response.status_code
+                        if status_code == 200:
+                            if stream:
+                                return self._read_stream(response, stop_on_json, deadline, cancel)
+                            return response.json()["choices"][0]["message"]["content"]
+                        retry_after = response.headers.get("Retry-After")
+                        error = LLMError(f"LLM request failed with HTTP {status_code}", status_code)
+                except requests.RequestException as e:
+                    error = LLMError(f"LLM request failed: {e}")
+
+                retryable = status_code is None or status_code in RETRY_STATUSES
+                backoff_s = self._backoff_s(attempt, retry_after)
+                if not retryable or attempt >= self.max_retries or time.monotonic() + backoff_s >= deadline:
+                    with self.lock:
+                        self.total_failures += 1
+                    raise error
+                with self.lock:
+                    self.total_retries += 1
+                if cancel is not None:
+                    cancel.wait(backoff_s)
+                else:
+                    time.sleep(backoff_s)
+                attempt += 1
+        finally:
+            self.slots.release()
+
+    def chat_json(self, messages: List[Dict[str, str]], temperature: float = 0.1, deadline: Optional[float] = None,
+                  stream: bool = LLM_STREAM, use_cache: bool = True, cancel: Optional[threading.Event] = None) -> dict:
+        """Return the first JSON object in the reply; streamed replies stop as soon as it closes"""
+        content = self.chat(messages, temperature, deadline, stream=stream, stop_on_json=True, use_cache=use_cache,
+                            cancel=cancel, validate=extract_json)
+        return extract_json(content)
+
+    def get_status(self) -> dict:
+        with self.lock:
+            return {
+                "base_url": self.base_url,
+                "model": self.model,
+                "requests": self.total_requests,
+                "retries": self.total_retries,
+                "failures": self.total_failures,
+                "cache": self.cache.get_status() if self.cache is not None else None
+            }
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+def get_llm_client() -> LLMClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(cache=get_llm_cache())
+        return _client
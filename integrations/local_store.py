@@ -0,0 +1,418 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from trace.quantiles import QuantileSketch
+
+LOCAL_STORE_PATH = os.getenv("CLICKHOUSE_LOCAL_PATH", os.path.join("data", "events.sqlite"))
+
+# Tables fetch_logs_from_cloud may read, with the column used for ordering
+_READABLE_TABLES = {
+    "events": "ts",
+    "audit_results": "timestamp",
+    "trace_events": "idx",
+    "cta_results": "timestamp",
+    "signatures": "id"
+}
+
+def _epoch(value, default: float = None) -> float:
+    if value is None:
+        return time.time() if default is None else default
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return time.time() if default is None else default
+
+def _int(value, default: int = 0) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+class LocalEventStore:
+    """Embedded SQLite backend exposing the ClickHouseClient API.
+
+    Selected with CLICKHOUSE_BACKEND=local. Event fields used by the stats
+    queries (level, component, status, latency) are stored as their own
+    indexed columns next to the raw payload, so windowed aggregates never
+    decode JSON.
+    """
+
+    def __init__(self, path: str = LOCAL_STORE_PATH):
+        self.path = path
+        self.use_mock = False
+        self.use_cloud = False
+        self.use_local = True
+        self.client = None
+        self._local = threading.local()
+        self._init_tables()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_tables(self):
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS events (
+                ts REAL NOT NULL,
+                id TEXT,
+                line_id INTEGER,
+                level TEXT,
+                component TEXT,
+                status INTEGER,
+                latency_ms INTEGER,
+                payload TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts);
+
+            CREATE TABLE IF NOT EXISTS audit_results (
+                timestamp REAL NOT NULL,
+                event_id TEXT,
+                line_id INTEGER,
+                component TEXT,
+                level TEXT,
+                is_anomaly INTEGER,
+                reason TEXT,
+                latency_ms INTEGER,
+                status INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_audit_ts ON audit_results(timestamp);
+            CREATE INDEX IF NOT EXISTS idx_audit_line ON audit_results(line_id);
+
+            CREATE TABLE IF NOT EXISTS signatures (
+                id TEXT PRIMARY KEY,
+                cause_label TEXT,
+                embedding TEXT,
+                patch_text TEXT
+            );
+
+            CREATE TABLE IF NOT EXISTS cta_results (
+                run_id TEXT,
+                timestamp REAL,
+                analysis_method TEXT,
+                confidence REAL,
+                primary_cause TEXT,
+                patch_applied TEXT,
+                canary_error_rate REAL,
+                canary_latency_p95 REAL,
+                decision TEXT,
+                mttr_seconds REAL,
+                before_error_rate REAL,
+                after_error_rate REAL
+            );
+
+            CREATE TABLE IF NOT EXISTS trace_events (
+                run_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                timestamp REAL,
+                type TEXT,
+                payload TEXT,
+                PRIMARY KEY (run_id, idx)
+            );
+        """)
+        conn.commit()
+
+    # Events
+
+    def _event_row(self, event: Dict[str, Any], now: float):
+        return (
+            _epoch(event.get("timestamp", event.get("ts")), now),
+            event.get("id", ""),
+            _int(event.get("LineId")),
+            event.get("Level", event.get("level")),
+            event.get("Component"),
+            _int(event.get("status"), 200),
+            _int(event.get("latency_ms")),
+            json.dumps(event)
+        )
+
+    def insert_event(self, event: Dict[str, Any]):
+        self.insert_events([event])
+
+    def insert_events(self, events: List[Dict[str, Any]]) -> bool:
+        if not events:
+            return True
+        now = time.time()
+        conn = self._conn()
+        conn.executemany(
+            "INSERT INTO events (ts, id, line_id, level, component, status, latency_ms, payload) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [self._event_row(e, now) for e in events]
+        )
+        conn.commit()
+        return True
+
+    def get_recent_events(self, limit: int = 20, table_name: str = None) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT payload FROM events ORDER BY ts DESC, rowid DESC LIMIT ?", (limit,)
+        ).fetchall()
+        # Oldest first, like the in-memory mock store
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def get_events_after(self, after_ts: float, after_key: Optional[int] = None,
+                         limit: int = 1000) -> List[Dict[str, Any]]:
+        """Events ordered by (ts, rowid) after the cursor; rowid follows insert order, so ties never arrive late"""
+        if after_key is None:
+            rows = self._conn().execute(
+                "SELECT ts, rowid AS key, payload FROM events WHERE ts >= ? ORDER BY ts, rowid LIMIT ?",
+                (after_ts, limit)
+            ).fetchall()
+        else:
+            rows = self._conn().execute(
+                "SELECT ts, rowid AS key, payload FROM events WHERE ts > ? OR (ts = ? AND rowid > ?) "
+                "ORDER BY ts, rowid LIMIT ?",
+                (after_ts, after_ts, after_key, limit)
+            ).fetchall()
+        return [{"ts": row[0], "key": row[1], "payload": row[2]} for row in rows]
+
+    def fetch_logs_from_cloud(self, table_name: str, limit: int = 100, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Read rows from a local table with parameterized equality filters"""
+        if table_name not in _READABLE_TABLES:
+            print(f"Unknown local table: {table_name}")
+            return []
+
+        conn = self._conn()
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")}
+        query = f"SELECT * FROM {table_name}"
+        params: List[Any] = []
+        if filters:
+            unknown = [key for key in filters if key not in columns]
+            if unknown:
+                print(f"Unknown columns for {table_name}: {unknown}")
+                return []
+            query += " WHERE " + " AND ".join(f"{key} = ?" for key in filters)
+            params.extend(filters.values())
+        query += f" ORDER BY {_READABLE_TABLES[table_name]} LIMIT ?"
+        params.append(limit)
+
+        return [dict(row) for row in conn.execute(query, params)]
+
+    # Audit results
+
+    def _audit_row(self, r: Dict[str, Any], now: float):
+        return (
+            _epoch(r.get("timestamp"), now),
+            r.get("event_id", ""),
+            _int(r.get("line_id")),
+            r.get("component", ""),
+            r.get("level", ""),
+            1 if r.get("is_anomaly", False) else 0,
+            r.get("reason", ""),
+            _int(r.get("latency_ms")),
+            _int(r.get("status"), 200)
+        )
+
+    def insert_audit_result(self, audit_result: Dict[str, Any]):
+        self.insert_audit_results([audit_result])
+
+    def insert_audit_results(self, audit_results: List[Dict[str, Any]]) -> bool:
+        if not audit_results:
+            return True
+        now = time.time()
+        conn = self._conn()
+        conn.executemany(
+            """INSERT INTO audit_results
+            (timestamp, event_id, line_id, component, level, is_anomaly, reason, latency_ms, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            [self._audit_row(r, now) for r in audit_results]
+        )
+        conn.commit()
+        return True
+
+    def get_audit_results(self, limit: int = 100, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        conn = self._conn()
+        query = "SELECT * FROM audit_results"
+        params: List[Any] = []
+        if filters:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(audit_results)")}
+            filters = {key: value for key, value in filters.items() if key in columns}
+        if filters:
+            query += " WHERE " + " AND ".join(f"{key} = ?" for key in filters)
+            params.extend(filters.values())
+        query += " ORDER BY timestamp DESC, rowid DESC LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in conn.execute(query, params)]
+
+    # Signatures
+
+    def insert_signature(self, signature: Dict[str, Any]):
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO signatures (id, cause_label, embedding, patch_text) VALUES (?, ?, ?, ?)",
+            (signature["id"], signature["cause_label"], json.dumps(list(signature["embedding"])), signature["patch_text"])
+        )
+        conn.commit()
+
+    def get_signatures(self, limit: int = 100000) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT id, cause_label, embedding, patch_text FROM signatures LIMIT ?", (limit,)
+        ).fetchall()
+        return [{"id": r[0], "cause_label": r[1], "embedding": json.loads(r[2]), "patch_text": r[3]} for r in rows]
+
+    def find_similar_signature(self, embedding: List[float], threshold: float = 0.85) -> Optional[Dict[str, Any]]:
+        query_norm = math.sqrt(sum(v * v for v in embedding))
+        if query_norm == 0:
+            return None
+
+        best = None
+        best_similarity = threshold
+        for row in self._conn().execute("SELECT id, cause_label, patch_text, embedding FROM signatures"):
+            stored = json.loads(row[3])
+            if len(stored) != len(embedding):
+                continue
+            stored_norm = math.sqrt(sum(v * v for v in stored))
+            if stored_norm == 0:
+                continue
+            similarity = sum(a * b for a, b in zip(embedding, stored)) / (query_norm * stored_norm)
+            if similarity >= best_similarity:
+                best_similarity = similarity
+                best = {"id": row[0], "cause_label": row[1], "patch_text": row[2], "similarity": similarity}
+        return best
+
+    # CTA results and trace events
+
+    def write_cta_result(self, result: Dict[str, Any]) -> bool:
+        conn = self._conn()
+        conn.execute(
+            """INSERT INTO cta_results
+            (run_id, timestamp, analysis_method, confidence, primary_cause, patch_applied,
+             canary_error_rate, canary_latency_p95, decision, mttr_seconds, before_error_rate, after_error_rate)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                result.get("run_id", ""),
+                time.time(),
+                result.get("analysis_method", ""),
+                float(result.get("confidence", 0.0)),
+                result.get("primary_cause", ""),
+                json.dumps(result.get("patch_applied", {})),
+                float(result.get("canary_error_rate", 0.0)),
+                float(result.get("canary_latency_p95", 0.0)),
+                result.get("decision", ""),
+                float(result.get("mttr_seconds", 0.0)),
+                float(result.get("before_error_rate", 0.0)),
+                float(result.get("after_error_rate", 0.0))
+            )
+        )
+        conn.commit()
+        return True
+
+    def write_trace_event(self, event: Dict[str, Any]) -> bool:
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO trace_events (run_id, idx, timestamp, type, payload) VALUES (?, ?, ?, ?, ?)",
+            (event.get("run_id", ""), _int(event.get("idx")), _epoch(event.get("ts")), event.get("type", ""), json.dumps(event))
+        )
+        conn.commit()
+        return True
+
+    def iter_trace_page(self, run_id: str, after_idx: int, limit: int,
+                        table_name: str = "trace_events") -> Iterator[Tuple[int, str]]:
+        if table_name != "trace_events":
+            raise ValueError(f"Unknown local trace table: {table_name}")
+        cursor = self._conn().execute(
+            "SELECT idx, payload FROM trace_events WHERE run_id = ? AND idx > ? ORDER BY idx LIMIT ?",
+            (run_id, after_idx, limit)
+        )
+        for idx, payload in cursor:
+            yield idx, payload
+
+    # Windowed stats
+
+    def get_log_stats(self, time_window: int = 3600) -> dict:
+        since = time.time() - time_window
+        conn = self._conn()
+
+        by_level = {
+            str(row[0] or "UNKNOWN"): row[1]
+            for row in conn.execute("SELECT level, COUNT(*) FROM events WHERE ts >= ? GROUP BY level", (since,))
+        }
+        total = sum(by_level.values())
+        by_component = {
+            str(row[0] or "unknown"): row[1]
+            for row in conn.execute(
+                "SELECT component, COUNT(*) AS cnt FROM events WHERE ts >= ? GROUP BY component ORDER BY cnt DESC LIMIT 20",
+                (since,)
+            )
+        }
+
+        return {
+            "total_logs": total,
+            "by_level": by_level,
+            "by_component": by_component,
+            "error_rate": (by_level.get("ERROR", 0) / total * 100) if total > 0 else 0,
+            "warning_rate": (by_level.get("WARNING", 0) / total * 100) if total > 0 else 0
+        }
+
+    def get_audit_stats(self, time_window: int = 3600) -> dict:
+        since = time.time() - time_window
+        conn = self._conn()
+
+        row = conn.execute("""
+            SELECT
+                COUNT(*),
+                COALESCE(SUM(is_anomaly), 0),
+                COALESCE(AVG(latency_ms), 0),
+                COALESCE(SUM(CASE WHEN status >= 400 AND status < 500 THEN 1 ELSE 0 END), 0),
+                COALESCE(SUM(CASE WHEN status >= 500 THEN 1 ELSE 0 END), 0)
+            FROM audit_results
+            WHERE timestamp >= ?
+        """, (since,)).fetchone()
+        total, anomalies, latency_avg, status_4xx, status_5xx = row
+
+        # SQLite has no quantile aggregate; stream the column through a sketch
+        sketch = QuantileSketch()
+        for (latency,) in conn.execute("SELECT latency_ms FROM audit_results WHERE timestamp >= ?", (since,)):
+            sketch.add(max(latency or 0, 0))
+
+        return {
+            "total_evaluated": total,
+            "anomalies_detected": anomalies,
+            "anomaly_rate": (anomalies / total * 100) if total > 0 else 0,
+            "latency_avg": float(latency_avg),
+            "latency_p95": sketch.quantile(0.95),
+            "latency_p99": sketch.quantile(0.99),
+            "status_4xx": status_4xx,
+            "status_5xx": status_5xx,
+            "error_rate": ((status_4xx + status_5xx) / total * 100) if total > 0 else 0
+        }
+
+    def get_comparison_stats(self, time_window: int = 3600) -> dict:
+        since = time.time() - time_window
+        conn = self._conn()
+
+        total_logs, total_components = conn.execute(
+            "SELECT COUNT(DISTINCT line_id), COUNT(DISTINCT component) FROM events WHERE ts >= ?", (since,)
+        ).fetchone()
+        audited, anomalies = conn.execute(
+            "SELECT COUNT(DISTINCT line_id), COALESCE(SUM(is_anomaly), 0) FROM audit_results WHERE timestamp >= ?",
+            (since,)
+        ).fetchone()
+        unhealthy = conn.execute("""
+            SELECT COUNT(DISTINCT e.component)
+            FROM events e
+            JOIN audit_results ar ON e.line_id = ar.line_id
+            WHERE e.ts >= ? AND ar.timestamp >= ? AND ar.is_anomaly = 1
+        """, (since, since)).fetchone()[0]
+
+        return {
+            "audit_coverage": (audited / total_logs * 100) if total_logs > 0 else 0,
+            "detection_rate": (anomalies / audited * 100) if audited > 0 else 0,
+            "healthy_components": total_components - unhealthy,
+            "unhealthy_components": unhealthy,
+            "anomaly_increase": 0
+        }
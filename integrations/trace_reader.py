@@ -0,0 +1,68 @@
+import json
+import os
+from typing import Iterator, List, Optional
+
+from trace.store import load_events_page
+from .clickhouse import get_client
+
+TRACE_TABLE = os.getenv("CLICKHOUSE_TRACE_TABLE", "trace_events")
+TRACE_PAGE_SIZE = int(os.getenv("CTA_TRACE_PAGE_SIZE", "500"))
+
+def iter_run_events(run_id: str, client=None, page_size: int = TRACE_PAGE_SIZE, table_name: str = TRACE_TABLE,
+                    stats: Optional[dict] = None) -> Iterator[dict]:
+    """Yield a run's trace events from ClickHouse in idx order, one page at a time.
+
+    Pages are keyed on the last idx seen, so memory stays at one page of
+    rows however long the run is. A page that fails to load is read from
+    the SQLite trace store instead, as are idx gaps left by events that
+    never reached ClickHouse; a run ClickHouse has no events for is read
+    from SQLite entirely. stats, if given, counts pages and where events
+    came from.
+    """
+    client = client or get_client()
+    if stats is None:
+        stats = {}
+    for key in ("pages", "clickhouse_events", "sqlite_events", "fallback_pages"):
+        stats.setdefault(key, 0)
+
+    last_idx = -1
+    source = "clickhouse"
+    while True:
+        if source == "clickhouse":
+            rows = 0
+            try:
+                for idx, payload in client.iter_trace_page(run_id, last_idx, page_size, table_name):
+                    rows += 1
+                    if idx <= last_idx:
+                        continue
+                    if idx > last_idx + 1:
+                        for event in load_events_page(run_id, last_idx, before_idx=idx):
+                            stats["sqlite_events"] += 1
+                            yield event
+                    event = json.loads(payload) if isinstance(payload, str) else payload
+                    event.setdefault("idx", idx)
+                    last_idx = idx
+                    stats["clickhouse_events"] += 1
+                    yield event
+            except Exception as e:
+                print(f"[WARN] Trace page after idx {last_idx} of {run_id} failed, reading it from SQLite: {e}")
+                stats["fallback_pages"] += 1
+            else:
+                stats["pages"] += 1
+                if rows == page_size:
+                    continue
+                # ClickHouse has no more; SQLite may still hold events it never received
+                source = "sqlite"
+
+        events = load_events_page(run_id, last_idx, page_size)
+        stats["pages"] += 1
+        for event in events:
+            last_idx = event["idx"]
+            stats["sqlite_events"] += 1
+            yield event
+        if len(events) < page_size:
+            return
+
+def load_run_events(run_id: str, client=None, page_size: int = TRACE_PAGE_SIZE, table_name: str = TRACE_TABLE,
+                    stats: Optional[dict] = None) -> List[dict]:
+    return list(iter_run_events(run_id, client, page_size, table_name, stats))
@@ -3,7 +3,7 @@ Query and display audit results from ClickHouse
 """
 import os
 from datetime import datetime
-from integrations.clickhouse import get_audit_results, get_client
+from integrations.clickhouse import get_audit_results, get_client, summarize_audit_results
 
 # Set credentials
 os.environ["CLICKHOUSE_CLOUD_KEY"] = "kRuHI0HdODEAJokHcaTy"
@@ -28,32 +28,24 @@ if results:
     print(f"\n[OK] Found {len(results)} audit result(s)")
     
     # Summary statistics
-    anomaly_count = sum(1 for r in results if r.get('is_anomaly', 0) == 1)
-    normal_count = len(results) - anomaly_count
+    stats = summarize_audit_results(results)
+    anomaly_count = stats["anomalies_detected"]
+    normal_count = stats["total_evaluated"] - anomaly_count
     
     print(f"\n[STATISTICS]")
     print(f"  Total audits: {len(results)}")
     print(f"  Anomalies: {anomaly_count} ({anomaly_count/len(results)*100:.1f}%)")
     print(f"  Normal: {normal_count} ({normal_count/len(results)*100:.1f}%)")
+    print(f"  Latency p50/p95/p99: {stats['latency_p50']:.0f}/{stats['latency_p95']:.0f}/{stats['latency_p99']:.0f}ms")
     
     # Component breakdown
-    components = {}
-    for r in results:
-        comp = r.get('component', 'unknown')
-        components[comp] = components.get(comp, 0) + 1
-    
     print(f"\n[COMPONENT BREAKDOWN]")
-    for comp, count in sorted(components.items(), key=lambda x: x[1], reverse=True):
+    for comp, count in sorted(stats["by_component"].items(), key=lambda x: x[1], reverse=True):
         print(f"  {comp}: {count} audit(s)")
     
     # Level breakdown
-    levels = {}
-    for r in results:
-        level = r.get('level', 'unknown')
-        levels[level] = levels.get(level, 0) + 1
-    
     print(f"\n[LEVEL BREAKDOWN]")
-    for level, count in sorted(levels.items(), key=lambda x: x[1], reverse=True):
+    for level, count in sorted(stats["by_level"].items(), key=lambda x: x[1], reverse=True):
         print(f"  {level}: {count} audit(s)")
     
     # Show recent anomalies
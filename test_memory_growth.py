@@ -2,7 +2,7 @@
 Test script to demonstrate agent memory growth
 """
 import os
-from integrations.clickhouse import get_audit_results
+from integrations.clickhouse import get_audit_results, summarize_audit_results
 
 # Set credentials
 os.environ["CLICKHOUSE_CLOUD_KEY"] = "kRuHI0HdODEAJokHcaTy"
@@ -24,21 +24,18 @@ else:
     print(f"\n[OK] Agent has {len(memory)} memories stored")
     
     # Statistics
-    anomalies = sum(1 for m in memory if m.get('is_anomaly', 0) == 1)
+    stats = summarize_audit_results(memory)
+    anomalies = stats["anomalies_detected"]
     print(f"\n[STATISTICS]")
     print(f"  Total memories: {len(memory)}")
     print(f"  Anomalies: {anomalies}")
     print(f"  Normal: {len(memory) - anomalies}")
     print(f"  Anomaly rate: {anomalies/len(memory)*100:.1f}%")
+    print(f"  Latency p50/p95/p99: {stats['latency_p50']:.0f}/{stats['latency_p95']:.0f}/{stats['latency_p99']:.0f}ms")
     
     # Components
-    components = {}
-    for m in memory:
-        comp = m.get('component', 'unknown')
-        components[comp] = components.get(comp, 0) + 1
-    
     print(f"\n[COMPONENTS IN MEMORY]")
-    for comp, count in sorted(components.items(), key=lambda x: x[1], reverse=True):
+    for comp, count in sorted(stats["by_component"].items(), key=lambda x: x[1], reverse=True):
         print(f"  {comp}: {count} evaluations")
     
     # Recent memories
@@ -0,0 +1,21 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Point every store the code persists under data/ (traces, indexes, adapter
+# config, canary corpus, caches) at a scratch directory. These paths are read
+# when the modules are imported, so they are set here, before any test module
+# imports them
+_DATA_DIR = tempfile.mkdtemp(prefix="cta-tests-")
+atexit.register(shutil.rmtree, _DATA_DIR, ignore_errors=True)
+
+os.environ["TRACE_SQLITE_PATH"] = os.path.join(_DATA_DIR, "traces.sqlite")
+os.environ["TRACE_RUNS_DIR"] = os.path.join(_DATA_DIR, "runs")
+os.environ["CONSUMER_CHECKPOINT_PATH"] = os.path.join(_DATA_DIR, "consumer_checkpoint.json")
+os.environ["CLICKHOUSE_LOCAL_PATH"] = os.path.join(_DATA_DIR, "events.sqlite")
+os.environ["ADAPTER_CONFIG_PATH"] = os.path.join(_DATA_DIR, "adapter_config.json")
+os.environ["SCHEMA_INDEX_PATH"] = os.path.join(_DATA_DIR, "schema_index.json")
+os.environ["SIGNATURE_INDEX_PATH"] = os.path.join(_DATA_DIR, "signature_index")
+os.environ["CANARY_CORPUS_PATH"] = os.path.join(_DATA_DIR, "canary_corpus.jsonl")
+os.environ["LLM_CACHE_PATH"] = os.path.join(_DATA_DIR, "llm_cache.sqlite")
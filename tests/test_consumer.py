@@ -0,0 +1,147 @@
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents.consumer import StreamConsumer, audit_events
+from agents.adapters import set_adapter, clear_adapters
+from integrations.clickhouse import insert_events, get_audit_results, get_client
+
+def _events(start_line, count, ts, **extra):
+    return [dict({"LineId": start_line + i, "Level": "INFO", "Component": "nova.compute",
+                  "latency_ms": 120, "status": 200, "timestamp": ts}, **extra) for i in range(count)]
+
+def test_audit_events_builds_rows():
+    clear_adapters()
+    rows = audit_events([
+        {"LineId": 1, "Level": "ERROR", "Component": "nova.api", "latency_ms": 50, "status": 503},
+        {"LineId": 2, "level": "INFO", "latency_ms": 100}
+    ])
+
+    assert rows[0]["is_anomaly"] is True
+    assert rows[0]["reason"] == "Level=ERROR"
+    assert rows[1]["is_anomaly"] is True
+    assert rows[1]["reason"].startswith("Audit error: KeyError")
+
+    set_adapter({"level": "Level"})
+    rows = audit_events([{"LineId": 2, "level": "INFO", "latency_ms": 100}])
+    assert rows[0]["is_anomaly"] is False
+    clear_adapters()
+
+def test_consumer_resumes_from_checkpoint(tmp_path):
+    clear_adapters()
+    checkpoint = str(tmp_path / "checkpoint.json")
+    base = time.time() + 1000
+
+    consumer = StreamConsumer(checkpoint_path=checkpoint, batch_size=4)
+    consumer.poll_once(force_flush=True)
+
+    # Several events share a timestamp to exercise ties at the watermark
+    insert_events(_events(70000, 3, base) + _events(70003, 3, base + 1))
+    assert consumer.poll_once(force_flush=True) == 6
+
+    status = consumer.get_status()
+    assert abs(status["watermark"] - (base + 1)) < 1e-3
+    assert status["buffered"] == 0
+    assert status["total_batches"] >= 2
+
+    restarted = StreamConsumer(checkpoint_path=checkpoint, batch_size=4)
+    assert restarted.poll_once(force_flush=True) == 0
+
+    insert_events(_events(70006, 2, base + 1))
+    assert restarted.poll_once(force_flush=True) == 2
+    assert restarted.get_status()["total_processed"] == status["total_processed"] + 2
+
+    audited = {r["line_id"] for r in get_audit_results(limit=50)}
+    assert set(range(70000, 70008)) <= audited
+
+def test_consumer_size_and_time_triggers(tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    consumer = StreamConsumer(checkpoint_path=checkpoint, batch_size=1000, max_batch_wait_s=60)
+    consumer.poll_once(force_flush=True)
+
+    insert_events(_events(71000, 5, time.time() + 2000))
+    assert consumer.poll_once() == 0
+    assert consumer.get_status()["buffered"] == 5
+
+    consumer.max_batch_wait_s = 0.0
+    assert consumer.poll_once() == 5
+
+def test_consumer_background_thread(tmp_path):
+    checkpoint = str(tmp_path / "checkpoint.json")
+    consumer = StreamConsumer(checkpoint_path=checkpoint, max_batch_wait_s=0.05, poll_interval_s=0.02)
+    consumer.poll_once(force_flush=True)
+
+    consumer.start()
+    insert_events(_events(72000, 10, time.time() + 3000))
+    time.sleep(0.3)
+    consumer.stop()
+
+    status = consumer.get_status()
+    assert status["running"] is False
+    assert status["throughput_eps"] > 0
+    assert status["buffered"] == 0
+
+def test_consumer_pages_through_ties_at_one_timestamp(tmp_path, monkeypatch):
+    import agents.consumer as consumer_mod
+    monkeypatch.setattr(consumer_mod, "FETCH_LIMIT", 4)
+    checkpoint = str(tmp_path / "checkpoint.json")
+    consumer = StreamConsumer(checkpoint_path=checkpoint, batch_size=3)
+    consumer.poll_once(force_flush=True)
+
+    # Far more events share one timestamp than a page holds
+    insert_events(_events(73000, 10, time.time() + 4000))
+    processed = sum(consumer.poll_once(force_flush=True) for _ in range(4))
+    assert processed == 10
+
+    restarted = StreamConsumer(checkpoint_path=checkpoint, batch_size=3)
+    assert restarted.poll_once(force_flush=True) == 0
+    audited = [r["line_id"] for r in get_audit_results(limit=200) if 73000 <= r["line_id"] < 73010]
+    assert sorted(audited) == list(range(73000, 73010))
+
+def test_consumer_stops_fetching_while_writes_fail(tmp_path, monkeypatch):
+    import agents.consumer as consumer_mod
+    checkpoint = str(tmp_path / "checkpoint.json")
+    consumer = StreamConsumer(checkpoint_path=checkpoint, batch_size=4, max_batch_wait_s=0.0,
+                              poll_interval_s=0.01)
+    consumer.poll_once(force_flush=True)
+
+    monkeypatch.setattr(consumer_mod, "insert_audit_results", lambda rows: False)
+    base = time.time() + 5000
+    for i in range(5):
+        insert_events(_events(74000 + i * 10, 10, base + i))
+        consumer._retry_at = 0.0
+        assert consumer.poll_once() == 0
+
+    status = consumer.get_status()
+    # The first page was fetched before any write had failed; nothing after it
+    assert status["buffered"] == 10
+    assert status["consecutive_failures"] == 5
+    assert status["retry_in_s"] > 0
+    # Inside the backoff window nothing is attempted
+    assert consumer.poll_once() == 0
+    assert consumer.get_status()["write_failures"] == 5
+
+    monkeypatch.undo()
+    consumer._retry_at = 0.0
+    assert sum(consumer.poll_once(force_flush=True) for _ in range(20)) == 50
+    assert consumer.get_status()["consecutive_failures"] == 0
+
+def test_mock_cursor_is_not_resumed_by_another_process(tmp_path, monkeypatch):
+    import agents.consumer as consumer_mod
+    checkpoint = str(tmp_path / "checkpoint.json")
+    consumer = StreamConsumer(checkpoint_path=checkpoint, batch_size=4)
+    consumer.poll_once(force_flush=True)
+    insert_events(_events(75000, 3, time.time() + 6000))
+    consumer.poll_once(force_flush=True)
+    saved = consumer.get_status()
+
+    # A restarted process has a fresh mock store whose keys start over
+    monkeypatch.setattr(consumer_mod, "MOCK_STORE_ID", "restarted")
+    restarted = StreamConsumer(checkpoint_path=checkpoint, batch_size=4)
+    assert restarted.total_processed == saved["total_processed"]
+    if get_client().use_mock:
+        assert (restarted.watermark, restarted.watermark_key) == (0.0, None)
+    else:
+        assert restarted.watermark == saved["watermark"]
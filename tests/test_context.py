@@ -0,0 +1,83 @@
+import sys
+import os
+import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from cta.context import build_context, estimate_tokens, truncate, MAX_LIST_ITEMS
+from trace.schema_index import SchemaIndex
+
+def _line(i, level="INFO"):
+    return {"LineId": i, "Level": level, "Component": "nova.compute", "Content": f"message number {i} " * 4}
+
+def _lines(text):
+    return [json.loads(line.rstrip(",")) for line in text.strip("[]\n").split("\n")]
+
+def _failed_run(healthy=60):
+    events = [{"type": "tool", "tool": "fetch_log_events", "idx": 0, "ts": "t",
+               "args": {"limit": 500}, "output": [_line(i) for i in range(40)]}]
+    for i in range(healthy):
+        events.append({"type": "tool", "tool": "evaluate_event", "idx": len(events), "ts": "t",
+                       "args": [_line(100 + i)], "output": {"ok": True}})
+    events.append({"type": "error", "idx": len(events), "ts": "t", "message": "'Level'",
+                   "context": {"agent": "Auditor", "event_id": 3}})
+    return events
+
+def test_error_and_feeding_tool_survive_a_tight_budget():
+    events = _failed_run()
+    text, stats = build_context(events, budget_tokens=600)
+    kept = _lines(text)
+
+    assert stats["kept"] < stats["events"]
+    assert estimate_tokens(text) <= 600
+    assert any(e.get("type") == "error" for e in kept)
+    assert any(e.get("tool") == "fetch_log_events" for e in kept)
+    assert kept[-1] == {"omitted_events": stats["events"] - stats["kept"]}
+    # Chronological order, with timestamps dropped
+    idxs = [e["idx"] for e in kept if "idx" in e]
+    assert idxs == sorted(idxs)
+    assert all("ts" not in e for e in kept)
+
+def test_long_outputs_are_truncated_keeping_drifted_items():
+    items = [_line(i) for i in range(30)]
+    items[20] = {"LineId": 20, "level": "INFO", "Content": "renamed"}
+    truncated = truncate(items)
+
+    assert len(truncated) == MAX_LIST_ITEMS + 1
+    assert truncated[-1] == f"...{30 - MAX_LIST_ITEMS} more items"
+    assert any("level" in item for item in truncated[:-1])
+
+def test_repeated_payloads_become_references():
+    output = [_line(i) for i in range(3)]
+    events = [
+        {"type": "tool", "tool": "fetch_log_events", "idx": 0, "output": output},
+        {"type": "tool", "tool": "filter_events", "idx": 1, "args": {"events": output}, "output": output}
+    ]
+    text, _ = build_context(events)
+    kept = _lines(text)
+
+    assert kept[0]["output"] == output
+    assert kept[1]["output"] == {"same_as_idx": 0}
+    assert kept[1]["args"]["events"] == {"same_as_idx": 0}
+
+def test_identical_errors_are_folded():
+    events = [{"type": "error", "idx": i, "message": f"Tool x timed out after {30 + i}s",
+               "context": {"agent": "Fetcher"}} for i in range(5)]
+    text, stats = build_context(events)
+    kept = _lines(text)
+
+    assert stats["folded_errors"] == 4
+    assert kept[0]["repeats"] == 4
+    assert kept[-1] == {"omitted_events": 4}
+
+def test_schema_index_flags_drifted_tool_output(tmp_path):
+    index = SchemaIndex(str(tmp_path / "schema_index.json"))
+    index.learn("fetch_log_events", [_line(i) for i in range(20)])
+    drifted = [{"LineId": i, "level": "INFO", "Component": "c", "Content": "x" * 40} for i in range(3)]
+    events = [{"type": "tool", "tool": "evaluate_event", "idx": i, "output": {"ok": True, "note": "y" * 200}}
+              for i in range(10)]
+    events.append({"type": "tool", "tool": "fetch_log_events", "idx": 10, "output": drifted})
+
+    text, stats = build_context(events, budget_tokens=300, schema_index=index)
+    assert any(e.get("tool") == "fetch_log_events" for e in _lines(text))
+    assert stats["kept"] < len(events)
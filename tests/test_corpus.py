@@ -0,0 +1,88 @@
+import sys
+import os
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents.corpus import build_corpus, read_corpus, load_corpus_index, replay_canary, StaleCorpusIndex
+from agents.adapters import set_adapter, clear_adapters
+from agents.graph import run_pipeline
+from trace.store import start_run
+
+def _write_trace(path, run_id, outputs):
+    with open(path, 'w') as f:
+        for idx, output in enumerate(outputs):
+            f.write(json.dumps({
+                "ts": 1.0, "run_id": run_id, "idx": idx, "type": "tool",
+                "tool": "fetch_log_events", "args": [False], "output": output
+            }) + "\n")
+        f.write(json.dumps({"ts": 2.0, "run_id": run_id, "idx": len(outputs), "type": "step", "agent": "Auditor"}) + "\n")
+
+def test_build_corpus_from_jsonl(tmp_path):
+    trace_path = str(tmp_path / "run.jsonl")
+    outputs = [
+        [{"LineId": i, "Level": "INFO", "latency_ms": 100 + i} for i in range(5)],
+        [{"LineId": 1, "Level": "INFO", "latency_ms": 101}, {"LineId": 9, "level": "ERROR", "latency_ms": 300}]
+    ]
+    _write_trace(trace_path, "run_a", outputs)
+
+    corpus_path = str(tmp_path / "corpus.jsonl")
+    index = build_corpus(corpus_path, jsonl_paths=[trace_path])
+
+    assert index["count"] == 6
+    assert load_corpus_index(corpus_path)["offsets"] == index["offsets"]
+
+    events = read_corpus(corpus_path, 4, 6)
+    assert [e["LineId"] for e in events] == [4, 9]
+    assert read_corpus(corpus_path, 6, 10) == []
+
+def test_build_corpus_from_trace_store(tmp_path):
+    run_id = start_run("corpus_test")
+    run_pipeline(run_id, "good")
+
+    corpus_path = str(tmp_path / "corpus.jsonl")
+    index = build_corpus(corpus_path, run_ids=[run_id])
+
+    assert index["count"] == 3
+    assert all("Level" in e for e in read_corpus(corpus_path))
+
+def test_replay_canary_is_deterministic_across_shards(tmp_path):
+    trace_path = str(tmp_path / "run.jsonl")
+    _write_trace(trace_path, "run_b", [
+        [{"LineId": i, "level": "INFO", "latency_ms": 100} for i in range(40)]
+    ])
+    corpus_path = str(tmp_path / "corpus.jsonl")
+    build_corpus(corpus_path, jsonl_paths=[trace_path])
+
+    clear_adapters()
+    broken = replay_canary("replay_test", corpus_path, workers=1)
+    assert broken["total"] == 40
+    assert broken["errors"] == 40
+    assert broken["passed"] is False
+
+    set_adapter({"level": "Level"})
+    single = replay_canary("replay_test", corpus_path, workers=1)
+    sharded = replay_canary("replay_test", corpus_path, workers=3)
+    clear_adapters()
+
+    assert sharded["shards"] == 3
+    assert single["errors"] == sharded["errors"] == 0
+    assert single["total"] == sharded["total"] == 40
+    assert sharded["passed"] is True
+
+def test_index_is_replaced_with_the_corpus_and_checked_on_read(tmp_path):
+    trace_path = str(tmp_path / "run.jsonl")
+    _write_trace(trace_path, "run_c", [[{"LineId": i, "Level": "INFO"} for i in range(3)]])
+    corpus_path = str(tmp_path / "corpus.jsonl")
+    old = build_corpus(corpus_path, jsonl_paths=[trace_path])
+    assert old["corpus_size"] == os.path.getsize(corpus_path)
+    assert sorted(os.listdir(tmp_path)) == ["corpus.jsonl", "corpus.jsonl.idx", "run.jsonl"]
+
+    _write_trace(trace_path, "run_c", [[{"LineId": i, "Level": "INFO", "extra": "x" * i} for i in range(5)]])
+    build_corpus(corpus_path, jsonl_paths=[trace_path])
+    # An index held from before the rebuild no longer matches the file
+    with pytest.raises(StaleCorpusIndex):
+        read_corpus(corpus_path, 0, 2, index=old)
+    assert [e["LineId"] for e in read_corpus(corpus_path)] == [0, 1, 2, 3, 4]
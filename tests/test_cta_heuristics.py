@@ -93,3 +93,116 @@ def test_cta_analyze_end_to_end():
     assert "proposed_fix" in report
     assert report["confidence"] > 0
 
+
+def _tool_event(idx, output, tool="fetch_log_events", latency_ms=5):
+    return {"ts": 1000.0 + idx, "idx": idx, "type": "tool", "tool": tool, "args": [], "output": output,
+            "latency_ms": latency_ms}
+
+def test_rule_engine_dispatches_by_type_and_tool():
+    from cta.detectors import Detector, RuleEngine
+
+    class ToolOnly(Detector):
+        name = "tool_only"
+        event_types = ("tool",)
+        tools = ("fetch_log_events",)
+        seen = []
+
+        def observe(self, evt):
+            ToolOnly.seen.append(evt["idx"])
+
+        def findings(self):
+            return []
+
+    events = [
+        _tool_event(0, []),
+        _tool_event(1, [], tool="evaluate_event"),
+        {"idx": 2, "type": "error", "message": "boom"},
+        _tool_event(3, [])
+    ]
+    RuleEngine([ToolOnly]).run(events)
+
+    assert ToolOnly.seen == [0, 3]
+
+def test_heuristic_detects_generic_key_drift_from_bare_keyerror():
+    events = [
+        _tool_event(0, [{"LineId": 1, "request_id": "a", "Level": "INFO"}], tool="fetch_traces"),
+        {"ts": 1001.0, "idx": 1, "type": "error", "message": "'RequestId'", "context": {"agent": "Auditor"}}
+    ]
+
+    report = _heuristic_analyze(events, "Schema mismatch")
+
+    assert report["primary_cause_step_id"] == "tool_0"
+    assert report["confidence"] >= 0.9
+    assert "'request_id' -> 'RequestId'" in report["proposed_fix"]["tool_schema_patch"]
+    assert "keyerror" in report["symptoms"][1].lower()
+
+def test_heuristic_detects_latency_spikes_and_status_shift():
+    from agents.synthetic import NovaLogGenerator
+
+    steady = NovaLogGenerator(seed=1).generate(200)
+    for evt in steady[100:]:
+        evt["status"] = 503
+        evt["Level"] = "ERROR"
+    events = [_tool_event(i, [evt]) for i, evt in enumerate(steady)]
+    events[150]["output"][0]["latency_ms"] = 4000
+
+    report = _heuristic_analyze(events, "Slow and failing")
+    detectors = {f["detector"] for f in report["findings"]}
+
+    assert "latency_spike" in detectors
+    assert "status_shift" in detectors
+    assert any("4000ms" in s for s in report["symptoms"])
+
+def test_heuristic_single_pass_scales_to_large_runs(monkeypatch):
+    from collections import Counter
+    from agents.synthetic import NovaLogGenerator
+    from cta.detectors import Detector, KeyDriftDetector
+
+    generator = NovaLogGenerator(seed=2, drift_ratio=0.1)
+    events = [_tool_event(i, [evt]) for i, evt in enumerate(generator.generate(100000))]
+    events.append({"ts": 0.0, "idx": len(events), "type": "error", "message": "'Level'", "context": {"agent": "Auditor"}})
+
+    observed = Counter()
+    routing_checks = []
+    observe, wants = KeyDriftDetector.observe, Detector.wants
+    def counting_observe(self, evt):
+        observed[evt["idx"]] += 1
+        observe(self, evt)
+    def counting_wants(self, event_type, tool):
+        routing_checks.append((self.name, event_type, tool))
+        return wants(self, event_type, tool)
+    monkeypatch.setattr(KeyDriftDetector, "observe", counting_observe)
+    monkeypatch.setattr(Detector, "wants", counting_wants)
+
+    report = _heuristic_analyze(events, "Schema mismatch")
+
+    assert report["findings"][0]["detector"] == "key_drift"
+    assert "'level' -> 'Level'" in report["proposed_fix"]["tool_schema_patch"]
+    # Every event reaches the detector exactly once, and routing is decided
+    # once per (type, tool) rather than once per event
+    assert len(observed) == len(events) and set(observed.values()) == {1}
+    assert len(routing_checks) == len(set(routing_checks))
+
+def test_cta_analyze_streams_the_trace_in_pages(monkeypatch):
+    import cta.analyze as analyze
+    from trace.store import iter_events, load_events
+
+    run_id = start_run("test_cta_stream")
+    append_event(run_id, {"type": "step", "agent": "Intake", "output": {"status": "ready"}})
+    for i in range(10):
+        append_event(run_id, {"type": "tool", "tool": "fetch_log_events",
+                              "output": [{"LineId": i, "level": "INFO", "Component": "nova.compute"}]})
+    append_event(run_id, {"type": "error", "message": "KeyError: 'Level'", "context": {"agent": "Auditor"}})
+
+    pages = []
+    def paged(run_id):
+        for event in iter_events(run_id, page_size=4):
+            pages.append(event["idx"])
+            yield event
+    monkeypatch.setattr(analyze, "iter_events", paged)
+
+    report = cta_analyze(run_id, "Schema mismatch", use_cache=False)
+    expected = _heuristic_analyze(load_events(run_id), "Schema mismatch")
+    assert pages == list(range(12))
+    assert report["primary_cause_step_id"] == expected["primary_cause_step_id"]
+    assert report["symptoms"] == expected["symptoms"]
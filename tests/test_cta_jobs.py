@@ -0,0 +1,138 @@
+import sys
+import os
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from cta.jobs import AnalysisJobQueue, QueueFull, PRIORITY_HIGH, PRIORITY_LOW
+from trace.store import start_run, get_job, save_cached_report, create_job, update_job, claim_job, list_jobs
+from cta.analyze import _report_cache_key
+
+class _BlockingAnalyzer:
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.order = []
+        self.profiles = []
+
+    def __call__(self, run_id, failure_text, use_cache=True, on_provisional=None, profile=None):
+        self.order.append(run_id)
+        self.profiles.append(profile)
+        self.started.set()
+        self.release.wait(5)
+        if failure_text == "boom":
+            raise RuntimeError("analyzer crashed")
+        return {"run_id": run_id, "method": "heuristic", "use_cache": use_cache}
+
+def test_jobs_run_by_priority_and_deduplicate():
+    analyzer = _BlockingAnalyzer()
+    queue = AnalysisJobQueue(workers=1, queue_limit=10, analyze=analyzer, recover=False)
+    try:
+        blocker = queue.submit(start_run("job_blocker"), "Schema mismatch")
+        assert analyzer.started.wait(5)
+
+        low_run, high_run = start_run("job_low"), start_run("job_high")
+        low = queue.submit(low_run, "Schema mismatch", priority=PRIORITY_LOW)
+        high = queue.submit(high_run, "Schema mismatch", priority=PRIORITY_HIGH)
+        assert high["status"] == "queued"
+
+        duplicate = queue.submit(low_run, "Schema mismatch", priority=PRIORITY_LOW)
+        assert duplicate["id"] == low["id"]
+        assert queue.get_status()["deduplicated"] == 1
+
+        analyzer.release.set()
+        for job in (blocker, low, high):
+            assert queue.wait(job["id"], timeout=5)["status"] == "done"
+        assert analyzer.order[1:] == [high_run, low_run]
+        assert get_job(low["id"])["report"]["run_id"] == low_run
+    finally:
+        analyzer.release.set()
+        queue.stop()
+
+def test_queue_limit_and_failures():
+    analyzer = _BlockingAnalyzer()
+    queue = AnalysisJobQueue(workers=1, queue_limit=1, analyze=analyzer, recover=False)
+    try:
+        crashing = queue.submit(start_run("job_crash"), "boom")
+        assert analyzer.started.wait(5)
+        queue.submit(start_run("job_waiting"), "Schema mismatch")
+        with pytest.raises(QueueFull):
+            queue.submit(start_run("job_rejected"), "Schema mismatch")
+
+        analyzer.release.set()
+        failed = queue.wait(crashing["id"], timeout=5)
+        assert failed["status"] == "failed"
+        assert "analyzer crashed" in failed["error"]
+    finally:
+        analyzer.release.set()
+        queue.stop()
+
+def test_stored_report_finishes_immediately():
+    analyzer = _BlockingAnalyzer()
+    queue = AnalysisJobQueue(workers=1, analyze=analyzer, recover=False)
+    run_id = start_run("job_cached")
+    save_cached_report(run_id, _report_cache_key(run_id, "Schema mismatch"), {"run_id": run_id, "method": "cached"})
+    try:
+        job = queue.submit(run_id, "Schema mismatch")
+        assert job["status"] == "done"
+        assert job["report"]["method"] == "cached"
+        assert analyzer.order == []
+
+        analyzer.release.set()
+        refreshed = queue.wait(queue.submit(run_id, "Schema mismatch", refresh=True)["id"], timeout=5)
+        assert refreshed["report"]["use_cache"] is False
+    finally:
+        analyzer.release.set()
+        queue.stop()
+
+def test_stored_report_creates_no_job_rows():
+    queue = AnalysisJobQueue(workers=1, analyze=_BlockingAnalyzer(), recover=False)
+    run_id = start_run("job_cached_rows")
+    save_cached_report(run_id, _report_cache_key(run_id, "Schema mismatch"), {"run_id": run_id, "method": "cached"})
+    for _ in range(3):
+        job = queue.submit(run_id, "Schema mismatch")
+        assert job["id"] is None and job["report"]["method"] == "cached"
+    assert [job for job in list_jobs() if job["run_id"] == run_id] == []
+
+def test_job_left_by_dead_process_is_taken_over():
+    run_id = start_run("job_orphaned")
+    # A row another process claimed and then died holding
+    orphan = create_job(run_id, "Schema mismatch", PRIORITY_LOW)
+    assert claim_job(orphan["id"])
+    update_job(orphan["id"], started_at="2000-01-01T00:00:00")
+
+    analyzer = _BlockingAnalyzer()
+    analyzer.release.set()
+    queue = AnalysisJobQueue(workers=1, analyze=analyzer, recover=False)
+    try:
+        job = queue.submit(run_id, "Schema mismatch")
+        assert job["id"] == orphan["id"]
+        assert queue.wait(job["id"], timeout=5)["status"] == "done"
+        assert analyzer.order == [run_id]
+        assert queue.get_status()["recovered"] == 1
+
+        # A job another live process is still running is left alone
+        busy_run = start_run("job_elsewhere")
+        busy = create_job(busy_run, "Schema mismatch", PRIORITY_LOW)
+        assert claim_job(busy["id"])
+        assert queue.submit(busy_run, "Schema mismatch")["status"] == "running"
+        assert analyzer.order == [run_id]
+    finally:
+        queue.stop()
+
+def test_profiled_analysis_runs_fresh_on_a_worker():
+    analyzer = _BlockingAnalyzer()
+    analyzer.release.set()
+    queue = AnalysisJobQueue(workers=1, queue_limit=10, analyze=analyzer, recover=False)
+    try:
+        with pytest.raises(ValueError):
+            queue.submit(start_run("job_profile_bad"), "Schema mismatch", profile="perf")
+
+        job = queue.submit(start_run("job_profile"), "Schema mismatch", profile="sample")
+        done = queue.wait(job["id"], timeout=5)
+        assert done["report"]["use_cache"] is False
+        assert analyzer.profiles == ["sample"]
+    finally:
+        queue.stop()
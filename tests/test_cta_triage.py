@@ -0,0 +1,99 @@
+import sys
+import os
+import random
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents.synthetic import NovaLogGenerator
+from cta.analyze import get_cached_analysis
+from cta.signature_bench import make_incident
+from cta.triage import triage_failed_runs, cluster_runs, compute_signatures
+from trace.store import start_run, append_event, save_metric, get_run, load_events_many
+
+def _failed_run(family, rng, generator, fail_reason="Schema mismatch in Auditor agent"):
+    run_id = start_run("triage")
+    for event in make_incident(family, rng, generator):
+        append_event(run_id, event)
+    save_metric(run_id, "status", "failed")
+    save_metric(run_id, "fail_reason", fail_reason)
+    return run_id
+
+class _CountingAnalyzer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, run_id, failure_text, use_cache=True):
+        self.calls.append(run_id)
+        return {"run_id": run_id, "method": "heuristic", "primary_cause_step_id": f"cause_of_{run_id}",
+                "confidence": 0.7, "analysis_time_s": 0.01}
+
+def test_bulk_load_groups_events_by_run():
+    rng, generator = random.Random(0), NovaLogGenerator(seed=0)
+    run_ids = [_failed_run("level_rename", rng, generator) for _ in range(2)]
+    events = load_events_many(run_ids + ["run_missing"])
+    assert [e["idx"] for e in events[run_ids[0]]] == list(range(len(events[run_ids[0]])))
+    assert events["run_missing"] == []
+
+def test_one_analysis_per_incident_fanned_out_to_members():
+    rng, generator = random.Random(1), NovaLogGenerator(seed=1)
+    level = [_failed_run("level_rename", rng, generator) for _ in range(5)]
+    latency = [_failed_run("latency_rename", rng, generator) for _ in range(3)]
+    timeout = [_failed_run("tool_timeout", rng, generator, fail_reason="Tool timeout")]
+    analyzer = _CountingAnalyzer()
+
+    result = triage_failed_runs(level + latency + timeout, analyze=analyzer)
+
+    assert result["runs"] == 9
+    assert result["analyses"] == len(analyzer.calls) == 3
+    assert result["shared"] == 6
+    assert sorted(c["size"] for c in result["clusters"]) == [1, 3, 5]
+    assert level[0] in analyzer.calls and latency[0] in analyzer.calls
+
+    report = get_cached_analysis(level[3], "Schema mismatch in Auditor agent")
+    assert report["primary_cause_step_id"] == f"cause_of_{level[0]}"
+    assert report["run_id"] == level[3]
+    assert report["triage"]["representative_run_id"] == level[0]
+    assert report["triage"]["cluster_size"] == 5
+    assert get_run(level[3])["mttr_cta_s"] is not None
+
+    # Members that already have a report keep it
+    again = triage_failed_runs(level, analyze=analyzer)
+    assert (again["analyses"], again["shared"], again["kept"]) == (1, 0, 4)
+
+def test_failure_text_splits_clusters():
+    rng, generator = random.Random(2), NovaLogGenerator(seed=2)
+    runs = [get_run(_failed_run("level_rename", rng, generator, fail_reason=reason)) for reason in ("a", "b", "a")]
+    clusters = cluster_runs(runs, compute_signatures([run["id"] for run in runs]))
+    assert sorted(len(c["members"]) for c in clusters) == [1, 2]
+
+def test_shared_report_points_at_the_members_own_steps():
+    def run(events):
+        run_id = start_run("triage")
+        for event in events:
+            append_event(run_id, event)
+        save_metric(run_id, "status", "failed")
+        save_metric(run_id, "fail_reason", "Schema mismatch in Auditor agent")
+        return run_id
+
+    error = {"type": "error", "message": "KeyError: 'Level'", "context": {"agent": "Auditor"}}
+    head = [{"type": "step", "agent": "Intake", "step_id": "intake"},
+            {"type": "tool", "tool": "fetch_log_events", "output": []}]
+    representative = run(head + [{"type": "step", "agent": "Retriever", "step_id": "rep-retriever"}, error,
+                                 {"type": "step", "agent": "Auditor", "step_id": "rep-auditor"}])
+    member = run(head + [{"type": "note", "message": "a"}, {"type": "note", "message": "b"}, error,
+                         {"type": "step", "agent": "Auditor", "step_id": "member-auditor"}])
+
+    def analyzer(run_id, failure_text, use_cache=True):
+        return {"run_id": run_id, "method": "heuristic", "primary_cause_step_id": "error_3", "confidence": 0.9,
+                "evidence": [{"step_id": "tool_1", "excerpt": "x"}, {"step_id": "step_2", "excerpt": "y"},
+                             {"step_id": "rep-auditor", "excerpt": "z"}, {"step_id": "cached", "excerpt": "c"}]}
+
+    result = triage_failed_runs([representative, member], threshold=0.0, analyze=analyzer, use_cache=False)
+    assert result["shared"] == 1
+
+    report = get_cached_analysis(member, "Schema mismatch in Auditor agent")
+    assert report["primary_cause_step_id"] == "error_4"
+    assert [e["step_id"] for e in report["evidence"]] == ["tool_1", "member-auditor", "cached"]
+    assert report["triage"]["representative_primary_cause_step_id"] == "error_3"
+    # The Retriever step has no counterpart in the member
+    assert report["triage"]["unmapped_step_ids"] == ["step_2"]
@@ -0,0 +1,67 @@
+import sys
+import os
+import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from integrations.llm import LLMClient
+from integrations.llm_cache import LLMResponseCache, cache_key, normalize_prompt
+from integrations.fake_llm import FakeLLMServer, DEFAULT_REPORT
+
+def _prompt(run_id, ts):
+    return [{"role": "user", "content": f"Run {run_id} failed at {ts} (trace 3f2b8c1e-9d4a-4c7e-8f00-1a2b3c4d5e6f): 'Level'"}]
+
+def test_volatile_fields_do_not_change_the_key():
+    a = _prompt("run_9dab87ca10da", "2026-10-19T08:15:02.123Z")
+    b = _prompt("run_0123456789ab", "2026-10-20 11:00:00")
+    assert normalize_prompt(a[0]["content"]) == normalize_prompt(b[0]["content"])
+    assert cache_key(a, "m", 0.1) == cache_key(b, "m", 0.1)
+    assert cache_key(a, "m", 0.1) != cache_key(a, "other", 0.1)
+    assert cache_key(a, "m", 0.1) != cache_key(a, "m", 0.7)
+    assert cache_key(a, "m", 0.1) != cache_key([{"role": "user", "content": "'Latency'"}], "m", 0.1)
+
+def test_lru_eviction_and_ttl(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=250, ttl_s=60)
+    for key in ("a", "b"):
+        cache.put(key, "x" * 100)
+    assert cache.get("a") == "x" * 100
+    cache.put("c", "x" * 100)
+    # b was used least recently
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+    cache.ttl_s = -1
+    assert cache.get("a") is None
+    status = cache.get_status()
+    assert status["evictions"] == 1
+    assert status["expired"] == 1
+    assert (status["hits"], status["misses"]) == (3, 2)
+
+def test_client_serves_recurring_prompt_from_cache(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"))
+    with FakeLLMServer() as server:
+        client = LLMClient(api_key="test", base_url=server.base_url, cache=cache)
+        first = client.chat_json(_prompt("run_9dab87ca10da", "2026-10-19T08:15:02"))
+        second = client.chat_json(_prompt("run_0123456789ab", "2026-10-19T09:00:00"))
+        client.chat_json(_prompt("run_0123456789ab", "2026-10-19T09:00:00"), use_cache=False)
+
+        assert first == second == DEFAULT_REPORT
+        assert server.get_status()["requests"] == 2
+        assert client.get_status()["cache"]["hits"] == 1
+
+def test_unparseable_reply_is_not_cached(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "cache.sqlite"))
+    prompt = _prompt("run_9dab87ca10da", "2026-10-19T08:15:02")
+    with FakeLLMServer(content="sorry, I can't produce JSON") as server:
+        client = LLMClient(api_key="test", base_url=server.base_url, cache=cache)
+        with pytest.raises(json.JSONDecodeError):
+            client.chat_json(prompt, stream=False)
+
+        # The next call asks again and keeps the good answer
+        server.content = json.dumps(DEFAULT_REPORT)
+        assert client.chat_json(prompt, stream=False) == DEFAULT_REPORT
+        assert client.chat_json(prompt, stream=False) == DEFAULT_REPORT
+        assert server.get_status()["requests"] == 2
+        assert client.get_status()["cache"]["hits"] == 1
@@ -0,0 +1,145 @@
+import sys
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+import integrations.llm as llm
+from integrations.llm import LLMClient, LLMError, JSONObjectScanner, extract_json
+from integrations.fake_llm import FakeLLMServer, DEFAULT_REPORT
+from cta.analyze import _llm_analyze, cta_analyze
+from trace.store import start_run, append_event, get_timings
+
+MESSAGES = [{"role": "user", "content": "Analyze"}]
+
+def _client(server, **kwargs):
+    kwargs.setdefault("backoff_base_s", 0.001)
+    return LLMClient(api_key="test", base_url=server.base_url, **kwargs)
+
+def test_scanner_finds_end_of_first_object():
+    scanner = JSONObjectScanner()
+    assert not scanner.feed('```json\n{"a": "}{\\"", "b": {')
+    assert scanner.feed('"c": 1}} trailing { prose')
+    assert scanner.result() == '{"a": "}{\\"", "b": {"c": 1}}'
+    assert extract_json('Sure:\n```json\n{"x": [1, 2]}\n```') == {"x": [1, 2]}
+
+def test_reuses_connections_and_bounds_concurrency():
+    with FakeLLMServer(latency_s=0.01) as server:
+        client = _client(server, max_concurrency=3)
+        with ThreadPoolExecutor(8) as pool:
+            reports = list(pool.map(lambda _: client.chat_json(MESSAGES, stream=False), range(24)))
+
+        assert all(r == DEFAULT_REPORT for r in reports)
+        status = server.get_status()
+        assert status["requests"] == 24
+        assert status["max_in_flight"] <= 3
+        assert status["connections"] <= 3
+
+def test_retries_throttling_then_succeeds():
+    with FakeLLMServer(fail_first=2, fail_status=429, retry_after="0") as server:
+        client = _client(server)
+        assert client.chat_json(MESSAGES) == DEFAULT_REPORT
+        assert client.get_status()["retries"] == 2
+
+def test_client_errors_are_not_retried():
+    with FakeLLMServer(fail_first=1, fail_status=400) as server:
+        client = _client(server)
+        with pytest.raises(LLMError) as excinfo:
+            client.chat(MESSAGES)
+        assert excinfo.value.status_code == 400
+        assert server.get_status()["requests"] == 1
+
+def test_deadline_bounds_retries():
+    with FakeLLMServer(fail_first=100, fail_status=503, retry_after="0.2") as server:
+        client = _client(server, max_retries=10)
+        t0 = time.monotonic()
+        with pytest.raises(LLMError):
+            client.chat(MESSAGES, deadline=time.monotonic() + 0.5)
+        assert time.monotonic() - t0 < 1.0
+        assert server.get_status()["requests"] <= 3
+
+def test_cancel_stops_retries_and_frees_the_slot():
+    with FakeLLMServer(fail_first=100, fail_status=503, retry_after="1") as server:
+        client = _client(server, max_retries=10, max_concurrency=1)
+        cancel = threading.Event()
+        threading.Timer(0.1, cancel.set).start()
+        t0 = time.monotonic()
+        with pytest.raises(LLMError, match="cancelled"):
+            client.chat(MESSAGES, deadline=t0 + 10, cancel=cancel)
+        assert time.monotonic() - t0 < 0.5
+        assert server.get_status()["requests"] == 1
+        assert client.slots.acquire(timeout=0)
+        client.slots.release()
+
+def test_stream_stops_once_json_is_complete():
+    content = '{"ok": true}' + " padding" * 200
+    with FakeLLMServer(content=content, chunk_size=4, chunk_delay_s=0.001) as server:
+        client = _client(server)
+        assert client.chat_json(MESSAGES, stream=True) == {"ok": True}
+        time.sleep(0.1)
+        assert server.get_status()["chunks_sent"] < len(content) // 4
+
+        assert client.chat(MESSAGES, stream=True) == content
+
+def test_llm_analyze_uses_shared_client(monkeypatch):
+    with FakeLLMServer() as server:
+        monkeypatch.setattr(llm, "_client", _client(server))
+        report = _llm_analyze([{"type": "error", "message": "'Level'"}], "Schema mismatch")
+        assert report["method"] == "llm"
+        assert report["primary_cause_step_id"] == "fake_step"
+        assert "Schema mismatch" in server.bodies[0]["messages"][1]["content"]
+
+def _speculative_run():
+    run_id = start_run("speculative")
+    append_event(run_id, {"type": "error", "message": "Unexpected token in speculative_probe_field",
+                          "context": {"agent": "SpeculativeProbe"}})
+    return run_id
+
+def test_heuristic_is_provisional_until_llm_answers(monkeypatch):
+    with FakeLLMServer(latency_s=0.3) as server:
+        monkeypatch.setattr(llm, "_client", _client(server))
+        provisional = []
+        t0 = time.monotonic()
+        report = cta_analyze(_speculative_run(), "Schema mismatch", use_cache=False,
+                             on_provisional=lambda r: provisional.append((time.monotonic() - t0, r)))
+
+        assert len(provisional) == 1
+        first_s, first = provisional[0]
+        assert first["provisional"] and first["method"] == "heuristic"
+        assert first_s < 0.3
+        assert report["method"] == "llm"
+        assert report["alternatives"][0]["method"] == "heuristic"
+        assert report["time_to_first_diagnosis_s"] < report["analysis_time_s"]
+
+def test_llm_past_deadline_leaves_heuristic_report(monkeypatch):
+    with FakeLLMServer(latency_s=2.0) as server:
+        monkeypatch.setattr(llm, "_client", _client(server, timeout_s=5))
+        t0 = time.monotonic()
+        report = cta_analyze(_speculative_run(), "Schema mismatch", use_cache=False, deadline=t0 + 0.3)
+
+        assert time.monotonic() - t0 < 1.5
+        assert report["method"] == "heuristic"
+        assert report["llm_status"] == "timeout"
+        assert "provisional" not in report
+
+def test_timed_out_llm_is_retried_on_the_next_analysis(monkeypatch):
+    with FakeLLMServer(latency_s=2.0) as server:
+        monkeypatch.setattr(llm, "_client", _client(server, timeout_s=5))
+        run_id = _speculative_run()
+        degraded = cta_analyze(run_id, "Schema mismatch", deadline=time.monotonic() + 0.3)
+        assert degraded["llm_status"] == "timeout"
+        assert "llm" not in degraded["timings"]
+
+        server.latency_s = 0.0
+        report = cta_analyze(run_id, "Schema mismatch")
+        assert report["method"] == "llm"
+        assert cta_analyze(run_id, "Schema mismatch") == report
+
+        # The LLM thread's spans are reported beside the analysis stages, not among them
+        assert {"llm_context", "llm"} <= set(report["timings"]["llm"]["stages"])
+        assert "llm" not in report["timings"]["stages"]
+        assert get_timings(run_id, "llm")
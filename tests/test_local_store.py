@@ -0,0 +1,64 @@
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from integrations.local_store import LocalEventStore
+
+def _store(tmp_path):
+    return LocalEventStore(str(tmp_path / "events.sqlite"))
+
+def test_local_store_events_roundtrip(tmp_path):
+    store = _store(tmp_path)
+    now = time.time()
+    store.insert_events([
+        {"LineId": i, "Level": "ERROR" if i % 4 == 0 else "INFO", "Component": "nova.api",
+         "latency_ms": 100 + i, "status": 200, "timestamp": now + i}
+        for i in range(8)
+    ])
+    store.insert_event({"LineId": 8, "Level": "INFO", "Component": "nova.compute", "timestamp": now + 8})
+
+    recent = store.get_recent_events(limit=3)
+    assert [e["LineId"] for e in recent] == [6, 7, 8]
+
+    after = store.get_events_after(now + 5)
+    assert [row["ts"] for row in after] == [now + 5, now + 6, now + 7, now + 8]
+
+    stats = store.get_log_stats(time_window=60)
+    assert stats["total_logs"] == 9
+    assert stats["by_level"] == {"ERROR": 2, "INFO": 7}
+    assert stats["by_component"] == {"nova.api": 8, "nova.compute": 1}
+
+    # Data survives reopening the file
+    assert len(_store(tmp_path).get_recent_events(limit=100)) == 9
+
+def test_local_store_audit_stats_and_filters(tmp_path):
+    store = _store(tmp_path)
+    store.insert_audit_results([
+        {"line_id": 1, "component": "nova.api", "is_anomaly": True, "latency_ms": 400, "status": 503},
+        {"line_id": 2, "component": "nova.api", "is_anomaly": False, "latency_ms": 100, "status": 200},
+        {"line_id": 3, "component": "nova.compute", "is_anomaly": False, "latency_ms": 150, "status": 404}
+    ])
+
+    stats = store.get_audit_stats(time_window=60)
+    assert stats["total_evaluated"] == 3
+    assert stats["anomalies_detected"] == 1
+    assert stats["status_4xx"] == 1 and stats["status_5xx"] == 1
+    assert abs(stats["latency_avg"] - 216.67) < 0.01
+    assert 100 <= stats["latency_p95"] <= 400
+
+    rows = store.get_audit_results(limit=10, filters={"component": "nova.api"})
+    assert [r["line_id"] for r in rows] == [2, 1]
+
+    assert store.fetch_logs_from_cloud("audit_results", filters={"component; DROP": 1}) == []
+    assert store.fetch_logs_from_cloud("no_such_table") == []
+
+def test_local_store_signatures(tmp_path):
+    store = _store(tmp_path)
+    store.insert_signature({"id": "sig1", "cause_label": "schema_drift", "embedding": [1.0, 0.0, 0.0], "patch_text": "p1"})
+    store.insert_signature({"id": "sig2", "cause_label": "timeout", "embedding": [0.0, 1.0, 0.0], "patch_text": "p2"})
+
+    match = store.find_similar_signature([0.9, 0.1, 0.0])
+    assert match["id"] == "sig1"
+    assert store.find_similar_signature([0.0, 0.0, 1.0]) is None
@@ -0,0 +1,100 @@
+import sys
+import os
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents.adapters import clear_adapters
+from agents.graph import run_pipeline
+import cta.analyze
+from cta.analyze import _heuristic_analyze, get_cached_analysis
+from cta.detectors import RuleEngine
+from cta.online import OnlineAnalyzer, enable_online_analysis
+from trace.store import start_run, append_event, load_events, get_run, save_metric
+
+def _without_online(report):
+    return {k: v for k, v in report.items() if k != "online"}
+
+def test_findings_can_be_asked_for_repeatedly():
+    engine = RuleEngine()
+    engine.observe({"type": "tool", "tool": "fetch_log_events", "idx": 0,
+                    "output": [{"Level": "INFO"}] * 3 + [{"level": "INFO"}] * 7})
+    first = engine.findings()
+    engine.observe({"type": "error", "idx": 1, "message": "'Level'", "context": {"agent": "Auditor"}})
+    second = engine.findings()
+
+    assert second == engine.findings()
+    drift_before = next(f for f in first if f["detector"] == "key_drift")
+    drift_after = next(f for f in second if f["detector"] == "key_drift")
+    # The majority spelling wins until a KeyError says which one consumers expect
+    assert drift_before["details"]["renames"] == {"Level": "level"}
+    assert drift_after["details"]["renames"] == {"level": "Level"}
+    assert drift_after["details"]["drifted_events"] == 7
+    assert drift_after["score"] > drift_before["score"]
+
+def test_failed_run_is_diagnosed_as_it_is_marked_failed():
+    clear_adapters()
+    analyzer = enable_online_analysis()
+    try:
+        run_id = start_run("online")
+        result = run_pipeline(run_id, "flaky", use_adapters=False)
+        assert result["status"] == "failed"
+
+        # Finished in the background, without anyone asking
+        assert analyzer.wait_idle(10)
+        report = get_cached_analysis(run_id, result["fail_reason"])
+        assert report is not None and report["run_id"] == run_id
+        assert get_run(run_id)["mttr_cta_s"] is not None
+
+        events = load_events(run_id)
+        candidate = analyzer.candidate(run_id, result["fail_reason"], len(events))
+        assert candidate["online"]
+        assert _without_online(candidate) == _heuristic_analyze(events, result["fail_reason"])
+    finally:
+        analyzer.stop()
+        clear_adapters()
+
+def test_partial_and_finished_runs_are_not_served():
+    analyzer = OnlineAnalyzer(max_runs=2)
+    run_id = start_run("online_partial")
+    append_event(run_id, {"type": "note", "message": "before the analyzer started"})
+    analyzer.start()
+    try:
+        append_event(run_id, {"type": "error", "message": "'Level'", "context": {"agent": "Auditor"}})
+        assert analyzer.candidate(run_id, "Schema mismatch") is None
+
+        ok_run = start_run("online_ok")
+        append_event(ok_run, {"type": "note", "message": "fine"})
+        assert analyzer.candidate(ok_run, "n/a") is not None
+        save_metric(ok_run, "status", "ok")
+        assert analyzer.candidate(ok_run, "n/a") is None
+
+        for i in range(3):
+            append_event(start_run("online_evict"), {"type": "note", "message": str(i)})
+        assert analyzer.get_status()["runs"] == 2
+        assert analyzer.get_status()["evicted"] >= 1
+    finally:
+        analyzer.stop()
+
+def test_publish_runs_off_the_pipeline_on_observed_events(monkeypatch):
+    calls = []
+
+    def analyze(run_id, failure_text, event_count=None):
+        calls.append((threading.current_thread().name, event_count))
+        raise RuntimeError("analysis crashed")
+
+    monkeypatch.setattr(cta.analyze, "cta_analyze", analyze)
+    clear_adapters()
+    analyzer = OnlineAnalyzer()
+    analyzer.start()
+    try:
+        run_id = start_run("online_background")
+        assert run_pipeline(run_id, "flaky", use_adapters=False)["status"] == "failed"
+        assert analyzer.wait_idle(10)
+    finally:
+        analyzer.stop()
+        clear_adapters()
+
+    assert calls == [(calls[0][0], len(load_events(run_id)))]
+    assert calls[0][0].startswith("cta-online")
+    assert analyzer.get_status()["failed"] == 1
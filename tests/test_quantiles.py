@@ -0,0 +1,79 @@
+import sys
+import os
+import random
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from trace.quantiles import QuantileSketch, sketch_of
+from integrations.clickhouse import summarize_audit_results
+
+def _exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+def test_sketch_relative_accuracy():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(5, 1) for _ in range(20000)]
+
+    sketch = sketch_of(values)
+
+    for q in (0.5, 0.95, 0.99):
+        exact = _exact_quantile(values, q)
+        assert abs(sketch.quantile(q) - exact) / exact <= 0.02
+    assert sketch.count == 20000
+    assert sketch.max == max(values)
+
+def test_sketch_small_sample_p95_is_not_max():
+    sketch = sketch_of(range(1, 21))
+
+    assert sketch.quantile(0.95) < 20
+    assert 18 <= sketch.quantile(0.95) <= 19.5
+    assert sketch.quantile(0.0) == 1
+    assert sketch.quantile(1.0) == 20
+
+def test_sketch_merge_matches_combined():
+    rng = random.Random(11)
+    parts = [[rng.uniform(1, 1000) for _ in range(1000)] for _ in range(4)]
+
+    merged = QuantileSketch()
+    for part in parts:
+        merged.merge(sketch_of(part))
+    combined = sketch_of([v for part in parts for v in part])
+
+    assert merged.count == combined.count
+    assert merged.bins == combined.bins
+    assert merged.quantile(0.95) == combined.quantile(0.95)
+
+def test_sketch_serialization_and_bounded_bins():
+    sketch = QuantileSketch(max_bins=64)
+    sketch.extend(10 ** (i / 100) for i in range(1000))
+
+    assert len(sketch.bins) <= 64
+    assert abs(sketch.quantile(0.99) - 10 ** 9.89) / 10 ** 9.89 <= 0.02
+
+    restored = QuantileSketch.from_dict(sketch.to_dict())
+    assert restored.quantile(0.5) == sketch.quantile(0.5)
+    assert restored.count == sketch.count
+
+def test_sketch_handles_zero_and_empty():
+    assert QuantileSketch().quantile(0.95) == 0.0
+
+    sketch = sketch_of([0, 0, 0, 5])
+    assert sketch.quantile(0.5) == 0
+    assert sketch.quantile(1.0) == 5
+
+def test_summarize_audit_results():
+    results = [
+        {"is_anomaly": 1, "component": "nova.api", "level": "ERROR", "latency_ms": 450, "status": 503},
+        {"is_anomaly": 0, "component": "nova.api", "level": "INFO", "latency_ms": 120, "status": 200},
+        {"is_anomaly": 0, "component": "nova.compute", "level": "INFO", "latency_ms": 200, "status": 404}
+    ]
+
+    stats = summarize_audit_results(results)
+
+    assert stats["total_evaluated"] == 3
+    assert stats["anomalies_detected"] == 1
+    assert stats["status_4xx"] == 1
+    assert stats["status_5xx"] == 1
+    assert stats["by_component"] == {"nova.api": 2, "nova.compute": 1}
+    assert abs(stats["latency_p50"] - 200) / 200 <= 0.02
@@ -1,14 +1,25 @@
 import sys
 import os
 import time
+import json
+import multiprocessing
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from agents.adapters import set_adapter, apply_adapters, clear_adapters, get_adapters
-from agents.failures import inject_drift, get_failure_state
+from agents.adapters import (
+    set_adapter, apply_adapters, clear_adapters, get_adapters,
+    apply_adapters_batch, apply_adapters_columnar, get_transform, AdapterRegistry
+)
+from agents.failures import (
+    inject_drift, get_failure_state, share_failure_state, attach_failure_state,
+    FaultProfile, InjectedFault, set_fault_profile, get_fault_profile, clear_fault_profiles, apply_tool_faults
+)
 from agents.tools import fetch_log_events, evaluate_event
 from agents.stream import StreamProducer, get_stream_status
-from integrations.clickhouse import insert_event, get_recent_events
+from agents.canary import canary_run, SequentialTest
+from agents.graph import trace_tool_call
+from integrations.clickhouse import insert_event, insert_events, get_recent_events
+from trace.store import get_run, load_events
 
 def test_adapter_mechanism():
     clear_adapters()
@@ -31,6 +42,115 @@ def test_adapter_mechanism():
     
     clear_adapters()
 
+def test_adapter_conforming_schema_skips_transform():
+    clear_adapters()
+    set_adapter({"level": "Level"})
+    
+    evt_normal = {"LineId": 2, "Level": "INFO", "Component": "nova.compute"}
+    assert get_transform(evt_normal.keys()) is None
+    assert apply_adapters(evt_normal) is evt_normal
+    
+    evt_broken = {"LineId": 1, "level": "INFO", "Component": "nova.compute"}
+    transform = get_transform(evt_broken.keys())
+    assert transform is not None
+    assert get_transform(evt_broken.keys()) is transform
+    
+    evt_fixed = apply_adapters(evt_broken)
+    assert evt_fixed == {"LineId": 1, "Level": "INFO", "Component": "nova.compute"}
+    assert "level" in evt_broken
+    
+    set_adapter({"Component": "component"})
+    assert get_transform(evt_normal.keys()) is not None
+    
+    clear_adapters()
+
+def test_adapter_chained_renames():
+    clear_adapters()
+    set_adapter({"lvl": "level"})
+    set_adapter({"level": "Level"})
+    
+    assert apply_adapters({"lvl": "INFO"}) == {"Level": "INFO"}
+    assert apply_adapters({"lvl": "INFO", "level": "WARN"}) == {"lvl": "INFO", "Level": "WARN"}
+    
+    clear_adapters()
+
+def test_adapter_batch_apis():
+    clear_adapters()
+    
+    rows = [{"LineId": i, "level": "INFO"} for i in range(3)]
+    assert apply_adapters_batch(rows) is rows
+    
+    set_adapter({"level": "Level"})
+    
+    mixed = rows + [{"LineId": 9, "Level": "ERROR"}]
+    adapted = apply_adapters_batch(mixed)
+    assert all("Level" in r and "level" not in r for r in adapted)
+    assert adapted[-1] is mixed[-1]
+    
+    columns = {"LineId": [1, 2, 3], "level": ["INFO", "ERROR", "INFO"]}
+    adapted_columns = apply_adapters_columnar(columns)
+    assert adapted_columns["Level"] is columns["level"]
+    assert "level" not in adapted_columns
+    
+    clear_adapters()
+
+def test_adapter_registry_versions_across_processes(tmp_path):
+    path = str(tmp_path / "adapter_config.json")
+    
+    writer = AdapterRegistry(path, refresh_interval_s=0.0)
+    reader = AdapterRegistry(path, refresh_interval_s=0.0)
+    assert writer.version == 0
+    assert reader.adapters == {}
+    
+    writer.set({"level": "Level"})
+    assert writer.version == 1
+    # Readable by other users
+    assert os.stat(path).st_mode & 0o777 == 0o644
+    assert reader.refresh() is True
+    assert reader.version == 1
+    assert reader.adapters == {"level": "Level"}
+    assert reader.refresh() is False
+    
+    reader.set({"Component": "component"})
+    assert reader.version == 2
+    writer.refresh()
+    assert writer.adapters == {"level": "Level", "Component": "component"}
+    
+    writer.clear()
+    reader.refresh()
+    assert reader.version == 3
+    assert reader.adapters == {}
+    
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["adapter_config.json", "adapter_config.json.lock"]
+
+    # A mode the operator set is kept across publishes
+    os.chmod(path, 0o640)
+    writer.set({"level": "Level"})
+    assert os.stat(path).st_mode & 0o777 == 0o640
+
+def test_adapter_registry_throttles_staleness_check(tmp_path):
+    path = str(tmp_path / "adapter_config.json")
+    
+    writer = AdapterRegistry(path, refresh_interval_s=0.0)
+    reader = AdapterRegistry(path, refresh_interval_s=60.0)
+    
+    writer.set({"level": "Level"})
+    assert reader.refresh() is False
+    assert reader.adapters == {}
+    assert reader.refresh(force=True) is True
+    assert reader.adapters == {"level": "Level"}
+
+def test_adapter_registry_reads_legacy_file(tmp_path):
+    path = tmp_path / "adapter_config.json"
+    path.write_text(json.dumps({"level": "Level"}))
+    
+    registry = AdapterRegistry(str(path))
+    assert registry.version == 0
+    assert registry.adapters == {"level": "Level"}
+    
+    registry.set({"lvl": "Level"})
+    assert registry.version == 1
+
 def test_failure_injection():
     inject_drift(False)
     state = get_failure_state()
@@ -77,6 +197,118 @@ def test_stream_producer():
     status = producer.get_status()
     assert status["running"] == False
 
+def test_stream_producer_high_rate_batches():
+    producer = StreamProducer(events_per_second=10000.0)
+    
+    producer.start()
+    time.sleep(0.5)
+    producer.stop()
+    
+    status = producer.get_status()
+    assert status["total_events"] >= 3000
+    assert status["total_batches"] < status["total_events"]
+    assert status["target_events_per_second"] == 10000.0
+    assert status["achieved_events_per_second"] > 6000
+    assert status["insert_errors"] == 0
+
+def test_stream_producer_counts_failed_inserts(monkeypatch):
+    from integrations.clickhouse import ClickHouseClient
+    import agents.stream as stream
+    
+    class _FailingNative:
+        def execute(self, *args):
+            raise ConnectionError("server gone")
+    
+    client = ClickHouseClient()
+    client.use_mock, client.client = False, _FailingNative()
+    assert client.insert_events([{"id": "a", "ts": time.time()}]) is False
+    
+    monkeypatch.setattr(stream, "insert_events", client.insert_events)
+    producer = StreamProducer(events_per_second=200.0)
+    producer.start()
+    time.sleep(0.2)
+    producer.stop()
+    
+    status = producer.get_status()
+    assert status["insert_errors"] == status["total_batches"] > 0
+
+def test_stream_producer_rate_does_not_drift():
+    producer = StreamProducer(events_per_second=50.0)
+    
+    producer.start()
+    time.sleep(1.0)
+    producer.stop()
+    
+    status = producer.get_status()
+    assert 40 <= status["total_events"] <= 60
+    assert 0.8 <= status["rate_ratio"] <= 1.2
+
+def test_stream_producer_multi_worker_threads():
+    producer = StreamProducer(events_per_second=2000.0, workers=4)
+    
+    producer.start()
+    time.sleep(0.5)
+    t0 = time.time()
+    producer.stop()
+    assert time.time() - t0 < 2.5
+    
+    status = producer.get_status()
+    assert status["worker_count"] == 4
+    assert len(status["workers"]) == 4
+    assert all(w["events"] > 0 for w in status["workers"])
+    assert all(w["target_events_per_second"] == 500.0 for w in status["workers"])
+    assert status["total_events"] == sum(w["events"] for w in status["workers"])
+    
+    producer.configure(workers=2)
+    producer.start()
+    time.sleep(0.2)
+    producer.stop()
+    
+    status = producer.get_status()
+    assert len(status["workers"]) == 2
+    assert status["total_events"] > sum(w["events"] for w in status["workers"])
+
+def _report_failure_state(shared_flags, queue):
+    attach_failure_state(shared_flags)
+    queue.put(get_failure_state())
+
+def test_failure_flags_reach_process_workers():
+    inject_drift(False)
+    shared = share_failure_state()
+    inject_drift(True)
+    
+    queue = multiprocessing.Queue()
+    worker = multiprocessing.Process(target=_report_failure_state, args=(shared, queue))
+    worker.start()
+    state = queue.get(timeout=5)
+    worker.join(timeout=5)
+    
+    inject_drift(False)
+    assert state["schema_drift"] is True
+    assert state["currency_mix"] is False
+    assert shared[0] == 0
+
+def test_stream_producer_process_workers():
+    producer = StreamProducer(events_per_second=1000.0, workers=2, mode="process")
+    
+    producer.start()
+    time.sleep(0.5)
+    producer.stop()
+    
+    status = producer.get_status()
+    assert status["mode"] == "process"
+    assert status["running"] is False
+    assert all(w["events"] > 0 for w in status["workers"])
+    assert status["unclean_shutdowns"] == 0
+
+def test_insert_events_bulk():
+    events = [{"LineId": 50000 + i, "Level": "INFO", "timestamp": time.time()} for i in range(5)]
+    
+    insert_events(events)
+    
+    recent = get_recent_events(limit=5)
+    assert [e["LineId"] for e in recent] == [50000 + i for i in range(5)]
+
 def test_clickhouse_mock():
     event = {
         "LineId": 123,
@@ -114,3 +346,173 @@ def test_adapter_with_pipeline_integration():
     
     clear_adapters()
 
+
+def test_canary_early_rollback_on_errors():
+    clear_adapters()
+    
+    events = [{"LineId": i, "level": "INFO", "latency_ms": 100} for i in range(1000)]
+    result = canary_run("test_canary_rollback", events=events, batch_size=50, workers=2)
+    
+    assert result["stopped_early"] is True
+    assert result["early_decision"] == "rollback"
+    assert result["requested"] == 1000
+    assert result["total"] < 1000
+    assert result["passed"] is False
+    assert "Error rate" in result["reason"]
+
+def test_canary_early_promotion():
+    clear_adapters()
+    
+    events = [{"LineId": i, "Level": "INFO", "latency_ms": 100} for i in range(1000)]
+    result = canary_run("test_canary_promote", events=events, batch_size=50, workers=4)
+    
+    assert result["stopped_early"] is True
+    assert result["early_decision"] == "promote"
+    assert result["total"] <= 300
+    assert result["errors"] == 0
+    assert result["passed"] is True
+
+def test_canary_without_early_stop_runs_all_events():
+    clear_adapters()
+    set_adapter({"level": "Level"})
+    
+    events = [{"LineId": i, "level": "INFO"} for i in range(120)]
+    result = canary_run("test_canary_full", events=events, batch_size=25, early_stop=False)
+    
+    assert result["stopped_early"] is False
+    assert result["total"] == 120
+    assert result["batches"] == 5
+    assert result["passed"] is True
+
+    # Every batch is traced to one registered run
+    canary = get_run(result["canary_run_id"])
+    assert canary["mode"] == "canary:test_canary_full" and canary["status"] == "ok"
+    assert [e["args"]["batch"] for e in load_events(result["canary_run_id"])] == list(range(5))
+    
+    clear_adapters()
+
+def test_sequential_test_boundaries():
+    test = SequentialTest(0.01)
+    assert test.decision() is None
+    
+    test.update(0, 500)
+    assert test.decision() == "accept"
+    
+    test = SequentialTest(0.01)
+    test.update(3, 5)
+    assert test.decision() == "reject"
+
+def test_fault_profile_scoping_and_validation():
+    clear_fault_profiles()
+    set_fault_profile("fixed_latency")
+    set_fault_profile({"name": "tool", "error_probability": 0.5}, tool="evaluate_event")
+    set_fault_profile("flaky_tool", tool="evaluate_event", run_id="run_a")
+    
+    assert get_fault_profile().name == "fixed_latency"
+    assert get_fault_profile("fetch_log_events", "run_b").name == "fixed_latency"
+    assert get_fault_profile("evaluate_event", "run_b").name == "tool"
+    assert get_fault_profile("evaluate_event", "run_a").name == "flaky_tool"
+    
+    set_fault_profile(None, tool="evaluate_event")
+    assert get_fault_profile("evaluate_event").name == "fixed_latency"
+    clear_fault_profiles()
+    assert not get_fault_profile().active
+    
+    for bad in ({"latency_distribution": "pareto"}, {"error_probability": 1.5}, {"bogus": 1}):
+        try:
+            FaultProfile.from_dict(bad)
+            assert False, bad
+        except ValueError:
+            pass
+
+def test_fault_profile_latency_and_errors():
+    clear_fault_profiles()
+    tail = FaultProfile("tail", "fixed", latency_ms=10, spike_probability=0.1, spike_ms=1000)
+    samples = [tail.sample_latency_ms() for _ in range(2000)]
+    assert min(samples) == 10
+    assert 0.05 <= sum(1 for v in samples if v > 500) / 2000 <= 0.15
+    
+    set_fault_profile({"latency_distribution": "fixed", "latency_ms": 30, "error_probability": 1.0}, tool="flaky")
+    t0 = time.perf_counter()
+    try:
+        apply_tool_faults("flaky")
+        assert False
+    except InjectedFault:
+        pass
+    assert time.perf_counter() - t0 >= 0.03
+    apply_tool_faults("other")
+    clear_fault_profiles()
+
+def test_injected_retriever_fault_fails_the_run():
+    from agents.graph import run_pipeline
+    from trace.store import start_run, load_events
+    clear_fault_profiles()
+    run_id = start_run("good")
+    set_fault_profile({"error_probability": 1.0}, tool="fetch_log_events", run_id=run_id)
+    try:
+        result = run_pipeline(run_id, "good")
+    finally:
+        clear_fault_profiles()
+    
+    assert result["status"] == "failed"
+    assert result["fail_reason"] == "Tool failure in Retriever agent"
+    errors = [e for e in load_events(run_id) if e["type"] == "error"]
+    assert errors[0]["context"] == {"agent": "Retriever", "tool": "fetch_log_events"}
+    assert "Injected fault in fetch_log_events" in errors[0]["message"]
+
+def test_fault_profile_partial_drift_in_tool_calls():
+    clear_fault_profiles()
+    set_fault_profile({"drift_ratio": 1.0}, run_id="drift_run")
+    
+    events = trace_tool_call("drift_run", "fetch_log_events", [False], lambda: fetch_log_events(count=5))
+    assert all("level" in e and "Level" not in e for e in events)
+    
+    events = trace_tool_call("clean_run", "fetch_log_events", [False], lambda: fetch_log_events(count=5))
+    assert all("Level" in e for e in events)
+    clear_fault_profiles()
+
+def test_canary_rolls_back_under_injected_errors():
+    clear_adapters()
+    clear_fault_profiles()
+    set_fault_profile({"error_probability": 0.5}, tool="evaluate_event")
+    events = [{"LineId": i, "Level": "INFO", "latency_ms": 100} for i in range(200)]
+    
+    result = canary_run("fault_profile", events=events)
+    clear_fault_profiles()
+    
+    assert result["passed"] is False
+    assert result["early_decision"] == "rollback"
+
+def test_canary_rolls_back_under_injected_latency():
+    clear_adapters()
+    clear_fault_profiles()
+    set_fault_profile({"latency_distribution": "fixed", "latency_ms": 600}, tool="evaluate_event")
+    events = [{"LineId": i, "Level": "INFO", "latency_ms": 100} for i in range(20)]
+    
+    result = canary_run("latency_profile", events=events, batch_size=1, workers=4)
+    clear_fault_profiles()
+    
+    assert result["early_decision"] == "rollback"
+    assert result["total"] < 20
+    assert result["latency_p95_ms"] > 500
+    assert "P95 latency" in result["reason"]
+
+def _report_fault_profile(shared_flags, queue):
+    attach_failure_state(shared_flags)
+    queue.put(get_fault_profile("anything").to_dict())
+
+def test_global_fault_profile_reaches_process_workers():
+    clear_fault_profiles()
+    shared = share_failure_state()
+    set_fault_profile("tail_spikes")
+    
+    queue = multiprocessing.Queue()
+    worker = multiprocessing.Process(target=_report_fault_profile, args=(shared, queue))
+    worker.start()
+    profile = queue.get(timeout=5)
+    worker.join(timeout=5)
+    clear_fault_profiles()
+    
+    assert profile["latency_distribution"] == "fixed"
+    assert profile["spike_ms"] == 1500
+    assert profile["spike_probability"] == 0.02
@@ -14,9 +14,10 @@ from cta.actions import (
     _create_simple_embedding
 )
 from cta.analyze import cta_analyze
+from cta.signatures import EMBEDDING_DIM
 from agents.adapters import get_adapters, clear_adapters, set_adapter
 from agents.graph import run_pipeline
-from trace.store import start_run, get_run, append_event
+from trace.store import start_run, get_run, append_event, get_events_hash
 from integrations.clickhouse import insert_event
 
 def test_parse_adapter_from_report():
@@ -173,7 +174,7 @@ def test_create_simple_embedding():
     
     embedding = _create_simple_embedding(events)
     
-    assert len(embedding) == 32
+    assert len(embedding) == EMBEDDING_DIM
     assert all(0.0 <= v <= 1.0 for v in embedding)
 
 def test_signature_cache_miss():
@@ -248,3 +249,24 @@ def test_cached_analysis_on_repeat():
     
     clear_adapters()
 
+
+def test_report_cache_reused_until_events_change():
+    clear_adapters()
+    
+    run_id = start_run("test_report_cache")
+    run_pipeline(run_id, "flaky", use_adapters=False)
+    
+    report_1 = cta_analyze(run_id, "Schema mismatch")
+    mttr = get_run(run_id)["mttr_cta_s"]
+    
+    report_2 = cta_analyze(run_id, "Schema mismatch")
+    assert report_2 == report_1
+    assert get_run(run_id)["mttr_cta_s"] == mttr
+    
+    hash_before = get_events_hash(run_id)
+    append_event(run_id, {"type": "note", "message": "late event"})
+    assert get_events_hash(run_id) != hash_before
+    
+    report_3 = cta_analyze(run_id, "Schema mismatch")
+    assert report_3["analysis_time_s"] != report_1["analysis_time_s"]
+    assert cta_analyze(run_id, "Schema mismatch") == report_3
@@ -0,0 +1,111 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from trace.schema_index import SchemaIndex, item_schema, fingerprint, rename_score
+from cta.detectors import RuleEngine, SchemaDriftDetector
+
+def _good(i):
+    return {"LineId": i, "Level": "INFO", "Component": "nova.api", "latency_ms": 120, "status": 200,
+            "trace": None if i % 2 else "abc"}
+
+def test_fingerprint_ignores_key_order():
+    a = {"x": 1, "y": "s"}
+    b = {"y": "t", "x": 2}
+    assert fingerprint(item_schema(a)) == fingerprint(item_schema(b))
+    assert fingerprint(item_schema(a)) != fingerprint(item_schema({"x": 1.5, "y": "s"}))
+
+def test_index_persists_and_matches_known_schemas(tmp_path):
+    path = str(tmp_path / "schema_index.json")
+    index = SchemaIndex(path)
+    assert index.learn("fetch_log_events", [_good(i) for i in range(50)]) == 50
+
+    reloaded = SchemaIndex(path)
+    assert reloaded.knows("fetch_log_events")
+    assert reloaded.check("fetch_log_events", _good(7)) is None
+    assert reloaded.check("other_tool", {"a": 1}) is None
+    assert reloaded.get_status()["tools"]["fetch_log_events"]["schemas"] == 2
+
+    # A second learner merges into the same file
+    SchemaIndex(path).learn("fetch_log_events", [dict(_good(1), region="eu")])
+    assert SchemaIndex(path).tools["fetch_log_events"]["runs"] == 2
+
+def test_known_schemas_are_not_rewritten_and_peers_are_picked_up(tmp_path):
+    path = str(tmp_path / "schema_index.json")
+    index = SchemaIndex(path, refresh_interval_s=0.0)
+    index.learn("fetch_log_events", [_good(i) for i in range(50)])
+    stamp = os.stat(path).st_mtime_ns, index.version
+
+    assert index.learn("fetch_log_events", [_good(i) for i in range(10)]) == 0
+    assert (os.stat(path).st_mtime_ns, index.version) == stamp
+    assert index.learn("fetch_log_events", [_good(1)], force=True) == 1
+
+    # Schemas another process learns are seen without a reload
+    SchemaIndex(path).learn("other_tool", [{"a": 1}])
+    assert index.knows("other_tool")
+    assert index.check("other_tool", {"a": 2}) is None
+    # mkstemp's 0600 is widened so other users can read the index
+    assert os.stat(path).st_mode & 0o777 == 0o644
+
+def test_index_reports_renames_removals_and_type_changes(tmp_path):
+    index = SchemaIndex(str(tmp_path / "schema_index.json"))
+    index.learn("fetch_log_events", [_good(i) for i in range(50)])
+
+    drifted = _good(1)
+    drifted["level"] = drifted.pop("Level")
+    drifted["latency_ms"] = "120"
+    del drifted["status"]
+    drifted["region"] = "eu"
+
+    diff = index.check("fetch_log_events", drifted)
+
+    assert diff["renamed"] == [{"from": "level", "to": "Level", "score": 1.0}]
+    assert diff["removed"] == ["status"]
+    assert diff["added"] == ["region"]
+    assert diff["type_changed"] == [{"field": "latency_ms", "expected": ["int"], "got": "str"}]
+    assert index.check("fetch_log_events", drifted) is diff
+
+def test_rename_score_prefers_similar_names_and_types():
+    assert rename_score("Level", ["str"], "log_level", "str") > rename_score("Level", ["str"], "status", "int")
+    assert rename_score("request_id", ["str"], "RequestId", "str") == 1.0
+
+def test_schema_drift_detector_finding(tmp_path):
+    index = SchemaIndex(str(tmp_path / "schema_index.json"))
+    index.learn("fetch_log_events", [_good(i) for i in range(50)])
+
+    drifted = [_good(i) for i in range(10)]
+    for evt in drifted[5:]:
+        evt["severity"] = evt.pop("Level")
+    events = [{"idx": i, "type": "tool", "tool": "fetch_log_events", "output": [evt]} for i, evt in enumerate(drifted)]
+
+    class Detector(SchemaDriftDetector):
+        def __init__(self):
+            super().__init__(index)
+
+    findings = RuleEngine([Detector]).run(events)
+
+    assert len(findings) == 1
+    assert findings[0]["step_id"] == "tool_5"
+    assert findings[0]["details"]["events"] == 5
+    assert findings[0]["details"]["renamed"][0]["from"] == "severity"
+    assert findings[0]["details"]["renamed"][0]["to"] == "Level"
+    assert "'severity' -> 'Level'" in findings[0]["fix"]["tool_schema_patch"]
+
+def test_long_lived_engine_follows_the_index(tmp_path):
+    index = SchemaIndex(str(tmp_path / "schema_index.json"))
+
+    class Detector(SchemaDriftDetector):
+        def __init__(self):
+            super().__init__(index)
+
+    engine = RuleEngine([Detector])
+    drifted = dict(_good(1), severity="INFO")
+    del drifted["Level"]
+    engine.observe({"idx": 0, "type": "tool", "tool": "fetch_log_events", "output": [drifted]})
+    assert engine.findings() == []
+
+    # Learned after the engine first routed this tool
+    index.learn("fetch_log_events", [_good(i) for i in range(50)])
+    engine.observe({"idx": 1, "type": "tool", "tool": "fetch_log_events", "output": [drifted]})
+    assert [f["step_id"] for f in engine.findings()] == ["tool_1"]
@@ -0,0 +1,118 @@
+import sys
+import os
+import threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+import pytest
+
+from cta.signature_index import SignatureIndex, migrate_unsuffixed
+
+def _sig(i, embedding, label="tool_1"):
+    return {"id": f"sig_{i}", "cause_label": label, "embedding": list(embedding), "patch_text": '{"level": "Level"}'}
+
+def test_add_search_and_reload(tmp_path):
+    path = str(tmp_path / "signatures")
+    index = SignatureIndex(path)
+    assert index.find_similar([1.0, 0.0, 0.0]) is None
+
+    index.add(_sig(1, [1.0, 0.0, 0.0]))
+    index.add(_sig(2, [0.0, 1.0, 0.0], label="tool_2"))
+
+    match = index.find_similar([0.9, 0.1, 0.0])
+    assert match["id"] == "sig_1"
+    assert match["patch_text"] == '{"level": "Level"}'
+    assert index.find_similar([0.0, 0.0, 1.0]) is None
+
+    reloaded = SignatureIndex(path)
+    assert len(reloaded) == 2
+    assert reloaded.find_similar([0.1, 0.9, 0.0])["cause_label"] == "tool_2"
+
+def test_readd_replaces_by_id(tmp_path):
+    path = str(tmp_path / "signatures")
+    index = SignatureIndex(path)
+    index.add(_sig(1, [1.0, 0.0]))
+    index.add(_sig(1, [0.0, 1.0]))
+
+    assert len(index) == 1
+    assert index.find_similar([1.0, 0.0]) is None
+    assert SignatureIndex(path).find_similar([0.0, 1.0])["id"] == "sig_1"
+
+def test_top_k_and_batch(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((200, 16))
+    index = SignatureIndex(str(tmp_path / "signatures"))
+    index.add_many([_sig(i, v) for i, v in enumerate(vectors)])
+
+    top = index.search(vectors[17], k=5)
+    assert len(top) == 5
+    assert top[0]["id"] == "sig_17"
+    assert [m["similarity"] for m in top] == sorted((m["similarity"] for m in top), reverse=True)
+
+    batch = index.search_batch(vectors[[3, 42]], k=1)
+    assert [m[0]["id"] for m in batch] == ["sig_3", "sig_42"]
+
+def test_picks_up_appends_from_other_writers(tmp_path):
+    path = str(tmp_path / "signatures")
+    reader = SignatureIndex(path, refresh_interval_s=0)
+    SignatureIndex(path).add(_sig(1, [1.0, 0.0]))
+    assert reader.find_similar([1.0, 0.0])["id"] == "sig_1"
+
+def test_lsh_finds_near_duplicates(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((500, 32))
+    index = SignatureIndex(str(tmp_path / "signatures"), lsh_min_entries=100)
+    index.add_many([_sig(i, v) for i, v in enumerate(vectors)])
+    assert index.get_status()["lsh"]
+
+    for i in range(0, 500, 50):
+        noisy = vectors[i] + rng.standard_normal(32) * 0.05
+        assert index.find_similar(noisy, threshold=0.9)["id"] == f"sig_{i}"
+
+def test_search_while_another_thread_adds(tmp_path):
+    rng = np.random.default_rng(1)
+    index = SignatureIndex(str(tmp_path / "signatures"), lsh_min_entries=200)
+    target = rng.standard_normal(16)
+    index.add(_sig("target", target))
+    errors = []
+
+    def search():
+        try:
+            for _ in range(200):
+                assert index.search(target, k=1)[0]["id"] == "sig_target"
+                assert index.search_batch([target], k=1)[0][0]["id"] == "sig_target"
+        except Exception as e:
+            errors.append(e)
+
+    reader = threading.Thread(target=search)
+    reader.start()
+    # Many small appends, each resizing the matrix or building the LSH tables
+    for i in range(300):
+        index.add(_sig(i, rng.standard_normal(16)))
+    reader.join()
+    assert errors == []
+
+def test_dimension_mismatch(tmp_path):
+    index = SignatureIndex(str(tmp_path / "signatures"))
+    index.add(_sig(1, [1.0, 0.0, 0.0]))
+    assert index.find_similar([1.0, 0.0]) is None
+    with pytest.raises(ValueError):
+        index.add(_sig(2, [1.0, 0.0]))
+    assert index.sync_from([_sig(3, [1.0, 0.0]), _sig(4, [0.0, 1.0, 0.0])]) == 1
+
+def test_unsuffixed_index_is_migrated_and_removed(tmp_path):
+    legacy = str(tmp_path / "signatures")
+    old = SignatureIndex(legacy)
+    old.add(_sig(1, [1.0, 0.0, 0.0], label="old_label"))
+    old.add(_sig(1, [0.0, 1.0, 0.0], label="tool_1"))
+    old.add(_sig(2, [0.0, 0.0, 1.0]))
+
+    index = SignatureIndex(legacy + ".4d", dim=4)
+    reembed = lambda record: [1.0, 0.0, 0.0, 0.0] if record["id"] == "sig_1" else None
+    assert migrate_unsuffixed(index, reembed, legacy_path=legacy) == 1
+
+    assert not os.path.exists(legacy + ".jsonl") and not os.path.exists(legacy + ".f32")
+    match = SignatureIndex(legacy + ".4d", dim=4).find_similar([1.0, 0.0, 0.0, 0.0])
+    assert (match["id"], match["cause_label"]) == ("sig_1", "tool_1")
+    assert migrate_unsuffixed(index, reembed, legacy_path=legacy) == 0
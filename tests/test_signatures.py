@@ -0,0 +1,43 @@
+import sys
+import os
+import random
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from agents.synthetic import NovaLogGenerator
+from cta.signatures import incident_features, incident_embedding, normalize_message
+from cta.signature_bench import FAMILIES, make_incident, build_incident_set, run_benchmark
+
+def _similarity(a, b):
+    return float(np.dot(incident_embedding(a), incident_embedding(b)))
+
+def test_normalize_message_masks_ids_and_numbers():
+    assert normalize_message("Tool x timed out after 30s") == normalize_message("Tool x timed out after 45s")
+    assert normalize_message("run_9dab87ca10da failed") == "run_# failed"
+    assert normalize_message("'Level'") == "'Level'"
+
+def test_features_count_each_shingle_once():
+    error = {"type": "error", "message": "'Level'", "context": {"agent": "Auditor", "event": {"level": "INFO"}}}
+    assert incident_features([error] * 3) == incident_features([error] * 50)
+    assert "error_field:level" in incident_features([error])
+
+def test_near_duplicates_match_and_families_separate():
+    rng = random.Random(0)
+    generator = NovaLogGenerator(seed=0)
+    level_a = make_incident("level_rename", rng, generator)
+    level_b = make_incident("level_rename", rng, generator)
+    latency = make_incident("latency_rename", rng, generator)
+
+    assert _similarity(level_a, level_b) >= 0.9
+    assert _similarity(level_a, latency) < 0.85
+    assert incident_embedding(level_a) == incident_embedding(level_a)
+
+def test_benchmark_beats_exact_hash():
+    stored, probes = build_incident_set(references=1, queries=10, seed=1)
+    assert len(stored) == len(FAMILIES)
+
+    at_threshold = {r["threshold"]: r for r in run_benchmark(incident_embedding, stored, probes)}[0.85]
+    assert at_threshold["hit_rate"] >= 0.95
+    assert at_threshold["false_match_rate"] <= 0.02
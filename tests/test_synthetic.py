@@ -0,0 +1,64 @@
+import sys
+import os
+import csv
+import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from agents.synthetic import NovaLogGenerator, CSV_FIELDS
+from agents.tools import LEVELS, COMPONENTS
+
+def test_generator_is_reproducible_per_stream():
+    a = NovaLogGenerator(seed=7, start_ts=1000.0).generate(200)
+    b = NovaLogGenerator(seed=7, start_ts=1000.0).generate(200)
+    other = NovaLogGenerator(seed=7, stream=1, start_ts=1000.0).generate(200)
+
+    assert a == b
+    assert a != other
+    assert abs(a[1]["timestamp"] - a[0]["timestamp"] - 0.001) < 1e-9
+
+def test_generated_events_match_nova_shape():
+    events = NovaLogGenerator(seed=1).generate(2000)
+
+    for evt in events:
+        assert evt["Level"] in LEVELS
+        assert evt["Component"] in COMPONENTS
+        assert 100 <= evt["latency_ms"] <= 500
+        assert 1000 <= evt["LineId"] <= 9999
+        if evt["Level"] == "ERROR":
+            assert evt["status"] in (500, 503, 404)
+        else:
+            assert evt["status"] == 200
+        assert f"status: {evt['status']}" in evt["Content"]
+    assert {evt["Level"] for evt in events} == set(LEVELS)
+
+def test_drift_and_anomaly_injection():
+    generator = NovaLogGenerator(seed=3, drift_ratio=0.25, anomaly_rate=0.1)
+    columns = generator.generate_columns(20000)
+    events = generator.to_events(columns)
+
+    drifted = sum(1 for evt in events if "level" in evt)
+    assert drifted == int(columns["drifted"].sum())
+    assert 0.22 <= drifted / 20000 <= 0.28
+    assert all("Level" not in evt for evt in events if "level" in evt)
+
+    anomalies = [evt for evt, flagged in zip(events, columns["anomaly"].tolist()) if flagged]
+    assert 0.08 <= len(anomalies) / 20000 <= 0.12
+    assert all(evt["latency_ms"] >= 800 and evt["status"] >= 500 for evt in anomalies)
+
+def test_write_jsonl_and_csv(tmp_path):
+    jsonl_path = str(tmp_path / "events.jsonl")
+    csv_path = str(tmp_path / "events.csv")
+
+    NovaLogGenerator(seed=5, drift_ratio=0.5).write_jsonl(jsonl_path, 2500, batch_size=1000)
+    NovaLogGenerator(seed=5, drift_ratio=0.5).write_csv(csv_path, 2500, batch_size=1000)
+
+    with open(jsonl_path) as f:
+        events = [json.loads(line) for line in f]
+    with open(csv_path, newline='') as f:
+        rows = list(csv.DictReader(f))
+
+    assert len(events) == len(rows) == 2500
+    assert list(rows[0].keys()) == CSV_FIELDS
+    assert all(row["Level"] in LEVELS for row in rows)
+    assert [int(row["LineId"]) for row in rows] == [evt["LineId"] for evt in events]
@@ -0,0 +1,66 @@
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+import cta.timing as timing
+from cta.timing import SpanTimer, profile_mode_for
+from cta.analyze import cta_analyze
+from trace.store import start_run, append_event, get_timings
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+def test_spans_accumulate_per_stage():
+    timer = SpanTimer("analysis")
+    for _ in range(3):
+        with timer.span("datadog"):
+            _busy(0.002)
+    with timer.span("llm"):
+        _busy(0.005)
+    timings = timer.finish()
+
+    assert timings["stages"]["datadog"] >= 0.006
+    assert timings["stages"]["llm"] >= 0.005
+    assert timings["total_s"] >= sum(timings["stages"].values())
+    assert timer.finish() == timings
+
+def test_profile_mode_selection(monkeypatch):
+    assert profile_mode_for("run_a") is None
+    assert profile_mode_for("run_a", "sample") == "sample"
+    with pytest.raises(ValueError):
+        profile_mode_for("run_a", "perf")
+    monkeypatch.setattr(timing, "PROFILE_RUNS", {"run_a"})
+    assert profile_mode_for("run_a") == "cprofile"
+    assert profile_mode_for("run_b") is None
+
+def test_analysis_reports_and_persists_stage_timings(tmp_path, monkeypatch):
+    monkeypatch.setattr(timing, "PROFILE_DIR", str(tmp_path))
+    run_id = start_run("timing")
+    append_event(run_id, {"type": "error", "message": "'Level'", "context": {"agent": "Auditor"}})
+
+    report = cta_analyze(run_id, "Schema mismatch", use_cache=False, profile="cprofile")
+    stages = report["timings"]["stages"]
+    assert {"load_events", "signature_cache"} <= set(stages)
+    assert os.path.exists(report["timings"]["profile"]["path"])
+    assert report["timings"]["profile"]["top"]
+
+    saved = {row["stage"]: row["duration_s"] for row in get_timings(run_id, "analysis")}
+    assert saved["load_events"] == stages["load_events"]
+    assert saved["total"] == report["timings"]["total_s"]
+
+def test_sampling_profiler_captures_stacks(tmp_path, monkeypatch):
+    monkeypatch.setattr(timing, "PROFILE_DIR", str(tmp_path))
+    timer = SpanTimer("analysis", "run_sampled", profile="sample")
+    _busy(0.05)
+    profile = timer.finish()["profile"]
+
+    assert profile["samples"] > 0
+    assert any("_busy" in entry["function"] for entry in profile["top"])
+    with open(profile["path"]) as f:
+        assert "test_timing.py:_busy" in f.read()
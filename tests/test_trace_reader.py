@@ -0,0 +1,63 @@
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from integrations.local_store import LocalEventStore
+from integrations.trace_reader import iter_run_events, load_run_events
+from trace.store import start_run, append_event, load_events
+
+def _recorded_run(n):
+    run_id = start_run("trace_reader")
+    for i in range(n):
+        append_event(run_id, {"type": "tool", "tool": "evaluate_event", "run_id": run_id, "output": {"i": i}})
+    return run_id
+
+class _FlakyClient:
+    """Wraps a store, failing the page that starts after fail_after_idx"""
+
+    def __init__(self, store, fail_after_idx):
+        self.store = store
+        self.fail_after_idx = fail_after_idx
+        self.calls = []
+
+    def iter_trace_page(self, run_id, after_idx, limit, table_name="trace_events"):
+        self.calls.append((after_idx, limit))
+        if after_idx == self.fail_after_idx:
+            raise ConnectionError("injected")
+        return self.store.iter_trace_page(run_id, after_idx, limit, table_name)
+
+def test_pages_through_long_runs_in_order(tmp_path):
+    store = LocalEventStore(str(tmp_path / "events.sqlite"))
+    run_id = _recorded_run(250)
+    # Written out of order, as concurrent writers would
+    for event in reversed(load_events(run_id)):
+        store.write_trace_event(event)
+
+    stats = {}
+    events = load_run_events(run_id, client=store, page_size=40, stats=stats)
+    assert [e["idx"] for e in events] == list(range(250))
+    assert events[7]["output"] == {"i": 7}
+    assert stats["clickhouse_events"] == 250
+    assert stats["sqlite_events"] == 0
+    # Seven ClickHouse pages, then SQLite is checked for a tail ClickHouse never got
+    assert stats["pages"] == 8
+
+def test_failed_pages_gaps_and_missing_runs_come_from_sqlite(tmp_path):
+    store = LocalEventStore(str(tmp_path / "events.sqlite"))
+    run_id = _recorded_run(100)
+    for event in load_events(run_id):
+        # Events 30-34 and the tail never reached ClickHouse
+        if not 30 <= event["idx"] < 35 and event["idx"] < 90:
+            store.write_trace_event(event)
+
+    client = _FlakyClient(store, fail_after_idx=44)
+    stats = {}
+    events = list(iter_run_events(run_id, client=client, page_size=20, stats=stats))
+    assert [e["idx"] for e in events] == list(range(100))
+    assert stats["fallback_pages"] == 1
+    assert stats["sqlite_events"] == 5 + 20 + 10
+    assert all(limit == 20 for _, limit in client.calls)
+
+    other = _recorded_run(3)
+    assert [e["idx"] for e in load_run_events(other, client=store)] == [0, 1, 2]
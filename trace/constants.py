@@ -1,6 +1,6 @@
 import os
 
-RUNS_DIR = os.path.join("data", "runs")
-SQLITE_PATH = os.path.join("data", "traces.sqlite")
+RUNS_DIR = os.getenv("TRACE_RUNS_DIR", os.path.join("data", "runs"))
+SQLITE_PATH = os.getenv("TRACE_SQLITE_PATH", os.path.join("data", "traces.sqlite"))
 EVENT_TYPES = {"step", "tool", "note", "error"}
-
+SCHEMA_INDEX_PATH = os.getenv("SCHEMA_INDEX_PATH", os.path.join("data", "schema_index.json"))
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional, Tuple
+from .constants import SCHEMA_INDEX_PATH
+from .shared_file import SharedJSONFile
+
+# A field is required when it appears in at least this share of known-good items
+REQUIRED_FRACTION = 0.99
+
+# Minimum score for pairing a removed field with an added one as a rename
+RENAME_MIN_SCORE = 0.5
+
+# How often (seconds) a process re-stats the index file to pick up schemas
+# learned by other processes
+SCHEMA_INDEX_REFRESH_INTERVAL_S = float(os.getenv("SCHEMA_INDEX_REFRESH_INTERVAL_S", "1.0"))
+
+def _type_name(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return "str"
+    if isinstance(value, list):
+        return "list"
+    if isinstance(value, dict):
+        return "dict"
+    return type(value).__name__
+
+def item_schema(item: dict) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, _type_name(value)) for key, value in item.items()))
+
+def fingerprint(schema: Tuple[Tuple[str, str], ...]) -> str:
+    """Compact, order-independent id of a (field, type) schema"""
+    return hashlib.sha1(json.dumps(schema, separators=(",", ":")).encode()).hexdigest()[:16]
+
+def _normalize(key: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", key.lower())
+
+def rename_score(old_key: str, old_types: Iterable[str], new_key: str, new_type: str) -> float:
+    """How likely new_key is old_key renamed: name similarity weighted with type agreement"""
+    if _normalize(old_key) == _normalize(new_key):
+        name_similarity = 1.0
+    else:
+        name_similarity = SequenceMatcher(None, old_key.lower(), new_key.lower()).ratio()
+    return round(0.7 * name_similarity + 0.3 * (1.0 if new_type in old_types else 0.0), 3)
+
+class SchemaIndex:
+    """Persistent index of known-good output schemas per tool.
+
+    For each tool it keeps the fingerprints of every (field, type) schema
+    seen in successful runs, plus per-field type counts and presence used
+    to decide which fields are required or nullable. Checking an item is a
+    set lookup on its fingerprint; only unknown fingerprints are diffed, and
+    each diff is cached. Output whose schemas are all known already is not
+    written again, and what other processes publish is picked up the same
+    way as the adapter registry's.
+    """
+
+    def __init__(self, path: str = SCHEMA_INDEX_PATH, refresh_interval_s: float = SCHEMA_INDEX_REFRESH_INTERVAL_S):
+        self.path = path
+        self.refresh_interval_s = refresh_interval_s
+        self.file = SharedJSONFile(path, refresh_interval_s, separators=(",", ":"))
+        self.lock = threading.Lock()
+        self.version = 0
+        self.tools: Dict[str, dict] = {}
+        self._diffs: Dict[Tuple[str, str], Optional[dict]] = {}
+        self._fingerprints: Dict[tuple, str] = {}
+        self.load()
+
+    @staticmethod
+    def _parse(data: Optional[dict]) -> Tuple[int, Dict[str, dict]]:
+        if data is None:
+            return 0, {}
+        return int(data.get("version", 0)), data.get("tools", {})
+
+    def load(self) -> Dict[str, dict]:
+        with self.lock:
+            self.version, self.tools = self._parse(self.file.load())
+            self._diffs = {}
+            return self.tools
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload if another process published a new version. Returns True if reloaded"""
+        if not self.file.stale(force):
+            return False
+        self.load()
+        return True
+
+    def _publish(self, update):
+        with self.file.locked(), self.lock:
+            # Merge into what is on disk so concurrent learners add up
+            disk_version, tools = self._parse(self.file.read())
+            update(tools)
+            version = max(disk_version, self.version) + 1
+            self.file.write({"version": version, "tools": tools})
+            self.version, self.tools = version, tools
+            self._diffs = {}
+
+    def learn(self, tool: str, items: Iterable[dict], force: bool = False) -> int:
+        """Record the schemas of known-good tool output. Returns items learned
+
+        Unless force is set, output whose schemas the tool already has is
+        skipped (returning 0) without taking the file lock or writing.
+        """
+        schemas = Counter(item_schema(item) for item in items if isinstance(item, dict))
+        if not schemas:
+            return 0
+        if not force:
+            self.refresh()
+            known = self.tools.get(tool, {}).get("fingerprints", {})
+            if all(self._fingerprint(schema) in known for schema in schemas):
+                return 0
+
+        def update(tools):
+            entry = tools.setdefault(tool, {"items": 0, "runs": 0, "fields": {}, "fingerprints": {}})
+            entry["runs"] += 1
+            for schema, count in schemas.items():
+                entry["items"] += count
+                fp = self._fingerprint(schema)
+                entry["fingerprints"][fp] = entry["fingerprints"].get(fp, 0) + count
+                for key, type_name in schema:
+                    field = entry["fields"].setdefault(key, {"present": 0, "types": {}})
+                    field["present"] += count
+                    field["types"][type_name] = field["types"].get(type_name, 0) + count
+
+        self._publish(update)
+        return sum(schemas.values())
+
+    def learn_run(self, events: Iterable[dict]) -> int:
+        """Learn every tool's output from the events of a successful run"""
+        by_tool: Dict[str, List[dict]] = {}
+        for evt in events:
+            if evt.get("type") != "tool":
+                continue
+            output = evt.get("output")
+            items = output if isinstance(output, list) else [output]
+            by_tool.setdefault(evt.get("tool"), []).extend(item for item in items if isinstance(item, dict))
+        return sum(self.learn(tool, items) for tool, items in by_tool.items() if items)
+
+    def knows(self, tool: str) -> bool:
+        self.refresh()
+        return tool in self.tools
+
+    def _fingerprint(self, schema: Tuple[Tuple[str, str], ...]) -> str:
+        fp = self._fingerprints.get(schema)
+        if fp is None:
+            fp = self._fingerprints[schema] = fingerprint(schema)
+        return fp
+
+    def _diff(self, entry: dict, schema: Tuple[Tuple[str, str], ...]) -> dict:
+        fields = entry["fields"]
+        item_types = dict(schema)
+        required = {key for key, field in fields.items() if field["present"] >= REQUIRED_FRACTION * entry["items"]}
+
+        added = sorted(key for key in item_types if key not in fields)
+        removed = sorted(key for key in required if key not in item_types)
+        type_changed = []
+        for key, type_name in schema:
+            known = fields.get(key)
+            if known and type_name not in known["types"] and not (type_name == "null" and "null" in known["types"]):
+                type_changed.append({"field": key, "expected": sorted(known["types"]), "got": type_name})
+
+        # Greedily pair removed and added fields by rename score
+        candidates = sorted(
+            ((rename_score(old, fields[old]["types"], new, item_types[new]), old, new)
+             for old in removed for new in added),
+            reverse=True
+        )
+        renamed = []
+        used = set()
+        for score, old, new in candidates:
+            if score < RENAME_MIN_SCORE or old in used or new in used:
+                continue
+            used.update((old, new))
+            renamed.append({"from": new, "to": old, "score": score})
+
+        return {
+            "added": [key for key in added if key not in used],
+            "removed": [key for key in removed if key not in used],
+            "renamed": renamed,
+            "type_changed": type_changed
+        }
+
+    def check(self, tool: str, item: dict) -> Optional[dict]:
+        """Diff one item against the tool's known-good schemas; None if it matches one"""
+        self.refresh()
+        entry = self.tools.get(tool)
+        if entry is None:
+            return None
+        schema = item_schema(item)
+        fp = self._fingerprint(schema)
+        if fp in entry["fingerprints"]:
+            return None
+
+        key = (tool, fp)
+        if key not in self._diffs:
+            diff = self._diff(entry, schema)
+            has_drift = diff["removed"] or diff["renamed"] or diff["type_changed"] or diff["added"]
+            change_key = json.dumps([diff["added"], diff["removed"], diff["renamed"], diff["type_changed"]])
+            self._diffs[key] = dict(diff, fingerprint=fp, tool=tool, change_key=change_key) if has_drift else None
+        return self._diffs[key]
+
+    def get_status(self) -> dict:
+        self.refresh()
+        return {
+            "version": self.version,
+            "tools": {
+                tool: {"items": entry["items"], "runs": entry["runs"], "schemas": len(entry["fingerprints"]),
+                       "fields": len(entry["fields"])}
+                for tool, entry in self.tools.items()
+            }
+        }
+
+_index: Optional[SchemaIndex] = None
+
+def get_schema_index() -> SchemaIndex:
+    global _index
+    if _index is None:
+        _index = SchemaIndex()
+    return _index
@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Mode of a newly published file; a replaced file keeps the mode it had
+FILE_MODE = 0o644
+
+class SharedJSONFile:
+    """A JSON document several processes publish to and reload from.
+
+    Writers hold an flock on a sibling .lock file while they re-read the
+    document and swap in the next one with an atomic rename, so readers
+    never see a partial file. Readers compare a cheap stat stamp, at most
+    once per refresh interval, and reload only when another process has
+    published. Versioning the document is left to the caller.
+    """
+
+    def __init__(self, path: str, refresh_interval_s: float, **dump_kwargs):
+        self.path = path
+        self.refresh_interval_s = refresh_interval_s
+        self.dump_kwargs = dump_kwargs
+        self.stamp = None
+        self._next_check = 0.0
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def read(self) -> Optional[dict]:
+        """The document on disk, or None if nothing was published yet"""
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> Optional[dict]:
+        """read(), remembering the stamp of what was read"""
+        stamp = self._file_stamp()
+        data = self.read()
+        self.stamp = stamp
+        self._next_check = time.monotonic() + self.refresh_interval_s
+        return data
+
+    def stale(self, force: bool = False) -> bool:
+        """True if another process published since the last load or write.
+
+        Only stats the file once per refresh interval unless force is set.
+        """
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return False
+        self._next_check = now + self.refresh_interval_s
+        return self._file_stamp() != self.stamp
+
+    @contextmanager
+    def locked(self):
+        """Hold the cross-process write lock; read and write under it"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".lock", 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def write(self, data: dict):
+        """Atomically replace the document; call while holding locked()"""
+        directory = os.path.dirname(self.path) or "."
+        base = os.path.splitext(os.path.basename(self.path))[0]
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{base}.", suffix=".tmp")
+        try:
+            # mkstemp creates the file 0600; readers may run as other users
+            try:
+                mode = os.stat(self.path).st_mode & 0o777
+            except FileNotFoundError:
+                mode = FILE_MODE
+            os.fchmod(fd, mode)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, **self.dump_kwargs)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.stamp = self._file_stamp()
@@ -2,10 +2,16 @@ import sqlite3
 import json
 import os
 import uuid
+import hashlib
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Optional
 from .constants import RUNS_DIR, SQLITE_PATH
 
+# Called after each append_event with (run_id, event) and after each
+# save_metric with (run_id, key, value)
+_event_listeners: list = []
+_metric_listeners: list = []
+
 def _get_db():
     os.makedirs(os.path.dirname(SQLITE_PATH), exist_ok=True)
     conn = sqlite3.connect(SQLITE_PATH)
@@ -34,9 +40,73 @@ def init_db():
             FOREIGN KEY (run_id) REFERENCES runs(id)
         )
     """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cta_reports (
+            run_id TEXT PRIMARY KEY,
+            cache_key TEXT NOT NULL,
+            report_json TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (run_id) REFERENCES runs(id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cta_jobs (
+            id TEXT PRIMARY KEY,
+            run_id TEXT NOT NULL,
+            failure_text TEXT,
+            priority INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            started_at TEXT,
+            finished_at TEXT,
+            error TEXT,
+            report_json TEXT,
+            FOREIGN KEY (run_id) REFERENCES runs(id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cta_jobs_status ON cta_jobs (status)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cta_timings (
+            run_id TEXT NOT NULL,
+            phase TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            duration_s REAL NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (run_id) REFERENCES runs(id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cta_timings_run ON cta_timings (run_id)")
+    # Rolling hash of the run's event stream, advanced by append_event
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(runs)")}
+    if "events_hash" not in columns:
+        conn.execute("ALTER TABLE runs ADD COLUMN events_hash TEXT")
     conn.commit()
     conn.close()
 
+def add_event_listener(listener: Callable[[str, dict], None]):
+    if listener not in _event_listeners:
+        _event_listeners.append(listener)
+
+def add_metric_listener(listener: Callable[[str, str, object], None]):
+    if listener not in _metric_listeners:
+        _metric_listeners.append(listener)
+
+def remove_listener(listener: Callable):
+    for listeners in (_event_listeners, _metric_listeners):
+        if listener in listeners:
+            listeners.remove(listener)
+
+def _notify(listeners: list, *args):
+    # A failing listener must never break tracing
+    for listener in list(listeners):
+        try:
+            listener(*args)
+        except Exception as e:
+            print(f"[WARN] Trace listener {getattr(listener, '__name__', listener)} failed: {e}")
+
+def _chain_hash(previous: Optional[str], json_blob: str) -> str:
+    return hashlib.sha1(((previous or "") + json_blob).encode()).hexdigest()
+
 def start_run(mode: str) -> str:
     run_id = f"run_{uuid.uuid4().hex[:12]}"
     started_at = datetime.utcnow().isoformat()
@@ -72,6 +142,10 @@ def append_event(run_id: str, event: dict) -> int:
         "INSERT INTO events (run_id, idx, json_blob) VALUES (?, ?, ?)",
         (run_id, idx, json_blob)
     )
+    conn.execute(
+        "UPDATE runs SET events_hash = ? WHERE id = ?",
+        (_chain_hash(_get_events_hash(conn, run_id, idx), json_blob), run_id)
+    )
     conn.commit()
     conn.close()
     
@@ -79,13 +153,22 @@ def append_event(run_id: str, event: dict) -> int:
     with open(jsonl_path, 'a') as f:
         f.write(json_blob + '\n')
     
+    _notify(_event_listeners, run_id, event_copy)
     return idx
 
-def list_runs() -> list[dict]:
+def list_runs(status: Optional[str] = None, limit: Optional[int] = None) -> list[dict]:
+    query = "SELECT * FROM runs"
+    params: list = []
+    if status is not None:
+        query += " WHERE status = ?"
+        params.append(status)
+    query += " ORDER BY started_at DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    
     conn = _get_db()
-    cursor = conn.execute(
-        "SELECT * FROM runs ORDER BY started_at DESC"
-    )
+    cursor = conn.execute(query, params)
     rows = cursor.fetchall()
     conn.close()
     
@@ -102,6 +185,238 @@ def load_events(run_id: str) -> list[dict]:
     
     return [json.loads(row[0]) for row in rows]
 
+def load_events_page(run_id: str, after_idx: int = -1, limit: Optional[int] = None,
+                     before_idx: Optional[int] = None) -> list[dict]:
+    """Events with after_idx < idx (< before_idx), in idx order, at most limit of them"""
+    query = "SELECT json_blob FROM events WHERE run_id = ? AND idx > ?"
+    params: list = [run_id, after_idx]
+    if before_idx is not None:
+        query += " AND idx < ?"
+        params.append(before_idx)
+    query += " ORDER BY idx"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    
+    conn = _get_db()
+    rows = conn.execute(query, params).fetchall()
+    conn.close()
+    
+    return [json.loads(row[0]) for row in rows]
+
+def iter_events(run_id: str, page_size: int = 500):
+    """Yield a run's events in idx order, reading one page at a time"""
+    after_idx = -1
+    while True:
+        page = load_events_page(run_id, after_idx, page_size)
+        yield from page
+        if len(page) < page_size:
+            return
+        after_idx = page[-1]["idx"]
+
+def load_events_many(run_ids: list) -> dict:
+    """Events of several runs in one query, as {run_id: [event, ...]} in idx order"""
+    events = {run_id: [] for run_id in run_ids}
+    if not run_ids:
+        return events
+    conn = _get_db()
+    # Stay under SQLite's bound-parameter limit
+    for start in range(0, len(run_ids), 500):
+        chunk = run_ids[start:start + 500]
+        cursor = conn.execute(
+            f"SELECT run_id, json_blob FROM events WHERE run_id IN ({','.join('?' for _ in chunk)}) "
+            "ORDER BY run_id, idx",
+            chunk
+        )
+        for run_id, json_blob in cursor:
+            events[run_id].append(json.loads(json_blob))
+    conn.close()
+    
+    return events
+
+def iter_tool_events(tool_name: str, run_ids: Optional[list] = None):
+    """Yield recorded tool events for one tool across runs, in (run_id, idx) order"""
+    conn = _get_db()
+    # Prefilter on the serialized blob so unrelated events are never decoded
+    query = "SELECT json_blob FROM events WHERE json_blob LIKE ?"
+    params = [f'%"tool": {json.dumps(tool_name)}%']
+    if run_ids:
+        query += f" AND run_id IN ({','.join('?' for _ in run_ids)})"
+        params.extend(run_ids)
+    query += " ORDER BY run_id, idx"
+    
+    try:
+        for row in conn.execute(query, params):
+            event = json.loads(row[0])
+            if event.get("type") == "tool" and event.get("tool") == tool_name:
+                yield event
+    finally:
+        conn.close()
+
+def _get_events_hash(conn, run_id: str, before_idx: Optional[int] = None) -> Optional[str]:
+    row = conn.execute("SELECT events_hash FROM runs WHERE id = ?", (run_id,)).fetchone()
+    if row is None or row[0] is not None:
+        return row[0] if row else None
+    
+    # Runs recorded before the hash existed: rebuild it from their events once
+    query = "SELECT json_blob FROM events WHERE run_id = ?"
+    params = [run_id]
+    if before_idx is not None:
+        query += " AND idx < ?"
+        params.append(before_idx)
+    events_hash = None
+    for (json_blob,) in conn.execute(query + " ORDER BY idx", params):
+        events_hash = _chain_hash(events_hash, json_blob)
+    return events_hash
+
+def get_events_hash(run_id: str) -> Optional[str]:
+    """Hash of every event recorded for the run; changes whenever an event is appended"""
+    conn = _get_db()
+    try:
+        return _get_events_hash(conn, run_id)
+    finally:
+        conn.close()
+
+def get_cached_report(run_id: str, cache_key: str) -> Optional[dict]:
+    conn = _get_db()
+    row = conn.execute(
+        "SELECT report_json FROM cta_reports WHERE run_id = ? AND cache_key = ?",
+        (run_id, cache_key)
+    ).fetchone()
+    conn.close()
+    
+    return json.loads(row[0]) if row else None
+
+def save_cached_report(run_id: str, cache_key: str, report: dict):
+    conn = _get_db()
+    conn.execute(
+        "INSERT OR REPLACE INTO cta_reports (run_id, cache_key, report_json, created_at) VALUES (?, ?, ?, ?)",
+        (run_id, cache_key, json.dumps(report), datetime.utcnow().isoformat())
+    )
+    conn.commit()
+    conn.close()
+
+def _job_from_row(row) -> dict:
+    job = dict(row)
+    report_json = job.pop("report_json")
+    job["report"] = json.loads(report_json) if report_json else None
+    return job
+
+def create_job(run_id: str, failure_text: str, priority: int, status: str = "queued",
+               report: Optional[dict] = None) -> dict:
+    job_id = f"job_{uuid.uuid4().hex[:12]}"
+    now = datetime.utcnow().isoformat()
+    finished_at = now if status in ("done", "failed") else None
+    
+    conn = _get_db()
+    conn.execute(
+        "INSERT INTO cta_jobs (id, run_id, failure_text, priority, status, created_at, finished_at, report_json) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (job_id, run_id, failure_text, priority, status, now, finished_at, json.dumps(report) if report else None)
+    )
+    conn.commit()
+    conn.close()
+    
+    return get_job(job_id)
+
+def update_job(job_id: str, **fields):
+    allowed_keys = {"priority", "status", "started_at", "finished_at", "error", "report"}
+    if not set(fields) <= allowed_keys:
+        raise ValueError(f"Invalid job fields: {sorted(set(fields) - allowed_keys)}")
+    if "report" in fields:
+        fields["report_json"] = json.dumps(fields.pop("report"))
+    
+    conn = _get_db()
+    conn.execute(
+        f"UPDATE cta_jobs SET {', '.join(f'{key} = ?' for key in fields)} WHERE id = ?",
+        (*fields.values(), job_id)
+    )
+    conn.commit()
+    conn.close()
+
+def get_job(job_id: str) -> Optional[dict]:
+    conn = _get_db()
+    row = conn.execute("SELECT * FROM cta_jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    
+    return _job_from_row(row) if row else None
+
+def claim_job(job_id: str) -> bool:
+    """Move a queued job to running; False if another worker got there first"""
+    conn = _get_db()
+    cursor = conn.execute(
+        "UPDATE cta_jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+        (datetime.utcnow().isoformat(), job_id)
+    )
+    conn.commit()
+    conn.close()
+    
+    return cursor.rowcount == 1
+
+def requeue_job(job_id: str, started_before: str) -> bool:
+    """Put a job that has been running since before started_before back in the queue; False if it moved on"""
+    conn = _get_db()
+    cursor = conn.execute(
+        "UPDATE cta_jobs SET status = 'queued', started_at = NULL "
+        "WHERE id = ? AND status = 'running' AND (started_at IS NULL OR started_at <= ?)",
+        (job_id, started_before)
+    )
+    conn.commit()
+    conn.close()
+    
+    return cursor.rowcount == 1
+
+def get_active_job(run_id: str) -> Optional[dict]:
+    conn = _get_db()
+    row = conn.execute(
+        "SELECT * FROM cta_jobs WHERE run_id = ? AND status IN ('queued', 'running') ORDER BY created_at DESC LIMIT 1",
+        (run_id,)
+    ).fetchone()
+    conn.close()
+    
+    return _job_from_row(row) if row else None
+
+def list_jobs(statuses: Optional[list] = None) -> list[dict]:
+    """Jobs oldest first, optionally only those in the given statuses"""
+    query = "SELECT * FROM cta_jobs"
+    params: list = []
+    if statuses:
+        query += f" WHERE status IN ({','.join('?' for _ in statuses)})"
+        params.extend(statuses)
+    
+    conn = _get_db()
+    rows = conn.execute(query + " ORDER BY created_at", params).fetchall()
+    conn.close()
+    
+    return [_job_from_row(row) for row in rows]
+
+def save_timings(run_id: str, phase: str, timings: dict):
+    """Record a timed operation's stage durations (and its total, as stage 'total')"""
+    now = datetime.utcnow().isoformat()
+    rows = [(run_id, phase, stage, duration, now) for stage, duration in timings["stages"].items()]
+    rows.append((run_id, phase, "total", timings["total_s"], now))
+    
+    conn = _get_db()
+    conn.executemany(
+        "INSERT INTO cta_timings (run_id, phase, stage, duration_s, created_at) VALUES (?, ?, ?, ?, ?)",
+        rows
+    )
+    conn.commit()
+    conn.close()
+
+def get_timings(run_id: str, phase: Optional[str] = None) -> list[dict]:
+    query = "SELECT * FROM cta_timings WHERE run_id = ?"
+    params: list = [run_id]
+    if phase is not None:
+        query += " AND phase = ?"
+        params.append(phase)
+    
+    conn = _get_db()
+    rows = conn.execute(query + " ORDER BY created_at, rowid", params).fetchall()
+    conn.close()
+    
+    return [dict(row) for row in rows]
+
 def save_metric(run_id: str, key: str, value):
     allowed_keys = {"mttr_human_s", "mttr_cta_s", "status", "fail_reason"}
     if key not in allowed_keys:
@@ -114,6 +429,8 @@ def save_metric(run_id: str, key: str, value):
     )
     conn.commit()
     conn.close()
+    
+    _notify(_metric_listeners, run_id, key, value)
 
 def get_run(run_id: str) -> Optional[dict]:
     conn = _get_db()